@@ -0,0 +1,169 @@
+"""
+Shared helpers for the benchmark scripts: percentile stats, JSON result files
+and booting the FastAPI app against a throwaway database.
+"""
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Учётные данные, с которыми поднимается тестовый сервер
+BENCH_ADMIN_EMAIL = "bench-admin@orient.uz"
+BENCH_ADMIN_PASSWORD = "bench-admin-password"
+BENCH_PAYME_MERCHANT_ID = "bench-merchant"
+BENCH_PAYME_KEY = "bench-payme-key"
+BENCH_SECRET_KEY = "bench-secret-key-not-for-production-use"
+
+STUB_INDEX_HTML = """<!doctype html>
+<html lang="ru">
+  <head>
+    <meta charset="UTF-8" />
+    <title>Orient Watch</title>
+    <meta name="description" content="Orient Watch" />
+    <script type="module" src="/assets/index.js"></script>
+  </head>
+  <body><div id="root"></div></body>
+</html>
+"""
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize_latencies(latencies_ms):
+    """p50/p95/p99/mean/max for a list of latencies in milliseconds"""
+    values = sorted(latencies_ms)
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def write_results(path, results):
+    """Store a run as JSON (meta block + payload) so runs can be diffed later"""
+    results.setdefault("meta", {})
+    results["meta"].setdefault("timestamp", datetime.utcnow().isoformat())
+    results["meta"].setdefault("git", git_revision())
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"📄 Results saved to {path}")
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_env(db_url, workdir, extra=None):
+    """Environment for a benchmark server: isolated DB, stub SPA index and known credentials"""
+    dist_dir = os.path.join(workdir, "dist")
+    os.makedirs(dist_dir, exist_ok=True)
+    with open(os.path.join(dist_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(STUB_INDEX_HTML)
+
+    env = dict(os.environ)
+    env.update({
+        "ORIENT_DATABASE_URL": db_url,
+        "DIST_DIR": dist_dir,
+        "SECRET_KEY": BENCH_SECRET_KEY,
+        "PAYME_MERCHANT_ID": BENCH_PAYME_MERCHANT_ID,
+        "PAYME_KEY": BENCH_PAYME_KEY,
+        "PAYME_TEST_KEY": BENCH_PAYME_KEY,
+    })
+    if extra:
+        env.update(extra)
+    return env
+
+
+def use_database(db_url):
+    """Point `database` at db_url; must run before anything imports database.py"""
+    if "database" in sys.modules:
+        raise RuntimeError("database module is already imported, set ORIENT_DATABASE_URL earlier")
+    os.environ["ORIENT_DATABASE_URL"] = db_url
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+
+@contextmanager
+def bench_workdir(keep=False):
+    """Temporary directory holding the benchmark database and stub frontend"""
+    workdir = tempfile.mkdtemp(prefix="orient-bench-")
+    try:
+        yield workdir
+    finally:
+        if not keep:
+            import shutil
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"📁 Benchmark files kept in {workdir}")
+
+
+@contextmanager
+def running_server(env, port=None, workers=1, startup_timeout=30):
+    """Run `uvicorn main:app` in a subprocess and yield its base URL once /health answers"""
+    import httpx
+
+    port = port or free_port()
+    cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers),
+        "--log-level", "warning",
+        "--no-access-log",
+    ]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + startup_timeout
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Server exited with code {proc.returncode}")
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError("Server did not start in time")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
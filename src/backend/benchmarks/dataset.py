@@ -0,0 +1,242 @@
+"""
+Synthetic dataset for benchmarks.
+Fills the database pointed to by ORIENT_DATABASE_URL with collections, products,
+orders, bookings and Payme transactions of a configurable size.
+
+Usage:
+    ORIENT_DATABASE_URL=sqlite:////tmp/orient-bench.db python -m benchmarks.dataset --products 5000
+"""
+import argparse
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+
+COLLECTIONS = ["SPORTS", "CLASSIC", "CONTEMPORARY", "REVIVAL", "BAMBINO", "STAR", "MAKO", "KAMASU"]
+BRANDS = ["Orient", "Orient Star"]
+GENDERS = ["Мужские", "Женские", "Унисекс"]
+MOVEMENTS = ["Механические", "Кварцевые", "Автоматические"]
+CASE_MATERIALS = ["Сталь", "Титан", "Позолота", "Керамика"]
+DIAL_COLORS = ["Черный", "Белый", "Синий", "Зеленый", "Серебристый"]
+WATER_RESISTANCES = ["30m", "50m", "100m", "200m"]
+STRAP_MATERIALS = ["Кожа", "Сталь", "Каучук", "Нейлон"]
+FEATURES = ["Сапфировое стекло", "Хронограф", "Подсветка", "Дата", "Open Heart", "GMT", "Power Reserve"]
+ORDER_STATUSES = ["pending"] * 3 + ["processing"] * 2 + ["completed"] * 4 + ["cancelled"]
+BOOKING_STATUSES = ["pending", "confirmed", "completed", "cancelled"]
+
+BATCH_SIZE = 5000
+
+
+def _batched_insert(conn, model, rows):
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def product_rows(count, rnd, now):
+    rows = []
+    for i in range(count):
+        images = [f"/uploads/bench-{i}-{n}.jpg" for n in range(rnd.randint(1, 4))]
+        rows.append({
+            "id": f"bench-watch-{i}",
+            "name": f"Orient Bench {COLLECTIONS[i % len(COLLECTIONS)].title()} {i}",
+            "collection": COLLECTIONS[i % len(COLLECTIONS)],
+            "price": float(rnd.randrange(1_000_000, 20_000_000, 10_000)),
+            "image": images[0],
+            "images": json.dumps(images),
+            "description": "<p>Японские часы Orient с автоматическим механизмом и сапфировым стеклом.</p>" * 3,
+            "features": json.dumps(rnd.sample(FEATURES, rnd.randint(1, 4)), ensure_ascii=False),
+            "specs": json.dumps({"Стекло": "Сапфировое", "Калибр": f"F6{rnd.randint(100, 999)}", "Запас хода": "40 ч"}, ensure_ascii=False),
+            "in_stock": rnd.random() > 0.1,
+            "stock_quantity": rnd.randint(0, 50),
+            "sku": f"RA-BENCH{i:06d}",
+            "is_featured": i < 6,
+            "brand": rnd.choice(BRANDS),
+            "gender": rnd.choice(GENDERS),
+            "case_diameter": float(rnd.choice([36, 38, 39, 40, 41, 42, 43.5, 44])),
+            "strap_material": rnd.choice(STRAP_MATERIALS),
+            "movement": rnd.choice(MOVEMENTS),
+            "case_material": rnd.choice(CASE_MATERIALS),
+            "dial_color": rnd.choice(DIAL_COLORS),
+            "water_resistance": rnd.choice(WATER_RESISTANCES),
+            "seo_title": None,
+            "seo_description": None,
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now - timedelta(minutes=i),
+        })
+    return rows
+
+
+def order_rows(count, products, rnd, now):
+    rows = []
+    for i in range(count):
+        picked = rnd.sample(products, rnd.randint(1, 3))
+        items = [{"productId": p["id"], "quantity": rnd.randint(1, 2), "price": p["price"]} for p in picked]
+        subtotal = sum(item["price"] * item["quantity"] for item in items)
+        created = now - timedelta(minutes=rnd.randint(0, 365 * 24 * 60))
+        rows.append({
+            "id": i + 1,
+            "order_number": f"ORD-BENCH-{i:07d}",
+            "customer_data": json.dumps({"fullName": f"Клиент {i}", "email": f"client{i}@example.com", "phone": "+998901234567"}, ensure_ascii=False),
+            "items": json.dumps(items),
+            "subtotal": subtotal,
+            "shipping": 0,
+            "total": subtotal,
+            "status": rnd.choice(ORDER_STATUSES),
+            "payment_method": "payme" if rnd.random() < 0.7 else "cash",
+            "delivery_method": rnd.choice(["standard", "express", "pickup"]),
+            "delivery_address": None,
+            "notes": None,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return rows
+
+
+def order_item_rows(orders, products):
+    by_id = {p["id"]: p for p in products}
+    return [{
+        "order_id": order["id"],
+        "product_id": item["productId"],
+        "sku": by_id[item["productId"]]["sku"],
+        "name": by_id[item["productId"]]["name"],
+        "collection": by_id[item["productId"]]["collection"],
+        "quantity": item["quantity"],
+        "unit_price": item["price"],
+        "created_at": order["created_at"],
+    } for order in orders for item in json.loads(order["items"])]
+
+
+def transaction_rows(count, orders, rnd, now_ms, offset=0):
+    """Payme transactions over the last year; offset continues the numbering when filling in chunks"""
+    rows = []
+    active = set()  # у заказа не больше одной транзакции в состоянии 1 (ux_transactions_order_active)
+    year_ms = 365 * 24 * 3600 * 1000
+    for i in range(offset, offset + count):
+        order = orders[i % len(orders)] if orders else None
+        order_id = order["order_number"] if order else f"ORD-BENCH-{i:07d}"
+        created = now_ms - rnd.randint(0, year_ms)
+        state = rnd.choice([2, 2, 2, 1, -1, -2])
+        if state == 1:
+            state = -1 if order_id in active else 1
+            active.add(order_id)
+        rows.append({
+            "payme_trans_id": uuid.UUID(int=rnd.getrandbits(128)).hex[:24],
+            "time": created,
+            "amount": int((order["total"] if order else 1_000_000) * 100),
+            "account": json.dumps({"order_id": order_id}),
+            "create_time": created,
+            "perform_time": created + 60_000 if state in (2, -2) else 0,
+            "cancel_time": created + 120_000 if state < 0 else 0,
+            "state": state,
+            "reason": 3 if state < 0 else None,
+            "order_id": order_id,
+        })
+    return rows
+
+
+def booking_rows(count, rnd, now):
+    rows = []
+    for i in range(count):
+        created = now - timedelta(minutes=rnd.randint(0, 180 * 24 * 60))
+        rows.append({
+            "booking_number": f"BK-BENCH-{i:07d}",
+            "name": f"Гость {i}",
+            "phone": "+998901234567",
+            "email": f"guest{i}@example.com",
+            "date": (created + timedelta(days=3)).strftime("%Y-%m-%d"),
+            "time": "12:00",
+            "message": None,
+            "status": rnd.choice(BOOKING_STATUSES),
+            "boutique": "Orient Ташкент",
+            "created_at": created,
+            "updated_at": created,
+        })
+    return rows
+
+
+def generate(products=2000, orders=5000, bookings=1000, transactions=None, seed=42):
+    """Create all tables and fill them; returns a summary used by the benchmark drivers"""
+    from database import (
+        engine, init_db, User, Product, Collection, Order, OrderItem, Booking, Transaction,
+        Settings, ContentHero, ContentSiteLogo, ContentHeritage, ContentPromoBanner,
+    )
+    from auth import get_password_hash
+    from benchmarks.common import BENCH_ADMIN_EMAIL, BENCH_ADMIN_PASSWORD
+
+    init_db()
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    now_ms = int(now.timestamp() * 1000)
+    if transactions is None:
+        transactions = orders // 2
+
+    collection_rows = [{
+        "id": name.lower(),
+        "name": name,
+        "description": f"Коллекция {name}",
+        "image": f"/uploads/collection-{name.lower()}.jpg",
+        "number": f"{n + 1:02d}",
+        "active": True,
+        "brand": "Orient",
+        "created_at": now,
+    } for n, name in enumerate(COLLECTIONS)]
+    products_data = product_rows(products, rnd, now)
+    orders_data = order_rows(orders, products_data, rnd, now) if products_data else []
+    payme_orders = [o for o in orders_data if o["payment_method"] == "payme"]
+
+    with engine.begin() as conn:
+        _batched_insert(conn, User, [{
+            "email": BENCH_ADMIN_EMAIL,
+            "password_hash": get_password_hash(BENCH_ADMIN_PASSWORD),
+            "name": "Bench Admin",
+            "role": "admin",
+            "created_at": now,
+        }])
+        _batched_insert(conn, Settings, [{"id": 1}])
+        _batched_insert(conn, ContentHero, [{
+            "id": 1, "title": "Orient", "subtitle": "Bench", "image": "/uploads/hero.jpg",
+            "cta_text": "Каталог", "cta_link": "/catalog",
+        }])
+        _batched_insert(conn, ContentSiteLogo, [{"id": 1, "logo_url": "/uploads/logo.png"}])
+        _batched_insert(conn, ContentHeritage, [{
+            "id": 1, "title": "75 лет", "subtitle": "С 1950", "description": "История",
+            "cta_text": "Узнать", "cta_link": "/history", "years_text": "75",
+        }])
+        _batched_insert(conn, ContentPromoBanner, [{"id": 1, "text": "Скидка", "code": "BENCH", "active": True}])
+        _batched_insert(conn, Collection, collection_rows)
+        _batched_insert(conn, Product, products_data)
+        _batched_insert(conn, Order, orders_data)
+        _batched_insert(conn, OrderItem, order_item_rows(orders_data, products_data))
+        _batched_insert(conn, Booking, booking_rows(bookings, rnd, now))
+        _batched_insert(conn, Transaction, transaction_rows(transactions, payme_orders, rnd, now_ms))
+
+    return {
+        "products": products,
+        "orders": orders,
+        "bookings": bookings,
+        "transactions": transactions,
+        "product_ids": [p["id"] for p in products_data],
+        "skus": [p["sku"] for p in products_data],
+        "collection_ids": [c["id"] for c in collection_rows],
+        "collection_names": COLLECTIONS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill ORIENT_DATABASE_URL with synthetic data")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--bookings", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    summary = generate(args.products, args.orders, args.bookings, args.transactions, args.seed)
+    print(f"✅ Generated {summary['products']} products, {summary['orders']} orders, "
+          f"{summary['bookings']} bookings, {summary['transactions']} transactions")
+
+
+if __name__ == "__main__":
+    main()
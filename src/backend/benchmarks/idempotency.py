@@ -0,0 +1,135 @@
+"""
+Duplicate-submission test for the Idempotency-Key header (idempotency.py).
+
+Every checkout is sent --duplicates times at once with the same key (a client retrying on a
+flaky network), then once more after all of them finished. Checks that each key created
+exactly one order, that every copy got the same order number and that replays don't write.
+
+Usage (from src/backend):
+    python -m benchmarks.idempotency --workers 2 --keys 200 --duplicates 4 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from collections import defaultdict
+
+from benchmarks.common import bench_env, bench_workdir, running_server, summarize_latencies, use_database, write_results
+
+PRODUCT_ID = "bench-watch-1"
+
+
+def order_payload(n):
+    return {
+        "customer": {"fullName": f"Клиент {n}", "phone": "+998901234567", "email": "bench@orient.uz"},
+        "items": [{"productId": PRODUCT_ID, "quantity": 1}],
+        "paymentMethod": "cash", "deliveryMethod": "pickup",
+    }
+
+
+def run(args, workdir):
+    import httpx
+
+    db_url = f"sqlite:///{os.path.join(workdir, 'idempotency.db')}"
+    use_database(db_url)
+    from benchmarks.dataset import generate
+    from database import SessionLocal, Product
+    generate(products=10, orders=0, bookings=0)
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.id == PRODUCT_ID).update({"stock_quantity": 0, "in_stock": True})
+        db.commit()
+    finally:
+        db.close()
+
+    keys = [uuid.uuid4().hex for _ in range(args.keys)]
+    numbers = defaultdict(set)
+    latencies = {"first": [], "replayed": []}
+    errors = []
+
+    async def send(client, semaphore, n, key):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/orders", json=order_payload(n), headers={"Idempotency-Key": key})
+                # Первый запрос с этим ключом еще выполняется - повтор, как сделал бы клиент
+                while response.status_code == 503 and "retry-after" in response.headers:
+                    await asyncio.sleep(float(response.headers["retry-after"]))
+                    response = await client.post("/api/orders", json=order_payload(n),
+                                                 headers={"Idempotency-Key": key})
+            except httpx.HTTPError as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                errors.append(f"HTTP {response.status_code}: {response.text[:120]}")
+                return
+            numbers[key].add(response.json()["orderNumber"])
+            replayed = response.headers.get("idempotent-replayed") == "true"
+            latencies["replayed" if replayed else "first"].append(elapsed)
+
+    async def drive(base_url):
+        semaphore = asyncio.Semaphore(args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60,
+                                     limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            # Дубликаты одновременно, затем еще один повтор каждого ключа
+            await asyncio.gather(*(send(client, semaphore, n, key)
+                                   for n, key in enumerate(keys) for _ in range(args.duplicates)))
+            await asyncio.gather(*(send(client, semaphore, n, key) for n, key in enumerate(keys)))
+
+    with running_server(bench_env(db_url, workdir), workers=args.workers) as base_url:
+        started = time.perf_counter()
+        asyncio.run(drive(base_url))
+        elapsed = time.perf_counter() - started
+
+    from database import Order, IdempotencyKey
+    db = SessionLocal()
+    try:
+        stored = db.query(Order).count()
+        stored_keys = db.query(IdempotencyKey).filter(IdempotencyKey.status == "done").count()
+    finally:
+        db.close()
+    return {
+        "requests": args.keys * (args.duplicates + 1), "seconds": round(elapsed, 3),
+        "orders": stored, "keys_done": stored_keys,
+        "keys_with_several_numbers": sum(1 for found in numbers.values() if len(found) > 1),
+        "keys_answered": len(numbers),
+        "first_ms": summarize_latencies(latencies["first"]),
+        "replayed_ms": summarize_latencies(latencies["replayed"]),
+        "replayed": len(latencies["replayed"]),
+        "errors": len(errors),
+    }, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent duplicate POST /api/orders with Idempotency-Key")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=4, help="Copies of each request sent at once")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--output")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    args = parser.parse_args()
+
+    with bench_workdir(keep=args.keep) as workdir:
+        results, errors = run(args, workdir)
+
+    print(f"🔁 {results['requests']} requests for {args.keys} keys in {results['seconds']:.2f}s: "
+          f"{results['orders']} orders, {results['replayed']} replayed, {results['errors']} errors")
+    print(f"   first p50 {results['first_ms']['p50']} ms, replayed p50 {results['replayed_ms']['p50']} ms "
+          f"(p95 {results['replayed_ms']['p95']} ms)")
+    for error in sorted(set(errors))[:5]:
+        print(f"   ❌ {error}")
+    if args.output:
+        write_results(args.output, {"meta": {key: value for key, value in vars(args).items()
+                                             if key not in ("output", "keep")}, **results})
+    ok = (results["orders"] == args.keys and results["keys_done"] == args.keys
+          and not results["keys_with_several_numbers"] and results["keys_answered"] == args.keys
+          and not errors)
+    print("✅ one order per key" if ok else "❌ duplicate or missing orders")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
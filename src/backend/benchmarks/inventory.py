@@ -0,0 +1,219 @@
+"""
+Concurrency test for stock reservation (inventory.py): many simultaneous checkouts of a
+product with limited stock must sell exactly the stock, never more.
+
+Checks after the burst:
+    - units in successful orders == initial stock - remaining stock, remaining >= 0
+    - active reservations (held + committed) add up to the units sold
+    - every rejected checkout got 409, in_stock is off once the stock is gone
+    - releasing the expired Payme holds returns exactly their units
+
+Usage (from src/backend):
+    # processes x threads checking out through reserve_stock directly
+    python -m benchmarks.inventory direct --processes 4 --threads 16 --checkouts 2000 --stock 500
+    # POST /api/orders against uvicorn with several workers
+    python -m benchmarks.inventory http --workers 4 --concurrency 200 --checkouts 600 --stock 150
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.common import bench_env, bench_workdir, running_server, summarize_latencies, use_database, write_results
+
+PRODUCT_ID = "bench-watch-1"
+CUSTOMER = {"fullName": "Нагрузочный тест", "phone": "+998901234567", "email": "bench@orient.uz"}
+
+
+def checkout_plan(count, max_quantity, seed=7):
+    """[(quantity, payment method)] - half of the carts are Payme orders that only hold the stock"""
+    rnd = random.Random(seed)
+    return [(rnd.randint(1, max_quantity), rnd.choice(("payme", "cash"))) for _ in range(count)]
+
+
+def prepare(db_url, stock):
+    use_database(db_url)
+    from benchmarks.dataset import generate
+    from database import SessionLocal, Product
+
+    generate(products=10, orders=0, bookings=0)
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.id == PRODUCT_ID).update({"stock_quantity": stock, "in_stock": True})
+        db.commit()
+    finally:
+        db.close()
+
+
+def _direct_worker(db_url, threads, plan):
+    """One process: checkouts of `plan` from `threads` threads; returns [(quantity, ok, error, ms)]"""
+    use_database(db_url)
+    from database import SessionLocal, Order
+    from inventory import OutOfStock, reserve_stock
+    from numbering import next_number
+
+    def checkout(entry):
+        quantity, payment_method = entry
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            order = Order(order_number=next_number("ORD"), customer_data=json.dumps(CUSTOMER),
+                          items=json.dumps([{"productId": PRODUCT_ID, "quantity": quantity}]),
+                          subtotal=1500000 * quantity, shipping=0, total=1500000 * quantity,
+                          payment_method=payment_method, delivery_method="pickup", status="pending")
+            db.add(order)
+            reserve_stock(db, order, [(PRODUCT_ID, quantity)], hold=payment_method == "payme")
+            db.commit()
+            return quantity, True, None, (time.perf_counter() - started) * 1000
+        except OutOfStock:
+            db.rollback()
+            return quantity, False, None, (time.perf_counter() - started) * 1000
+        except Exception as e:
+            db.rollback()
+            return quantity, False, f"{type(e).__name__}: {e}", (time.perf_counter() - started) * 1000
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(checkout, plan))
+
+
+def run_direct(args, db_url):
+    plan = checkout_plan(args.checkouts, args.max_quantity)
+    chunks = [plan[i::args.processes] for i in range(args.processes)]
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        results = pool.starmap(_direct_worker, [(db_url, args.threads, chunk) for chunk in chunks])
+    return [r for chunk in results for r in chunk], time.perf_counter() - started
+
+
+def run_http(args, db_url, workdir):
+    import httpx
+
+    plan = checkout_plan(args.checkouts, args.max_quantity)
+    results = []
+
+    async def drive(base_url):
+        queue = asyncio.Queue()
+        for entry in plan:
+            queue.put_nowait(entry)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120,
+                                     limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            async def worker():
+                while not queue.empty():
+                    quantity, payment_method = queue.get_nowait()
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post("/api/orders", json={
+                            "customer": CUSTOMER, "items": [{"productId": PRODUCT_ID, "quantity": quantity}],
+                            "paymentMethod": payment_method, "deliveryMethod": "pickup",
+                        })
+                        error = None if response.status_code in (200, 409) else \
+                            f"HTTP {response.status_code}: {response.text[:120]}"
+                        ok = response.status_code == 200
+                    except httpx.HTTPError as e:
+                        ok, error = False, f"{type(e).__name__}: {e}"
+                    results.append((quantity, ok, error, (time.perf_counter() - started) * 1000))
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+    with running_server(bench_env(db_url, workdir, {"STOCK_SWEEP_INTERVAL": "0"}), workers=args.workers) as base_url:
+        started = time.perf_counter()
+        asyncio.run(drive(base_url))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def verify(args, results):
+    """Compare what the clients saw with products / stock_reservations; returns (checks, facts)"""
+    from sqlalchemy import func
+
+    from database import SessionLocal, Product, StockReservation
+    from inventory import release_expired
+
+    sold = sum(quantity for quantity, ok, _, _ in results if ok)
+    db = SessionLocal()
+    try:
+        product = db.query(Product.stock_quantity, Product.in_stock).filter(Product.id == PRODUCT_ID).one()
+        reserved = dict(db.query(StockReservation.status, func.sum(StockReservation.quantity))
+                        .group_by(StockReservation.status))
+        # Все резервы Payme истекают - товар должен вернуться на склад ровно на их количество
+        release_expired(db, now=datetime.utcnow() + timedelta(days=1))
+        db.commit()
+        after_release = db.query(Product.stock_quantity).filter(Product.id == PRODUCT_ID).scalar()
+    finally:
+        db.close()
+
+    held, committed = reserved.get("held", 0), reserved.get("committed", 0)
+    smallest_rejected = min((quantity for quantity, ok, error, _ in results if not ok and not error), default=None)
+    checks = {
+        "no_oversell": product.stock_quantity >= 0 and sold <= args.stock,
+        "stock_matches_orders": args.stock - product.stock_quantity == sold,
+        "reservations_match_orders": held + committed == sold,
+        # Отказ только когда остаток действительно меньше запрошенного
+        "rejections_justified": smallest_rejected is None or smallest_rejected > product.stock_quantity,
+        "in_stock_flag": bool(product.in_stock) == (product.stock_quantity > 0),
+        "expired_holds_released": after_release == product.stock_quantity + held,
+    }
+    facts = {"sold_units": sold, "remaining": product.stock_quantity, "held_units": held,
+             "committed_units": committed, "stock_after_release": after_release}
+    return checks, facts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stock reservation under concurrent checkouts")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    direct = sub.add_parser("direct", help="Processes x threads calling reserve_stock through the ORM")
+    direct.add_argument("--processes", type=int, default=4)
+    direct.add_argument("--threads", type=int, default=16)
+    direct.add_argument("--checkouts", type=int, default=2000)
+    direct.add_argument("--stock", type=int, default=500)
+    http = sub.add_parser("http", help="POST /api/orders against uvicorn workers")
+    http.add_argument("--workers", type=int, default=4)
+    http.add_argument("--concurrency", type=int, default=200)
+    http.add_argument("--checkouts", type=int, default=600)
+    http.add_argument("--stock", type=int, default=150)
+    for p in (direct, http):
+        p.add_argument("--max-quantity", type=int, default=3, help="Units per cart: 1..N")
+        p.add_argument("--output")
+        p.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    args = parser.parse_args()
+
+    with bench_workdir(keep=args.keep) as workdir:
+        db_url = f"sqlite:///{os.path.join(workdir, 'inventory.db')}"
+        prepare(db_url, args.stock)
+        if args.mode == "direct":
+            results, elapsed = run_direct(args, db_url)
+        else:
+            results, elapsed = run_http(args, db_url, workdir)
+        checks, facts = verify(args, results)
+
+    accepted = sum(1 for _, ok, _, _ in results if ok)
+    errors = [error for _, _, error, _ in results if error]
+    latency = summarize_latencies(sorted(ms for _, _, _, ms in results))
+    print(f"🛒 {len(results)} checkouts in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s): "
+          f"{accepted} accepted, {len(results) - accepted - len(errors)} out of stock, {len(errors)} errors")
+    print(f"   stock {args.stock} -> {facts['remaining']}, sold {facts['sold_units']} units "
+          f"(held {facts['held_units']}, committed {facts['committed_units']}), "
+          f"after releasing holds: {facts['stock_after_release']}")
+    print(f"   latency ms: p50 {latency['p50']}, p95 {latency['p95']}, p99 {latency['p99']}")
+    for name, passed in checks.items():
+        print(f"   {'✅' if passed else '❌'} {name}")
+    for error in sorted(set(errors))[:5]:
+        print(f"   ❌ {error}")
+    if args.output:
+        write_results(args.output, {
+            "meta": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+            "checkouts": len(results), "accepted": accepted, "errors": len(errors), "seconds": round(elapsed, 3),
+            "checkouts_per_second": round(len(results) / elapsed, 1), "latency_ms": latency,
+            "checks": checks, **facts,
+        })
+    return 0 if all(checks.values()) and not errors else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
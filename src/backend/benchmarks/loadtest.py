@@ -0,0 +1,430 @@
+"""
+End-to-end HTTP load test for the storefront and admin APIs.
+
+Boots `uvicorn main:app` against a freshly generated dataset, drives a weighted mix of
+realistic scenarios at a fixed concurrency and reports p50/p95/p99 latency, throughput
+and error rate per route template. Results are stored as JSON so releases can be compared.
+
+Usage (from src/backend):
+    python -m benchmarks.loadtest run --concurrency 32 --duration 60 --output results/v1.json
+    python -m benchmarks.loadtest run --base-url http://127.0.0.1:8000 --admin-password ...
+    python -m benchmarks.loadtest compare results/v1.json results/v2.json --threshold 10
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.common import (
+    BACKEND_DIR, BENCH_ADMIN_EMAIL, BENCH_ADMIN_PASSWORD, BENCH_PAYME_KEY, BENCH_PAYME_MERCHANT_ID,
+    bench_env, bench_workdir, load_results, running_server, summarize_latencies, use_database, write_results,
+)
+
+DEFAULT_MIX = {
+    "catalog": 30,
+    "product": 20,
+    "collection": 10,
+    "home": 10,
+    "spa": 12,
+    "feeds": 2,
+    "checkout": 6,
+    "admin": 10,
+}
+
+FILTER_POOLS = {
+    "movement": ["Механические", "Кварцевые", "Автоматические"],
+    "caseMaterial": ["Сталь", "Титан", "Позолота"],
+    "dialColor": ["Черный", "Белый", "Синий", "Зеленый"],
+    "waterResistance": ["50m", "100m", "200m"],
+    "gender": ["Мужские", "Женские"],
+    "strapMaterial": ["Кожа", "Сталь", "Каучук"],
+    "features": ["Сапфировое стекло", "Хронограф", "Open Heart"],
+}
+SORTS = ["popular", "price-asc", "price-desc", "newest", "name"]
+
+
+class Recorder:
+    """Collects latency samples and failures per route template"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.enabled = True
+
+    def add(self, label, elapsed_ms, status, failed):
+        if not self.enabled:
+            return
+        self.latencies[label].append(elapsed_ms)
+        self.statuses[label][str(status)] += 1
+        if failed:
+            self.errors[label] += 1
+
+    def report(self, elapsed_s):
+        routes = {}
+        total = 0
+        total_errors = 0
+        for label in sorted(self.latencies):
+            samples = self.latencies[label]
+            total += len(samples)
+            total_errors += self.errors[label]
+            routes[label] = {
+                "requests": len(samples),
+                "errors": self.errors[label],
+                "error_rate": round(self.errors[label] / len(samples), 4) if samples else 0,
+                "throughput_rps": round(len(samples) / elapsed_s, 2) if elapsed_s else 0,
+                "latency_ms": summarize_latencies(samples),
+                "statuses": dict(self.statuses[label]),
+            }
+        all_samples = [v for values in self.latencies.values() for v in values]
+        return {
+            "totals": {
+                "requests": total,
+                "errors": total_errors,
+                "error_rate": round(total_errors / total, 4) if total else 0,
+                "throughput_rps": round(total / elapsed_s, 2) if elapsed_s else 0,
+                "latency_ms": summarize_latencies(all_samples),
+            },
+            "routes": routes,
+        }
+
+
+class Session:
+    """Per-run shared state: HTTP client, recorder and dataset ids"""
+
+    def __init__(self, client, recorder, dataset, admin_token, payme_auth, rnd):
+        self.client = client
+        self.recorder = recorder
+        self.dataset = dataset
+        self.admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        self.payme_headers = {"Authorization": payme_auth}
+        self.rnd = rnd
+
+    async def call(self, label, method, url, expect=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception as e:
+            self.recorder.add(label, (time.perf_counter() - start) * 1000, type(e).__name__, True)
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        failed = response.status_code not in expect
+        if not failed and label.startswith("POST /api/payme/callback"):
+            failed = "error" in response.json()
+        self.recorder.add(label, elapsed_ms, response.status_code, failed)
+        return response
+
+    async def payme(self, method, params):
+        body = {"jsonrpc": "2.0", "id": self.rnd.randint(1, 10**9), "method": method, "params": params}
+        return await self.call(f"POST /api/payme/callback [{method}]", "POST", "/api/payme/callback",
+                               json=body, headers=self.payme_headers)
+
+
+# --- Scenarios ---
+
+async def scenario_catalog(s):
+    params = [("page", s.rnd.randint(1, 3)), ("limit", 20), ("sort", s.rnd.choice(SORTS))]
+    for key in s.rnd.sample(list(FILTER_POOLS), s.rnd.randint(0, 3)):
+        for value in s.rnd.sample(FILTER_POOLS[key], s.rnd.randint(1, 2)):
+            params.append((key, value))
+    if s.rnd.random() < 0.4:
+        params.append(("collection", s.rnd.choice(s.dataset["collection_names"])))
+    if s.rnd.random() < 0.3:
+        params += [("minPrice", 2_000_000), ("maxPrice", 12_000_000)]
+    if s.rnd.random() < 0.1:
+        params.append(("search", "Bench"))
+    await s.call("GET /api/products", "GET", "/api/products", params=params)
+    if s.rnd.random() < 0.3:
+        await s.call("GET /api/products/filters", "GET", "/api/products/filters")
+        await s.call("GET /api/settings/filters", "GET", "/api/settings/filters")
+
+
+async def scenario_product(s):
+    product_id = s.rnd.choice(s.dataset["product_ids"])
+    await s.call("GET /api/products/{product_id}", "GET", f"/api/products/{product_id}")
+
+
+async def scenario_collection(s):
+    collection_id = s.rnd.choice(s.dataset["collection_ids"])
+    await s.call("GET /api/collections", "GET", "/api/collections")
+    await s.call("GET /api/collections/{collection_id}", "GET", f"/api/collections/{collection_id}")
+    await s.call("GET /api/collections/{collection_id}/products", "GET",
+                 f"/api/collections/{collection_id}/products", params={"limit": 50})
+
+
+async def scenario_home(s):
+    for label, url in (
+        ("GET /api/content/logo", "/api/content/logo"),
+        ("GET /api/content/hero", "/api/content/hero"),
+        ("GET /api/content/promo-banner", "/api/content/promo-banner"),
+        ("GET /api/content/featured-watches", "/api/content/featured-watches"),
+        ("GET /api/content/heritage", "/api/content/heritage"),
+        ("GET /api/settings/currency", "/api/settings/currency"),
+    ):
+        await s.call(label, "GET", url)
+
+
+async def scenario_spa(s):
+    choice = s.rnd.random()
+    if choice < 0.5:
+        path = f"/product/{s.rnd.choice(s.dataset['product_ids'])}"
+        label = "GET /product/{id} [spa]"
+    elif choice < 0.7:
+        path = f"/collection/{s.rnd.choice(s.dataset['collection_ids'])}"
+        label = "GET /collection/{id} [spa]"
+    else:
+        path = s.rnd.choice(["/", "/catalog", "/collections", "/boutique", "/history"])
+        label = "GET /{static} [spa]"
+    await s.call(label, "GET", path)
+
+
+async def scenario_feeds(s):
+    if s.rnd.random() < 0.5:
+        await s.call("GET /sitemap.xml", "GET", "/sitemap.xml")
+    else:
+        await s.call("GET /api/products/feed", "GET", "/api/products/feed")
+
+
+async def scenario_checkout(s):
+    picked = s.rnd.sample(s.dataset["product_ids"], s.rnd.randint(1, 3))
+    items = [{"productId": pid, "quantity": 1} for pid in picked]
+    await s.call("POST /api/cart/price", "POST", "/api/cart/price",
+                 json={"items": items, "deliveryMethod": "standard"})
+    order = {
+        "items": items,
+        "customer": {"fullName": "Load Test", "email": "load@example.com", "phone": "+998901112233"},
+        "deliveryMethod": "standard",
+        "paymentMethod": "payme",
+        "deliveryAddress": {"address": "ул. Аккурган, 24", "city": "Ташкент", "postalCode": "100000", "country": "UZ"},
+    }
+    # 409 - товар закончился (остаток списывается при оформлении), это не ошибка
+    response = await s.call("POST /api/orders", "POST", "/api/orders", json=order, expect=(200, 409))
+    if response is None or response.status_code != 200:
+        return
+    created = response.json()
+    order_number = created["orderNumber"]
+    account = {"order_id": order_number}
+    amount = int(round(created["total"] * 100))
+    trans_id = uuid.uuid4().hex[:24]
+    now_ms = int(time.time() * 1000)
+
+    await s.payme("CheckPerformTransaction", {"amount": amount, "account": account})
+    await s.payme("CreateTransaction", {"id": trans_id, "time": now_ms, "amount": amount, "account": account})
+    if s.rnd.random() < 0.85:
+        await s.payme("PerformTransaction", {"id": trans_id})
+    else:
+        await s.payme("CancelTransaction", {"id": trans_id, "reason": 3})
+    await s.payme("CheckTransaction", {"id": trans_id})
+
+
+async def scenario_admin(s):
+    h = s.admin_headers
+    choice = s.rnd.random()
+    if choice < 0.3:
+        params = {"page": s.rnd.randint(1, 5), "limit": 20}
+        if s.rnd.random() < 0.6:
+            params["status"] = s.rnd.choice(["pending", "processing", "completed"])
+        await s.call("GET /api/admin/orders", "GET", "/api/admin/orders", params=params, headers=h)
+    elif choice < 0.55:
+        await s.call("GET /api/admin/products", "GET", "/api/admin/products",
+                     params={"page": s.rnd.randint(1, 5), "limit": 100}, headers=h)
+    elif choice < 0.75:
+        params = {"page": 1, "limit": 20}
+        if s.rnd.random() < 0.5:
+            params["status"] = "pending"
+        await s.call("GET /api/admin/bookings", "GET", "/api/admin/bookings", params=params, headers=h)
+    elif choice < 0.9:
+        await s.call("GET /api/admin/stats", "GET", "/api/admin/stats", headers=h)
+    else:
+        await s.call("GET /api/admin/collections", "GET", "/api/admin/collections", headers=h)
+
+
+SCENARIOS = {
+    "catalog": scenario_catalog,
+    "product": scenario_product,
+    "collection": scenario_collection,
+    "home": scenario_home,
+    "spa": scenario_spa,
+    "feeds": scenario_feeds,
+    "checkout": scenario_checkout,
+    "admin": scenario_admin,
+}
+
+
+def parse_mix(value):
+    """'catalog=40,checkout=10' -> weights; unknown scenario names are rejected"""
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}'. Available: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def drive(base_url, dataset, args, admin_email, admin_password):
+    import httpx
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        login = await client.post("/api/admin/login", json={"email": admin_email, "password": admin_password})
+        if login.status_code != 200:
+            raise RuntimeError(f"Admin login failed: {login.status_code} {login.text}")
+        token = login.json()["token"]
+        merchant = os.getenv("PAYME_MERCHANT_ID", BENCH_PAYME_MERCHANT_ID)
+        key = os.getenv("PAYME_KEY", BENCH_PAYME_KEY)
+        payme_auth = "Basic " + base64.b64encode(f"{merchant}:{key}".encode()).decode()
+
+        names = list(args.mix)
+        weights = [args.mix[n] for n in names]
+
+        async def worker(worker_id, deadline):
+            s = Session(client, recorder, dataset, token, payme_auth, random.Random(args.seed + worker_id))
+            while time.perf_counter() < deadline:
+                await SCENARIOS[s.rnd.choices(names, weights)[0]](s)
+
+        if args.warmup > 0:
+            recorder.enabled = False
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*(worker(i, deadline) for i in range(args.concurrency)))
+            recorder.enabled = True
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(i, deadline) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return recorder.report(elapsed), elapsed
+
+
+def dataset_from_server(base_url):
+    """Collect product and collection ids from a running server (for --base-url runs)"""
+    import httpx
+
+    products = httpx.get(f"{base_url}/api/products", params={"limit": 100}, timeout=30).json()["data"]
+    collections = httpx.get(f"{base_url}/api/collections", timeout=30).json()
+    return {
+        "product_ids": [p["id"] for p in products],
+        "collection_ids": [c["id"] for c in collections],
+        "collection_names": [c["name"] for c in collections],
+    }
+
+
+def print_report(report):
+    print(f"\n{'route':<58} {'req':>7} {'err%':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, r in report["routes"].items():
+        lat = r["latency_ms"]
+        print(f"{label[:58]:<58} {r['requests']:>7} {r['error_rate'] * 100:>6.1f} {r['throughput_rps']:>8.1f} "
+              f"{lat['p50']:>8.1f} {lat['p95']:>8.1f} {lat['p99']:>8.1f}")
+    t = report["totals"]
+    print(f"\nTOTAL: {t['requests']} requests, {t['throughput_rps']} req/s, "
+          f"errors {t['error_rate'] * 100:.2f}%, p95 {t['latency_ms']['p95']} ms")
+
+
+def cmd_run(args):
+    meta = {
+        "tool": "loadtest",
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "mix": args.mix,
+        "workers": args.workers,
+    }
+    if args.base_url:
+        dataset = dataset_from_server(args.base_url)
+        report, elapsed = asyncio.run(drive(args.base_url, dataset, args, args.admin_email, args.admin_password))
+        meta["target"] = args.base_url
+    else:
+        with bench_workdir(keep=args.keep) as workdir:
+            db_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+            use_database(db_url)
+            from benchmarks.dataset import generate
+
+            print(f"🧪 Generating dataset in {workdir} ...")
+            dataset = generate(products=args.products, orders=args.orders, bookings=args.bookings, seed=args.seed)
+            env = bench_env(db_url, workdir)
+            with running_server(env, workers=args.workers) as base_url:
+                print(f"🚀 Server up at {base_url}, running {args.duration}s at concurrency {args.concurrency}")
+                report, elapsed = asyncio.run(drive(base_url, dataset, args, BENCH_ADMIN_EMAIL, BENCH_ADMIN_PASSWORD))
+        meta["dataset"] = {k: dataset[k] for k in ("products", "orders", "bookings", "transactions")}
+
+    meta["elapsed_s"] = round(elapsed, 3)
+    print_report(report)
+    output = args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    write_results(output, {"meta": meta, **report})
+
+
+def cmd_compare(args):
+    base = load_results(args.baseline)
+    current = load_results(args.current)
+    regressions = []
+    print(f"{'route':<58} {'p95 base':>9} {'p95 now':>9} {'Δ%':>7} {'rps Δ%':>7} {'err now':>8}")
+    for label, now in current["routes"].items():
+        old = base["routes"].get(label)
+        if not old:
+            print(f"{label[:58]:<58} {'-':>9} {now['latency_ms']['p95']:>9.1f} {'new':>7}")
+            continue
+        p95_old, p95_new = old["latency_ms"]["p95"], now["latency_ms"]["p95"]
+        delta = (p95_new - p95_old) / p95_old * 100 if p95_old else 0.0
+        rps_delta = ((now["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100
+                     if old["throughput_rps"] else 0.0)
+        flag = ""
+        if delta > args.threshold or now["error_rate"] > old["error_rate"] + 0.01:
+            flag = " ⚠️"
+            regressions.append(label)
+        print(f"{label[:58]:<58} {p95_old:>9.1f} {p95_new:>9.1f} {delta:>7.1f} {rps_delta:>7.1f} "
+              f"{now['error_rate'] * 100:>7.2f}%{flag}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} route(s) regressed more than {args.threshold}% at p95")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Orient Watch HTTP load test")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run a load test")
+    run.add_argument("--concurrency", type=int, default=16)
+    run.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    run.add_argument("--warmup", type=float, default=3, help="Unmeasured warm-up seconds")
+    run.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                     help="Scenario weights, e.g. catalog=40,product=20,checkout=10")
+    run.add_argument("--products", type=int, default=2000)
+    run.add_argument("--orders", type=int, default=5000)
+    run.add_argument("--bookings", type=int, default=1000)
+    run.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    run.add_argument("--timeout", type=float, default=30)
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--output", help="Where to write the JSON results")
+    run.add_argument("--keep", action="store_true", help="Keep the generated database")
+    run.add_argument("--base-url", help="Target an already running server instead of booting one")
+    run.add_argument("--admin-email", default=BENCH_ADMIN_EMAIL)
+    run.add_argument("--admin-password", default=BENCH_ADMIN_PASSWORD)
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="Compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=10, help="Allowed p95 growth, %%")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
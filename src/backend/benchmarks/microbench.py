@@ -0,0 +1,279 @@
+"""
+Micro-benchmarks for known hot functions, run against fixed-size synthetic inputs.
+
+Each benchmark reports the best and median time per operation over several rounds.
+A baseline file keeps the reference numbers; `compare` re-runs the suite and fails
+when any benchmark got slower than the allowed threshold.
+
+Usage (from src/backend):
+    python -m benchmarks.microbench run
+    python -m benchmarks.microbench run --save-baseline
+    python -m benchmarks.microbench compare --threshold 15
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.common import BACKEND_DIR, STUB_INDEX_HTML, load_results, use_database, write_results
+
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baseline_micro.json")
+
+SIZE = 1000
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register `setup() -> callable`; the callable is timed, one call == one operation"""
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def synthetic_products(count=SIZE):
+    from database import Product
+
+    products = []
+    for i in range(count):
+        images = [f"/uploads/bench-{i}-{n}.jpg" for n in range(4)]
+        products.append(Product(
+            id=f"bench-watch-{i}",
+            name=f"Orient Bench Classic {i}",
+            collection="CLASSIC",
+            price=4_500_000.0 + i,
+            image=images[0],
+            images=json.dumps(images),
+            description="<p>Японские часы Orient с автоматическим механизмом.</p>" * 4,
+            features=json.dumps(["Сапфировое стекло", "Дата", "Open Heart"], ensure_ascii=False),
+            specs=json.dumps({"Стекло": "Сапфировое", "Калибр": "F6724", "Запас хода": "40 ч"}, ensure_ascii=False),
+            in_stock=True,
+            stock_quantity=10,
+            sku=f"RA-BENCH{i:06d}",
+            is_featured=i % 10 == 0,
+            brand="Orient",
+            gender="Мужские",
+            case_diameter=41.0,
+            strap_material="Кожа",
+            movement="Механические",
+            case_material="Сталь",
+            dial_color="Синий",
+            water_resistance="100m",
+            seo_title=f"Orient Bench {i}",
+            seo_description="Купить часы Orient",
+            created_at=datetime(2025, 1, 1),
+            updated_at=datetime(2025, 6, 1),
+        ))
+    return products
+
+
+@benchmark("product_to_dict")
+def bench_product_to_dict():
+    products = synthetic_products()
+
+    def run():
+        return [p.to_dict() for p in products]
+    return run, len(products)
+
+
+@benchmark("products_feed_items")
+def bench_feed_items():
+    from routes.products import feed_item
+
+    products = synthetic_products()
+
+    def run():
+        return [feed_item(p) for p in products]
+    return run, len(products)
+
+
+@benchmark("seo_inject_tags")
+def bench_seo_inject():
+    from routes.seo_renderer import inject_seo_tags
+
+    html = STUB_INDEX_HTML.replace("</head>", "<link rel=\"stylesheet\" href=\"/assets/index.css\">\n" * 20 + "</head>")
+    titles = [(f"Orient Bench {i} | Orient Watch Uzbekistan", "Купить японские часы Orient " * 5, f"/uploads/bench-{i}.jpg",
+               f"product/bench-watch-{i}") for i in range(SIZE)]
+
+    def run():
+        for title, desc, image, path in titles:
+            inject_seo_tags(html, title, desc, image, path)
+    return run, len(titles)
+
+
+@benchmark("payme_get_transaction_data")
+def bench_get_transaction_data():
+    from payme_legacy import get_transaction_data
+
+    notes = [
+        "\n".join([f"Комментарий клиента, строка {n}" for n in range(10)]
+                  + [f'[Payme Transaction] {{"transaction_id": "tx{i}", "create_time": 1700000000000, "state": 1}}'])
+        for i in range(SIZE)
+    ]
+
+    def run():
+        for n in notes:
+            get_transaction_data(n)
+    return run, len(notes)
+
+
+@benchmark("payme_update_transaction_data")
+def bench_update_transaction_data():
+    from payme_legacy import update_transaction_data
+
+    class FakeOrder:
+        __slots__ = ("notes",)
+
+    base_notes = "\n".join([f"Комментарий клиента, строка {n}" for n in range(10)]
+                           + ['[Payme Transaction] {"transaction_id": "tx", "state": 1}'])
+    orders = []
+    for _ in range(SIZE):
+        order = FakeOrder()
+        order.notes = base_notes
+        orders.append(order)
+    payload = {"transaction_id": "tx", "create_time": 1700000000000, "perform_time": 1700000060000, "state": 2}
+
+    def run():
+        for order in orders:
+            order.notes = base_notes
+            update_transaction_data(order, payload)
+    return run, len(orders)
+
+
+@benchmark("excel_import_parse_row")
+def bench_import_parse_row():
+    from routes.products_export import parse_product_row, SPEC_FIELDS
+
+    rows = []
+    for i in range(SIZE):
+        row = {
+            "id": f"bench-watch-{i}", "name": f"Orient Bench {i}", "collection": "CLASSIC", "price": 4500000,
+            "image": f"/uploads/bench-{i}.jpg", "images": "[]", "description": "Описание",
+            "features": "Сапфировое стекло, Дата, Open Heart", "in_stock": True, "stock_quantity": 5,
+            "sku": f"RA-BENCH{i:06d}", "is_featured": False, "brand": "Orient", "gender": "Мужские",
+            "case_diameter": "41", "strap_material": "Кожа", "movement": "Механические",
+            "case_material": "Сталь", "dial_color": "Синий", "water_resistance": "100m",
+        }
+        row.update({field: f"{field} {i}" for field in SPEC_FIELDS})
+        rows.append(row)
+
+    def run():
+        for row in rows:
+            parse_product_row(row)
+    return run, len(rows)
+
+
+@benchmark("excel_export_write_row")
+def bench_export_write_row():
+    from openpyxl import Workbook
+    from routes.products_export import write_product_row
+
+    products = synthetic_products()
+
+    def run():
+        ws = Workbook().active
+        for row_num, product in enumerate(products, 2):
+            write_product_row(ws, row_num, product)
+    return run, len(products)
+
+
+def measure(setup, rounds, min_time):
+    """Best/median microseconds per operation; each round runs the callable at least min_time seconds"""
+    fn, ops = setup()
+    fn()  # warm-up
+    per_op = []
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_op.append(elapsed / (calls * ops) * 1e6)
+    return {
+        "best_us": round(min(per_op), 4),
+        "median_us": round(statistics.median(per_op), 4),
+        "ops_per_call": ops,
+        "rounds": rounds,
+    }
+
+
+def run_suite(args):
+    use_database("sqlite://")
+    selected = [name for name in BENCHMARKS if not args.only or name in args.only]
+    results = {}
+    for name in selected:
+        results[name] = measure(BENCHMARKS[name], args.rounds, args.min_time)
+        r = results[name]
+        print(f"{name:<32} best {r['best_us']:>10.3f} µs/op   median {r['median_us']:>10.3f} µs/op")
+    return results
+
+
+def cmd_run(args):
+    results = run_suite(args)
+    payload = {"meta": {"tool": "microbench", "python": sys.version.split()[0]}, "benchmarks": results}
+    if args.save_baseline:
+        write_results(args.baseline, payload)
+    if args.output:
+        write_results(args.output, payload)
+
+
+def cmd_compare(args):
+    if not os.path.exists(args.baseline):
+        print(f"❌ Baseline not found: {args.baseline}. Run with --save-baseline first.")
+        sys.exit(2)
+    baseline = load_results(args.baseline)["benchmarks"]
+    results = run_suite(args)
+
+    regressions = []
+    print(f"\n{'benchmark':<32} {'baseline':>12} {'current':>12} {'Δ%':>8}")
+    for name, current in results.items():
+        old = baseline.get(name)
+        if not old:
+            print(f"{name:<32} {'-':>12} {current['best_us']:>12.3f} {'new':>8}")
+            continue
+        delta = (current["best_us"] - old["best_us"]) / old["best_us"] * 100 if old["best_us"] else 0.0
+        flag = ""
+        if delta > args.threshold:
+            flag = " ⚠️"
+            regressions.append(name)
+        print(f"{name:<32} {old['best_us']:>12.3f} {current['best_us']:>12.3f} {delta:>8.1f}{flag}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) slower than baseline by more than {args.threshold}%")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Orient Watch micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Run only these benchmarks")
+        p.add_argument("--rounds", type=int, default=5)
+        p.add_argument("--min-time", type=float, default=0.2, help="Seconds per round")
+        p.add_argument("--baseline", default=DEFAULT_BASELINE)
+
+    run = sub.add_parser("run", help="Run the suite")
+    common(run)
+    run.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline file")
+    run.add_argument("--output", help="Also write the results to this JSON file")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="Run the suite and compare against the baseline")
+    common(compare)
+    compare.add_argument("--threshold", type=float, default=15, help="Allowed slowdown, %%")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Concurrency test for order / booking numbering (numbering.py).
+
+Creates orders from many processes and threads at once and checks that every order got
+a distinct ORD-YYYYMMDD-NNNNNN number with no failed inserts.
+
+Usage (from src/backend):
+    # processes x threads writing orders directly through the ORM
+    python -m benchmarks.numbering direct --processes 4 --threads 8 --orders 5000
+    python -m benchmarks.numbering direct --processes 4 --threads 8 --orders 20000 --numbers-only
+    # POST /api/orders against uvicorn with several workers
+    python -m benchmarks.numbering http --workers 4 --concurrency 16 --orders 1000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import bench_env, bench_workdir, running_server, use_database, write_results
+
+ORDER_PAYLOAD = {
+    "customer": {"fullName": "Нагрузочный тест", "phone": "+998901234567", "email": "bench@orient.uz"},
+    "items": [{"productId": "bench-watch-1", "quantity": 1}],
+    "paymentMethod": "cash", "deliveryMethod": "pickup",
+}
+
+
+def _direct_worker(db_url, threads, count, numbers_only=False):
+    """One process: `threads` threads creating `count` orders in total; returns (numbers, errors)"""
+    use_database(db_url)
+    from database import SessionLocal, Order
+    from numbering import next_number
+
+    def create(_):
+        db = SessionLocal()
+        try:
+            number = next_number("ORD")
+            if numbers_only:
+                return number, None
+            db.add(Order(order_number=number, customer_data=json.dumps(ORDER_PAYLOAD["customer"]),
+                         items=json.dumps(ORDER_PAYLOAD["items"]), subtotal=1500000, shipping=0, total=1500000,
+                         payment_method="cash", delivery_method="pickup", status="pending"))
+            db.commit()
+            return number, None
+        except Exception as e:
+            db.rollback()
+            return None, f"{type(e).__name__}: {e}"
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(create, range(count)))
+    return [n for n, _ in results if n], [e for _, e in results if e]
+
+
+def run_direct(args, workdir):
+    db_url = f"sqlite:///{os.path.join(workdir, 'numbering.db')}"
+    use_database(db_url)
+    from database import init_db
+    init_db()
+
+    per_process = [args.orders // args.processes + (1 if i < args.orders % args.processes else 0)
+                   for i in range(args.processes)]
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        results = pool.starmap(_direct_worker, [(db_url, args.threads, n, args.numbers_only) for n in per_process])
+    elapsed = time.perf_counter() - started
+    numbers = [n for chunk, _ in results for n in chunk]
+    errors = [e for _, chunk in results for e in chunk]
+    return numbers, errors, elapsed
+
+
+def run_http(args, workdir):
+    import httpx
+
+    db_url = f"sqlite:///{os.path.join(workdir, 'numbering.db')}"
+    use_database(db_url)
+    from benchmarks.dataset import generate
+    from database import SessionLocal, Product
+    generate(products=10, orders=0, bookings=0)  # товар для корзины
+    db = SessionLocal()
+    try:
+        # Без учета остатка, чтобы все заказы прошли (склад проверяет benchmarks.inventory)
+        db.query(Product).filter(Product.id == "bench-watch-1").update({"stock_quantity": 0, "in_stock": True})
+        db.commit()
+    finally:
+        db.close()
+
+    numbers, errors = [], []
+
+    async def drive(base_url):
+        queue = asyncio.Queue()
+        for _ in range(args.orders):
+            queue.put_nowait(None)
+        async with httpx.AsyncClient(base_url=base_url, timeout=30,
+                                     limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            async def worker():
+                while not queue.empty():
+                    queue.get_nowait()
+                    try:
+                        response = await client.post("/api/orders", json=ORDER_PAYLOAD)
+                        if response.status_code == 200:
+                            numbers.append(response.json()["orderNumber"])
+                        else:
+                            errors.append(f"HTTP {response.status_code}: {response.text[:120]}")
+                    except httpx.HTTPError as e:
+                        errors.append(f"{type(e).__name__}: {e}")
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+    with running_server(bench_env(db_url, workdir), workers=args.workers) as base_url:
+        started = time.perf_counter()
+        asyncio.run(drive(base_url))
+        elapsed = time.perf_counter() - started
+    return numbers, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order number generation under concurrency")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    direct = sub.add_parser("direct", help="Processes x threads inserting orders through the ORM")
+    direct.add_argument("--processes", type=int, default=4)
+    direct.add_argument("--threads", type=int, default=8)
+    direct.add_argument("--orders", type=int, default=5000)
+    direct.add_argument("--numbers-only", action="store_true", help="Only allocate numbers, don't insert orders")
+    http = sub.add_parser("http", help="POST /api/orders against uvicorn workers")
+    http.add_argument("--workers", type=int, default=4)
+    http.add_argument("--concurrency", type=int, default=16)
+    http.add_argument("--orders", type=int, default=1000)
+    for p in (direct, http):
+        p.add_argument("--output")
+        p.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    args = parser.parse_args()
+
+    with bench_workdir(keep=args.keep) as workdir:
+        numbers, errors, elapsed = (run_direct if args.mode == "direct" else run_http)(args, workdir)
+        from database import SessionLocal, Order
+        db = SessionLocal()
+        try:
+            stored = db.query(Order).count()
+        finally:
+            db.close()
+
+    duplicates = len(numbers) - len(set(numbers))
+    print(f"🧾 {len(numbers)} orders in {elapsed:.2f}s ({len(numbers) / elapsed:.0f}/s), "
+          f"{stored} stored, {duplicates} duplicate numbers, {len(errors)} errors")
+    if numbers:
+        print(f"   {min(numbers)} … {max(numbers)}")
+    for error in sorted(set(errors))[:5]:
+        print(f"   ❌ {error}")
+    if args.output:
+        write_results(args.output, {
+            "meta": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+            "orders": len(numbers), "stored": stored, "seconds": round(elapsed, 3),
+            "orders_per_second": round(len(numbers) / elapsed, 1), "duplicates": duplicates, "errors": len(errors),
+        })
+    expected = 0 if getattr(args, "numbers_only", False) else args.orders
+    return 0 if not errors and not duplicates and len(numbers) == args.orders and stored == expected else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
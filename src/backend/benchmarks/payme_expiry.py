@@ -0,0 +1,191 @@
+"""
+Background Payme expiry (scheduler.py "payme_expiry" job) on a large backlog.
+
+Fills the database with Payme orders in every state the sweep has to tell apart, then runs
+sweep_payme from several processes at once (several uvicorn workers waking up together):
+
+    stale      processing, transaction created 13 h ago          -> transaction -1 / reason 4, order cancelled
+    fresh      processing, transaction created 1 h ago           -> untouched
+    abandoned  pending Payme order from 2 h ago, no transaction  -> cancelled
+    recent     pending Payme order from 5 min ago                -> untouched
+    legacy     processing, transaction timed out (reason 4)      -> cancelled
+    paid       completed, transaction performed                  -> untouched
+    cash       pending cash order from 2 days ago                -> untouched
+Stale and abandoned orders hold stock (half of the abandoned ones don't: stock not tracked).
+
+Checks: every order ends as its category says, held stock comes back exactly once
+(stock + still held == initial stock) and the swept counts of all processes add up.
+
+Usage (from src/backend):
+    python -m benchmarks.payme_expiry --orders 60000 --sweepers 4 --batch 500
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import bench_workdir, use_database, write_results
+
+HOUR_MS = 3600 * 1000
+CATEGORIES = ("stale", "fresh", "abandoned", "recent", "legacy", "paid", "cash")
+EXPECTED = {
+    # категория: (статус заказа, состояние транзакции или None, причина)
+    "stale": ("cancelled", -1, 4),
+    "fresh": ("processing", 1, None),
+    "abandoned": ("cancelled", None, None),
+    "recent": ("pending", None, None),
+    "legacy": ("cancelled", -1, 4),
+    "paid": ("completed", 2, None),
+    "cash": ("pending", None, None),
+}
+PRODUCTS = 20
+STOCK = 1_000_000
+
+
+def category(i):
+    return CATEGORIES[i % len(CATEGORIES)]
+
+
+def prepare(db_url, count):
+    """Orders, transactions and stock reservations of every category; products start with STOCK units"""
+    use_database(db_url)
+    from benchmarks.dataset import _batched_insert, generate
+    from database import engine, Order, Product, StockReservation, Transaction
+
+    generate(products=PRODUCTS, orders=0, bookings=0)
+    now = datetime.utcnow()
+    now_ms = int(time.time() * 1000)
+    created = {
+        "stale": now - timedelta(hours=13), "fresh": now - timedelta(hours=1),
+        "abandoned": now - timedelta(hours=2), "recent": now - timedelta(minutes=5),
+        "legacy": now - timedelta(days=2), "paid": now - timedelta(days=2), "cash": now - timedelta(days=2),
+    }
+    orders, transactions, reservations, held = [], [], [], {}
+    for i in range(count):
+        kind = category(i)
+        number = f"ORD-EXP-{i:07d}"
+        product_id = f"bench-watch-{i % PRODUCTS}"
+        orders.append({
+            "id": i + 1, "order_number": number, "customer_data": json.dumps({"fullName": "Expiry"}),
+            "items": json.dumps([{"productId": product_id, "quantity": 1}]),
+            "subtotal": 1000000, "shipping": 0, "total": 1000000,
+            "payment_method": "cash" if kind == "cash" else "payme", "delivery_method": "pickup",
+            "status": {"stale": "processing", "fresh": "processing", "legacy": "processing",
+                       "paid": "completed"}.get(kind, "pending"),
+            "created_at": created[kind],
+        })
+        state = {"stale": 1, "fresh": 1, "legacy": -1, "paid": 2}.get(kind)
+        if state is not None:
+            create_time = int(created[kind].timestamp() * 1000)
+            transactions.append({
+                "payme_trans_id": f"exp-{i:07d}", "time": create_time, "amount": 100000000,
+                "account": json.dumps({"order_id": number}), "create_time": create_time,
+                "perform_time": create_time + 60_000 if state == 2 else 0,
+                "cancel_time": create_time + 12 * HOUR_MS if state == -1 else 0,
+                "state": state, "reason": 4 if state == -1 else None, "order_id": number,
+            })
+        if kind in ("stale", "fresh", "recent") or (kind == "abandoned" and i % 2):
+            expires = {"stale": now - timedelta(hours=1), "fresh": now + timedelta(hours=11),
+                       "recent": now + timedelta(minutes=25), "abandoned": now + timedelta(minutes=1)}[kind]
+            # abandoned: резерв еще не истек - заказ отменяет только фоновое истечение Payme
+            reservations.append({"order_id": i + 1, "product_id": product_id, "quantity": 1, "status": "held",
+                                 "expires_at": expires, "created_at": created[kind]})
+            held[product_id] = held.get(product_id, 0) + 1
+
+    with engine.begin() as conn:
+        _batched_insert(conn, Order, orders)
+        _batched_insert(conn, Transaction, transactions)
+        _batched_insert(conn, StockReservation, reservations)
+        for product_id in (f"bench-watch-{n}" for n in range(PRODUCTS)):
+            conn.execute(Product.__table__.update().where(Product.id == product_id)
+                         .values(stock_quantity=STOCK - held.get(product_id, 0), in_stock=True))
+    return now_ms
+
+
+def _sweep(db_url, batch):
+    """Child process: one sweep_payme run, like a uvicorn worker's scheduler; returns (swept, seconds)"""
+    os.environ["PAYME_EXPIRY_BATCH"] = str(batch)
+    use_database(db_url)
+    import scheduler
+
+    started = time.perf_counter()
+    return scheduler.sweep_payme(), time.perf_counter() - started
+
+
+def verify(count):
+    from sqlalchemy import func
+
+    from database import SessionLocal, Order, Product, StockReservation, Transaction
+
+    db = SessionLocal()
+    try:
+        statuses = dict(db.query(Order.order_number, Order.status))
+        transactions = {row.order_id: (row.state, row.reason)
+                        for row in db.query(Transaction.order_id, Transaction.state, Transaction.reason)}
+        stock = db.query(func.sum(Product.stock_quantity)).filter(Product.id.like("bench-watch-%")).scalar()
+        still_held = db.query(func.sum(StockReservation.quantity)).filter(StockReservation.status == "held").scalar()
+        released = db.query(func.count(StockReservation.id)).filter(StockReservation.status == "released").scalar()
+    finally:
+        db.close()
+
+    wrong = []
+    for i in range(count):
+        kind, number = category(i), f"ORD-EXP-{i:07d}"
+        status, state, reason = EXPECTED[kind]
+        if statuses[number] != status or (state is not None and transactions.get(number) != (state, reason)):
+            wrong.append(f"{number} ({kind}): {statuses[number]}, transaction {transactions.get(number)}")
+    expected_released = sum(1 for i in range(count) if category(i) == "stale"
+                            or (category(i) == "abandoned" and i % 2))
+    checks = {
+        "final_states": not wrong,
+        "stock_conserved": stock + (still_held or 0) == STOCK * PRODUCTS,
+        "released_once": released == expected_released,
+    }
+    return checks, wrong, released
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background expiry of stale Payme transactions and unpaid orders")
+    parser.add_argument("--orders", type=int, default=60000)
+    parser.add_argument("--sweepers", type=int, default=4, help="Processes running the sweep at the same time")
+    parser.add_argument("--batch", type=int, default=500, help="PAYME_EXPIRY_BATCH")
+    parser.add_argument("--output")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    args = parser.parse_args()
+
+    with bench_workdir(keep=args.keep) as workdir:
+        db_url = f"sqlite:///{os.path.join(workdir, 'expiry.db')}"
+        prepare(db_url, args.orders)
+        started = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.sweepers) as pool:
+            runs = pool.starmap(_sweep, [(db_url, args.batch)] * args.sweepers)
+        elapsed = time.perf_counter() - started
+        checks, wrong, released = verify(args.orders)
+
+    swept = {kind: sum(run[kind] for run, _ in runs) for kind in ("transactions", "orders", "reservations")}
+    expected = {
+        "transactions": sum(1 for i in range(args.orders) if category(i) == "stale"),
+        "orders": sum(1 for i in range(args.orders) if category(i) in ("stale", "abandoned", "legacy")),
+        "reservations": released,
+    }
+    checks["swept_counts"] = swept == expected
+    print(f"⏱️ {args.sweepers} sweepers over {args.orders} orders in {elapsed:.2f}s "
+          f"(slowest sweeper {max(seconds for _, seconds in runs):.2f}s)")
+    print(f"   swept: {swept['transactions']} transactions timed out, {swept['orders']} orders cancelled, "
+          f"{swept['reservations']} reservations released")
+    for name, passed in checks.items():
+        print(f"   {'✅' if passed else '❌'} {name}")
+    for problem in wrong[:5]:
+        print(f"   ❌ {problem}")
+    if args.output:
+        write_results(args.output, {
+            "meta": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+            "seconds": round(elapsed, 3), "swept": swept, "expected": expected, "checks": checks,
+        })
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,377 @@
+"""
+Local Payme simulator: replays Merchant API JSON-RPC sequences against /api/payme/callback
+(with the merchant's Basic auth) instead of going through the Payme sandbox.
+
+Every order gets one scenario:
+    pay        CheckPerform -> Create -> Perform -> CheckTransaction
+    cancel     CheckPerform -> Create -> Cancel (before perform)
+    refund     Create -> Perform -> Cancel (after perform)
+    expired    Create with a time 13 h ago -> Perform (timeout, reason 4)
+    duplicate  pay, but Create and Perform are each sent --duplicates times at once
+    reordered  Perform / Cancel / CheckTransaction before Create, then a second Create with
+               another id racing the first one, then Perform
+    race       Create -> Perform and Cancel sent at the same time
+    bad        CheckPerform with a wrong amount / unknown order, a wrong password
+Each response is checked against what Payme expects (result or error code), and after the
+run the final transactions, orders and stock reservations are compared with the scenario.
+
+Usage (from src/backend):
+    python -m benchmarks.payme_simulator --workers 2 --orders 400 --concurrency 64
+    python -m benchmarks.payme_simulator --mix pay=6,duplicate=2,race=1 --output results/payme.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+
+from benchmarks.common import (
+    BENCH_PAYME_KEY, BENCH_PAYME_MERCHANT_ID,
+    bench_env, bench_workdir, running_server, summarize_latencies, use_database, write_results,
+)
+
+DEFAULT_MIX = {"pay": 5, "cancel": 1, "refund": 1, "expired": 1, "duplicate": 2, "reordered": 1, "race": 1, "bad": 1}
+HOUR_MS = 3600 * 1000
+CUSTOMER = {"fullName": "Payme Simulator", "phone": "+998901234567", "email": "bench@orient.uz"}
+
+# Ожидаемое итоговое состояние: (состояния транзакции, статус заказа, статусы резервов)
+EXPECTED = {
+    "pay": ({2}, {"completed"}, {"committed"}),
+    "cancel": ({-1}, {"cancelled"}, {"released"}),
+    "refund": ({-2}, {"cancelled"}, {"released"}),
+    "expired": ({-1}, {"cancelled"}, {"released"}),
+    "duplicate": ({2}, {"completed"}, {"committed"}),
+    "reordered": ({2}, {"completed"}, {"committed"}),
+    # Кто первый: Perform -> Cancel дает -2, Cancel -> Perform дает -1 и ошибку на Perform
+    "race": ({-1, -2}, {"cancelled"}, {"released"}),
+    "bad": (set(), {"pending"}, {"held"}),
+}
+
+
+def prepare(db_url, order_count):
+    """Products with enough stock and `order_count` unpaid Payme orders holding it"""
+    use_database(db_url)
+    from benchmarks.dataset import generate
+    from database import SessionLocal, Order, Product
+    from inventory import reserve_stock
+    from numbering import next_number
+
+    generate(products=20, orders=0, bookings=0)
+    # Номера берутся до транзакции: next_number пишет через свое соединение
+    numbers = [next_number("ORD") for _ in range(order_count)]
+    db = SessionLocal()
+    try:
+        db.query(Product).update({"stock_quantity": order_count, "in_stock": True}, synchronize_session=False)
+        products = db.query(Product.id, Product.price).order_by(Product.id).all()
+        rnd = random.Random(11)
+        orders = []
+        for number in numbers:
+            product = rnd.choice(products)
+            order = Order(order_number=number, customer_data=json.dumps(CUSTOMER),
+                          items=json.dumps([{"productId": product.id, "quantity": 1, "price": product.price}]),
+                          subtotal=product.price, shipping=0, total=product.price,
+                          payment_method="payme", delivery_method="pickup", status="pending")
+            db.add(order)
+            reserve_stock(db, order, [(product.id, 1)], hold=True)
+            orders.append((order.order_number, int(round(product.price * 100))))
+        db.commit()
+        return orders
+    finally:
+        db.close()
+
+
+class Simulator:
+    """Sends the calls, records latency per method and every response that broke the protocol"""
+
+    def __init__(self, client, auth):
+        self.client = client
+        self.headers = {"Authorization": auth}
+        self.latencies = defaultdict(list)
+        self.violations = []
+        self.calls = 0
+
+    async def call(self, method, params, expect, headers=None):
+        """expect: "result" or a set of acceptable results / error codes ("result" among them)"""
+        body = {"jsonrpc": "2.0", "id": random.randint(1, 10**9), "method": method, "params": params}
+        started = time.perf_counter()
+        try:
+            response = await self.client.post("/api/payme/callback", json=body, headers=headers or self.headers)
+            reply = response.json()
+        except Exception as e:
+            self.violations.append(f"{method}: {type(e).__name__}: {e}")
+            return None
+        self.latencies[method].append((time.perf_counter() - started) * 1000)
+        self.calls += 1
+        outcome = reply["error"]["code"] if "error" in reply else "result"
+        accepted = {expect} if isinstance(expect, (str, int)) else expect
+        if outcome not in accepted:
+            self.violations.append(f"{method}: got {outcome}, expected {sorted(map(str, accepted))}")
+        elif "error" not in reply and reply.get("id") != body["id"]:
+            self.violations.append(f"{method}: response id {reply.get('id')} != request id {body['id']}")
+        return reply
+
+    async def many(self, count, method, params, expect):
+        return await asyncio.gather(*(self.call(method, params, expect) for _ in range(count)))
+
+
+def new_id():
+    return uuid.uuid4().hex[:24]
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+async def scenario_pay(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    trans_id = new_id()
+    await sim.call("CheckPerformTransaction", {"amount": amount, "account": account}, "result")
+    await sim.call("CreateTransaction", {"id": trans_id, "time": now_ms(), "amount": amount, "account": account},
+                   "result")
+    await sim.call("PerformTransaction", {"id": trans_id}, "result")
+    reply = await sim.call("CheckTransaction", {"id": trans_id}, "result")
+    if reply and reply.get("result", {}).get("state") != 2:
+        sim.violations.append(f"CheckTransaction after Perform: state {reply['result'].get('state')}")
+
+
+async def scenario_cancel(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    trans_id = new_id()
+    await sim.call("CheckPerformTransaction", {"amount": amount, "account": account}, "result")
+    await sim.call("CreateTransaction", {"id": trans_id, "time": now_ms(), "amount": amount, "account": account},
+                   "result")
+    await sim.call("CancelTransaction", {"id": trans_id, "reason": 3}, "result")
+    # Повторная отмена отвечает тем же состоянием, оплата отмененной - ошибка
+    await sim.call("CancelTransaction", {"id": trans_id, "reason": 3}, "result")
+    await sim.call("PerformTransaction", {"id": trans_id}, -31008)
+
+
+async def scenario_refund(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    trans_id = new_id()
+    await sim.call("CreateTransaction", {"id": trans_id, "time": now_ms(), "amount": amount, "account": account},
+                   "result")
+    await sim.call("PerformTransaction", {"id": trans_id}, "result")
+    await sim.call("CancelTransaction", {"id": trans_id, "reason": 5}, "result")
+    await sim.call("CheckPerformTransaction", {"amount": amount, "account": account}, -31051)
+
+
+async def scenario_expired(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    trans_id = new_id()
+    await sim.call("CreateTransaction", {"id": trans_id, "time": now_ms() - 13 * HOUR_MS, "amount": amount,
+                                         "account": account}, "result")
+    await sim.call("PerformTransaction", {"id": trans_id}, -31008)
+    reply = await sim.call("CheckTransaction", {"id": trans_id}, "result")
+    if reply and reply.get("result", {}).get("reason") != 4:
+        sim.violations.append(f"CheckTransaction after timeout: reason {reply['result'].get('reason')}")
+
+
+async def scenario_duplicate(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    trans_id = new_id()
+    params = {"id": trans_id, "time": now_ms(), "amount": amount, "account": account}
+    await sim.many(args.duplicates, "CheckPerformTransaction", {"amount": amount, "account": account}, "result")
+    created = await sim.many(args.duplicates, "CreateTransaction", params, "result")
+    performed = await sim.many(args.duplicates, "PerformTransaction", {"id": trans_id}, "result")
+    # Все копии должны описывать одну и ту же транзакцию
+    for name, replies in (("CreateTransaction", created), ("PerformTransaction", performed)):
+        answers = {json.dumps(r["result"], sort_keys=True) for r in replies if r and "result" in r}
+        if len(answers) > 1:
+            sim.violations.append(f"{name} duplicates answered differently: {sorted(answers)}")
+
+
+async def scenario_reordered(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    trans_id, rival_id = new_id(), new_id()
+    await sim.call("PerformTransaction", {"id": trans_id}, -31003)
+    await sim.call("CancelTransaction", {"id": trans_id, "reason": 3}, -31003)
+    await sim.call("CheckTransaction", {"id": trans_id}, -31003)
+    replies = await asyncio.gather(
+        sim.call("CreateTransaction", {"id": trans_id, "time": now_ms(), "amount": amount, "account": account},
+                 {"result", -31050}),
+        sim.call("CreateTransaction", {"id": rival_id, "time": now_ms(), "amount": amount, "account": account},
+                 {"result", -31050}),
+    )
+    winners = [(trans_id, rival_id)[i] for i, r in enumerate(replies) if r and "result" in r]
+    if len(winners) != 1:
+        sim.violations.append(f"Racing CreateTransaction: {len(winners)} transactions created for one order")
+        return
+    await sim.call("PerformTransaction", {"id": winners[0]}, "result")
+
+
+async def scenario_race(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    trans_id = new_id()
+    await sim.call("CreateTransaction", {"id": trans_id, "time": now_ms(), "amount": amount, "account": account},
+                   "result")
+    await asyncio.gather(sim.call("PerformTransaction", {"id": trans_id}, {"result", -31008}),
+                         sim.call("CancelTransaction", {"id": trans_id, "reason": 3}, "result"))
+
+
+async def scenario_bad(sim, order_number, amount, args):
+    account = {"order_id": order_number}
+    await sim.call("CheckPerformTransaction", {"amount": amount + 100000, "account": account}, -31001)
+    await sim.call("CheckPerformTransaction", {"amount": amount, "account": {"order_id": "ORD-MISSING"}}, -31050)
+    await sim.call("CreateTransaction", {"id": new_id(), "time": now_ms(), "amount": amount // 2,
+                                         "account": account}, -31001)
+    wrong = "Basic " + base64.b64encode(f"{BENCH_PAYME_MERCHANT_ID}:wrong-key".encode()).decode()
+    await sim.call("CheckPerformTransaction", {"amount": amount, "account": account}, -32504,
+                   headers={"Authorization": wrong})
+
+
+SCENARIOS = {
+    "pay": scenario_pay,
+    "cancel": scenario_cancel,
+    "refund": scenario_refund,
+    "expired": scenario_expired,
+    "duplicate": scenario_duplicate,
+    "reordered": scenario_reordered,
+    "race": scenario_race,
+    "bad": scenario_bad,
+}
+
+
+def parse_mix(value):
+    """'pay=5,race=1' -> weights; unknown scenario names are rejected"""
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}'. Available: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def assign(orders, mix, seed):
+    """{order_number: scenario}, every scenario of the mix used at least once"""
+    rnd = random.Random(seed)
+    names = list(mix)
+    picked = names[:len(orders)] + rnd.choices(names, [mix[n] for n in names], k=max(0, len(orders) - len(names)))
+    rnd.shuffle(picked)
+    return {number: name for (number, _), name in zip(orders, picked)}
+
+
+async def drive(base_url, orders, plan, args):
+    import httpx
+
+    auth = "Basic " + base64.b64encode(f"{BENCH_PAYME_MERCHANT_ID}:{BENCH_PAYME_KEY}".encode()).decode()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * args.duplicates)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        sim = Simulator(client, auth)
+
+        async def run_one(order_number, amount):
+            async with semaphore:
+                await SCENARIOS[plan[order_number]](sim, order_number, amount, args)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_one(number, amount) for number, amount in orders))
+        elapsed = time.perf_counter() - started
+
+        # GetStatement за весь прогон должен вернуть все транзакции
+        statement = await sim.call("GetStatement", {"from": 0, "to": now_ms() + HOUR_MS}, "result")
+    listed = {tx["id"] for tx in statement["result"]["transactions"]} if statement and "result" in statement else set()
+    return sim, elapsed, listed
+
+
+def verify(plan, listed):
+    """Final DB state per order vs EXPECTED; returns {check: passed} and the mismatches"""
+    from sqlalchemy import func
+
+    from database import SessionLocal, Order, Product, StockReservation, Transaction
+
+    db = SessionLocal()
+    try:
+        statuses = dict(db.query(Order.order_number, Order.status))
+        order_ids = dict(db.query(Order.order_number, Order.id))
+        states = defaultdict(list)
+        for order_number, state in db.query(Transaction.order_id, Transaction.state):
+            states[order_number].append(state)
+        reservations = defaultdict(set)
+        for order_id, status in db.query(StockReservation.order_id, StockReservation.status):
+            reservations[order_id].add(status)
+        payme_ids = {payme_id for (payme_id,) in db.query(Transaction.payme_trans_id)}
+        negative_stock = db.query(func.count(Product.id)).filter(Product.stock_quantity < 0).scalar()
+    finally:
+        db.close()
+
+    mismatches = []
+    for order_number, scenario in plan.items():
+        tx_states, order_statuses, reservation_statuses = EXPECTED[scenario]
+        seen = states.get(order_number, [])
+        # Ровно одна транзакция на заказ (проигравший CreateTransaction не оставляет записи), в bad - ни одной
+        if (len(seen) != 1 or seen[0] not in tx_states) if tx_states else seen:
+            mismatches.append(f"{order_number} ({scenario}): transaction states {seen}")
+        if statuses.get(order_number) not in order_statuses:
+            mismatches.append(f"{order_number} ({scenario}): order {statuses.get(order_number)}")
+        if reservations.get(order_ids.get(order_number)) != reservation_statuses:
+            mismatches.append(f"{order_number} ({scenario}): reservations "
+                              f"{sorted(reservations.get(order_ids.get(order_number), ()))}")
+    checks = {
+        "final_states": not mismatches,
+        "statement_complete": listed == payme_ids,
+        "no_negative_stock": negative_stock == 0,
+    }
+    return checks, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payme Merchant API simulator against /api/payme/callback")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--orders", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64, help="Orders paid at the same time")
+    parser.add_argument("--duplicates", type=int, default=4, help="Copies of each call in the duplicate scenario")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="e.g. pay=5,duplicate=2,race=1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    args = parser.parse_args()
+    args.mix = args.mix or dict(DEFAULT_MIX)
+
+    with bench_workdir(keep=args.keep) as workdir:
+        db_url = f"sqlite:///{os.path.join(workdir, 'payme.db')}"
+        orders = prepare(db_url, args.orders)
+        plan = assign(orders, args.mix, args.seed)
+        # Резервы не должны истекать сами по себе во время прогона
+        with running_server(bench_env(db_url, workdir, {"STOCK_SWEEP_INTERVAL": "0", "PAYME_EXPIRY_INTERVAL": "0"}),
+                            workers=args.workers) as base_url:
+            sim, elapsed, listed = asyncio.run(drive(base_url, orders, plan, args))
+        checks, mismatches = verify(plan, listed)
+    checks["protocol"] = not sim.violations
+
+    latency = {method: summarize_latencies(values) for method, values in sorted(sim.latencies.items())}
+    scenarios = defaultdict(int)
+    for name in plan.values():
+        scenarios[name] += 1
+    print(f"💳 {len(orders)} orders, {sim.calls} callback calls in {elapsed:.2f}s ({sim.calls / elapsed:.0f}/s)")
+    print(f"   scenarios: {', '.join(f'{name} {count}' for name, count in sorted(scenarios.items()))}")
+    print(f"\n{'method':<26} {'calls':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for method, lat in latency.items():
+        print(f"{method:<26} {len(sim.latencies[method]):>7} {lat['p50']:>8.1f} {lat['p95']:>8.1f} "
+              f"{lat['p99']:>8.1f} {lat['max']:>8.1f}")
+    print()
+    for name, passed in checks.items():
+        print(f"   {'✅' if passed else '❌'} {name}")
+    for problem in (sorted(set(sim.violations)) + mismatches)[:10]:
+        print(f"   ❌ {problem}")
+    if args.output:
+        write_results(args.output, {
+            "meta": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+            "orders": len(orders), "calls": sim.calls, "seconds": round(elapsed, 3),
+            "calls_per_second": round(sim.calls / elapsed, 1), "scenarios": dict(scenarios),
+            "latency_ms": latency, "checks": checks,
+            "violations": len(sim.violations), "mismatches": len(mismatches),
+        })
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
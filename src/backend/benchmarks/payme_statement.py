@@ -0,0 +1,228 @@
+"""
+Payme GetStatement over large time windows: the old handler (every transaction of the window as
+an ORM object, account json-decoded per row, one dict encoded by FastAPI) against the streamed
+one in routes/payme.py (range scan on transactions.time, column projection, account spliced in).
+
+Every measurement runs in a fresh process so peak RSS belongs to that statement alone. Both
+answers are compared (same transactions, same fields) for windows up to --verify-rows.
+
+Usage (from src/backend):
+    python -m benchmarks.payme_statement --transactions 1000000
+    python -m benchmarks.payme_statement --transactions 1000000 --http --output results/statement.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+
+from benchmarks.common import (
+    BENCH_PAYME_KEY, BENCH_PAYME_MERCHANT_ID, bench_env, bench_workdir, running_server, use_database, write_results,
+)
+
+WINDOWS = {"day": 1, "week": 7, "month": 31, "quarter": 92, "year": 366}
+DAY_MS = 24 * 3600 * 1000
+CHUNK = 50_000
+
+
+def prepare(db_url, count):
+    """`count` transactions over the last year, inserted in chunks; returns "now" (ms), where every window ends"""
+    use_database(db_url)
+    from benchmarks.dataset import _batched_insert, generate, transaction_rows
+    from database import engine, Transaction
+
+    generate(products=10, orders=0, bookings=0, transactions=0)
+    rnd = random.Random(42)
+    now_ms = int(time.time() * 1000)
+    with engine.begin() as conn:
+        for offset in range(0, count, CHUNK):
+            _batched_insert(conn, Transaction, transaction_rows(min(CHUNK, count - offset), [], rnd, now_ms, offset))
+    return now_ms
+
+
+def _memory_mb(field):
+    """VmRSS / VmHWM (peak RSS) of this process from /proc (Linux)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _reset_peak():
+    # "5" сбрасывает VmHWM до текущего RSS, пик импорта не попадает в замер
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def legacy_statement(start, end):
+    """GetStatement before streaming, including the JSONResponse encoding FastAPI did"""
+    from fastapi.encoders import jsonable_encoder
+
+    from database import SessionLocal, Transaction
+
+    db = SessionLocal()
+    try:
+        transactions = db.query(Transaction).filter(Transaction.time >= start, Transaction.time <= end).all()
+        content = {"result": {"transactions": [{
+            "id": tx.payme_trans_id,
+            "time": tx.time,
+            "amount": tx.amount,
+            "account": json.loads(tx.account) if tx.account else {},
+            "create_time": tx.create_time,
+            "perform_time": tx.perform_time,
+            "cancel_time": tx.cancel_time,
+            "transaction": str(tx.id),
+            "state": tx.state,
+            "reason": tx.reason
+        } for tx in transactions]}, "id": 1}
+        yield json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":"))
+    finally:
+        db.close()
+
+
+def streamed_statement(start, end):
+    from routes.payme import statement_chunks
+
+    return statement_chunks(start, end, 1)
+
+
+IMPLEMENTATIONS = {"legacy": legacy_statement, "streamed": streamed_statement}
+
+
+def _measure(db_url, implementation, start, end, repeat, keep_body):
+    """Child process: [(first chunk ms, total ms, bytes)] per run, peak RSS growth (MB), body of the last run"""
+    use_database(db_url)
+    import routes.payme  # noqa: F401 - импорт не должен попасть в замер памяти
+
+    _reset_peak()
+    baseline = _memory_mb("VmRSS")
+    runs, body = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        first, size, parts = None, 0, []
+        for chunk in IMPLEMENTATIONS[implementation](start, end):
+            if first is None:
+                first = (time.perf_counter() - started) * 1000
+            size += len(chunk.encode())
+            if keep_body:
+                parts.append(chunk)
+        runs.append((first, (time.perf_counter() - started) * 1000, size))
+        body = "".join(parts) if keep_body else None
+        del parts
+    return runs, round(_memory_mb("VmHWM") - baseline, 1), body
+
+
+def measure(db_url, implementation, start, end, repeat, keep_body):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_measure, (db_url, implementation, start, end, repeat, keep_body))
+
+
+def same_statement(legacy_body, streamed_body):
+    """Same transactions with the same fields (the old handler had no ORDER BY)"""
+    by_id = lambda body: sorted(json.loads(body)["result"]["transactions"], key=lambda tx: tx["id"])
+    return by_id(legacy_body) == by_id(streamed_body)
+
+
+def measure_http(db_url, workdir, windows, now_ms):
+    """POST GetStatement to uvicorn and read the streamed answer: {window: (first byte ms, total ms, bytes)}"""
+    import base64
+
+    import httpx
+
+    auth = "Basic " + base64.b64encode(f"{BENCH_PAYME_MERCHANT_ID}:{BENCH_PAYME_KEY}".encode()).decode()
+    results = {}
+    with running_server(bench_env(db_url, workdir, {"STOCK_SWEEP_INTERVAL": "0"})) as base_url:
+        with httpx.Client(base_url=base_url, timeout=300) as client:
+            for name, days in windows.items():
+                body = {"jsonrpc": "2.0", "id": 1, "method": "GetStatement",
+                        "params": {"from": now_ms - days * DAY_MS, "to": now_ms}}
+                started = time.perf_counter()
+                first, size = None, 0
+                with client.stream("POST", "/api/payme/callback", json=body, headers={"Authorization": auth}) as r:
+                    for chunk in r.iter_bytes():
+                        if first is None:
+                            first = (time.perf_counter() - started) * 1000
+                        size += len(chunk)
+                results[name] = (round(first, 1), round((time.perf_counter() - started) * 1000, 1), size)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GetStatement: ORM list vs streamed range scan")
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--windows", default=",".join(WINDOWS), help=f"Subset of {', '.join(WINDOWS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--verify-rows", type=int, default=200_000,
+                        help="Compare both answers for windows with up to this many rows")
+    parser.add_argument("--budget-ms", type=float, default=5000,
+                        help="Streamed statements of --budget-windows slower than this fail the run")
+    parser.add_argument("--budget-windows", default="day,week,month,quarter",
+                        help="Windows Payme asks for in reconciliation; the rest is only reported")
+    parser.add_argument("--http", action="store_true", help="Also fetch the streamed statements through uvicorn")
+    parser.add_argument("--output")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    args = parser.parse_args()
+    windows = {name: WINDOWS[name] for name in args.windows.split(",")}
+
+    results = {}
+    with bench_workdir(keep=args.keep) as workdir:
+        db_url = f"sqlite:///{os.path.join(workdir, 'statement.db')}"
+        started = time.perf_counter()
+        now_ms = prepare(db_url, args.transactions)
+        print(f"🧾 {args.transactions} transactions generated in {time.perf_counter() - started:.1f}s")
+
+        from database import engine, Transaction
+        from sqlalchemy import func, select
+
+        print(f"\n{'window':<8} {'rows':>8} {'impl':<9} {'first ms':>9} {'total ms':>9} {'MB out':>7} "
+              f"{'peak MB':>8}")
+        for name, days in windows.items():
+            start, end = now_ms - days * DAY_MS, now_ms
+            with engine.connect() as conn:
+                rows = conn.execute(select(func.count(Transaction.id))
+                                    .where(Transaction.time >= start, Transaction.time <= end)).scalar()
+            verify = rows <= args.verify_rows
+            entry = {"rows": rows}
+            bodies = {}
+            for implementation in IMPLEMENTATIONS:
+                runs, peak_mb, bodies[implementation] = measure(db_url, implementation, start, end,
+                                                                args.repeat, verify)
+                first = round(statistics.median(r[0] for r in runs), 1)
+                total = round(statistics.median(r[1] for r in runs), 1)
+                size_mb = round(runs[-1][2] / 2**20, 1)
+                entry[implementation] = {"first_chunk_ms": first, "total_ms": total, "mb": size_mb,
+                                         "peak_rss_mb": peak_mb}
+                print(f"{name:<8} {rows:>8} {implementation:<9} {first:>9.1f} {total:>9.1f} {size_mb:>7.1f} "
+                      f"{peak_mb:>8.1f}")
+            if verify:
+                entry["same_answer"] = same_statement(bodies["legacy"], bodies["streamed"])
+            results[name] = entry
+
+        http = measure_http(db_url, workdir, windows, now_ms) if args.http else {}
+    if http:
+        print(f"\n{'window':<8} {'first byte ms':>14} {'total ms':>9} {'MB':>7}   (HTTP, streamed)")
+        for name, (first, total, size) in http.items():
+            print(f"{name:<8} {first:>14.1f} {total:>9.1f} {size / 2**20:>7.1f}")
+            results[name]["http"] = {"first_byte_ms": first, "total_ms": total, "bytes": size}
+
+    checks = {
+        "same_answer": all(entry.get("same_answer", True) for entry in results.values()),
+        "within_budget": all(entry["streamed"]["total_ms"] <= args.budget_ms
+                             and entry.get("http", {}).get("total_ms", 0) <= args.budget_ms
+                             for name, entry in results.items() if name in args.budget_windows.split(",")),
+    }
+    print()
+    for name, passed in checks.items():
+        print(f"   {'✅' if passed else '❌'} {name}")
+    if args.output:
+        write_results(args.output, {"meta": {key: value for key, value in vars(args).items()
+                                             if key not in ("output", "keep")},
+                                    "windows": results, "checks": checks})
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+"""
+Query-plan regression check for hot routes.
+
+Builds a scaled dataset, calls every hot route and runs every background job (scheduler.py)
+in-process while capturing the SQL it issues, then runs EXPLAIN QUERY PLAN on each statement. A full-table SCAN (no index) or a
+temp B-tree sort fails the check, so a dropped or missing index is caught before release.
+Small configuration tables (admins, settings, content blocks) are allowed to be scanned.
+
+Usage (from src/backend):
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --products 20000 --orders 100000 --verbose
+Exit code is 1 when any hot query has a bad plan.
+"""
+import argparse
+import base64
+import os
+import re
+import sys
+import time
+
+from benchmarks.common import BENCH_PAYME_KEY, BENCH_PAYME_MERCHANT_ID, bench_workdir, use_database
+
+# Маршруты, для которых важны индексы: (название, метод, путь, параметры, тело payme)
+HOT_ROUTES = [
+    ("collection products", "GET", "/api/collections/classic/products", {"limit": 50}, None),
+    ("product detail", "GET", "/api/products/bench-watch-10", None, None),
+    ("admin products", "GET", "/api/admin/products", {"page": 2, "limit": 100}, None),
+    ("admin orders", "GET", "/api/admin/orders", {"page": 3, "limit": 20}, None),
+    ("admin orders by status", "GET", "/api/admin/orders", {"status": "pending", "page": 2, "limit": 20}, None),
+    ("admin order detail", "GET", "/api/admin/orders/ORD-BENCH-0000042", None, None),
+    ("admin recent orders", "GET", "/api/admin/orders/recent", {"limit": 10}, None),
+    ("admin stats", "GET", "/api/admin/stats", None, None),
+    ("admin product orders", "GET", "/api/admin/analytics/products/bench-watch-10/orders", {"page": 2, "limit": 20}, None),
+    ("admin bookings", "GET", "/api/admin/bookings", {"page": 2, "limit": 20}, None),
+    ("admin bookings by status", "GET", "/api/admin/bookings", {"status": "pending", "limit": 20}, None),
+    ("admin bookings stats", "GET", "/api/admin/bookings/stats/summary", None, None),
+    ("admin payme status", "GET", "/api/admin/payme/status/ORD-BENCH-0000042", None, None),
+    ("payme CheckPerformTransaction", "POST", "/api/payme/callback", None,
+     ("CheckPerformTransaction", {"account": {"order_id": "ORD-BENCH-0000042"}})),
+    ("payme CreateTransaction", "POST", "/api/payme/callback", None,
+     ("CreateTransaction", {"id": "plan-check-tx", "account": {"order_id": "ORD-BENCH-0000043"}})),
+    ("payme CheckTransaction", "POST", "/api/payme/callback", None, ("CheckTransaction", {"id": "plan-check-tx"})),
+    ("payme GetStatement", "POST", "/api/payme/callback", None,
+     ("GetStatement", {"from": 0, "to": 0})),  # окно подставляется ниже
+]
+
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+# Таблицы, которые не растут вместе с трафиком
+SMALL_TABLES = {
+    "users", "settings", "collections", "filter_options", "promocodes", "content_hero", "content_site_logo",
+    "content_promo_banner", "content_heritage", "content_boutique", "content_policies", "content_history_events",
+}
+_SCAN_RE = re.compile(r"^SCAN (\w+)(.*)$")
+
+
+def plan_problems(plan_lines, table_names):
+    """Problems in an EXPLAIN QUERY PLAN output: bare table scans and temp B-tree sorts"""
+    problems = []
+    for line in plan_lines:
+        match = _SCAN_RE.match(line)
+        if match and match.group(1) in table_names and "INDEX" not in match.group(2) \
+                and "INTEGER PRIMARY KEY" not in match.group(2):
+            problems.append(f"full scan: {line}")
+        if "USE TEMP B-TREE" in line:
+            problems.append(f"temp sort: {line}")
+    return problems
+
+
+def report(name, statements, table_names, verbose):
+    """EXPLAIN every captured statement, print the verdict; returns 1 if any plan is bad"""
+    from database import engine
+
+    problems_found = []
+    with engine.connect() as conn:
+        raw = conn.connection.dbapi_connection
+        for statement, parameters in statements:
+            rows = raw.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+            plan = [row[-1] for row in rows]
+            problems = plan_problems(plan, table_names)
+            if problems:
+                problems_found.append((statement, plan, problems))
+            elif verbose:
+                print(f"   {' '.join(statement.split())[:110]}\n      → {'; '.join(plan)}")
+
+    if not problems_found:
+        print(f"✅ {name} ({len(statements)} queries)")
+        return 0
+    print(f"❌ {name} ({len(statements)} queries)")
+    for statement, plan, problems in problems_found:
+        print(f"   {' '.join(statement.split())[:160]}")
+        for problem in problems:
+            print(f"      ⚠️ {problem}")
+    return 1
+
+
+def run_check(args):
+    from sqlalchemy import event
+    from fastapi.testclient import TestClient
+
+    from benchmarks.dataset import generate
+    print(f"🧪 Generating dataset: {args.products} products, {args.orders} orders ...")
+    generate(products=args.products, orders=args.orders, bookings=args.bookings, transactions=args.orders)
+
+    import main
+    from auth import require_admin
+    from database import engine, Base
+
+    table_names = set(Base.metadata.tables) - SMALL_TABLES
+    main.app.dependency_overrides[require_admin] = lambda: None
+    payme_auth = "Basic " + base64.b64encode(f"{BENCH_PAYME_MERCHANT_ID}:{BENCH_PAYME_KEY}".encode()).decode()
+    now_ms = int(time.time() * 1000)
+    with engine.connect() as conn:
+        totals = dict(conn.exec_driver_sql(
+            "SELECT order_number, total FROM orders WHERE order_number IN ('ORD-BENCH-0000042', 'ORD-BENCH-0000043')"
+        ).fetchall())
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip()[:6].upper() in EXPLAINABLE:
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    failures = 0
+    try:
+        with TestClient(main.app) as client:
+            for name, method, path, params, payme in HOT_ROUTES:
+                captured.clear()
+                if payme:
+                    rpc_method, rpc_params = payme
+                    if "account" in rpc_params:
+                        rpc_params = dict(rpc_params, amount=int(totals[rpc_params["account"]["order_id"]] * 100))
+                    if rpc_method == "GetStatement":
+                        rpc_params = {"from": now_ms - 3 * 24 * 3600 * 1000, "to": now_ms}
+                    if rpc_method == "CreateTransaction":
+                        rpc_params = dict(rpc_params, time=now_ms)
+                    response = client.post(path, headers={"Authorization": payme_auth},
+                                           json={"id": 1, "method": rpc_method, "params": rpc_params})
+                else:
+                    response = client.request(method, path, params=params)
+                if response.status_code >= 500:
+                    print(f"❌ {name}: HTTP {response.status_code}")
+                    failures += 1
+                    continue
+
+                failures += report(name, list(captured), table_names, args.verbose)
+
+            # Фоновые задачи (scheduler.py) ходят по тем же таблицам, что и маршруты
+            from scheduler import JOBS
+            for job in JOBS:
+                captured.clear()
+                job.run()
+                failures += report(f"job {job.name}", list(captured), table_names, args.verbose)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN regression check for hot routes")
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--verbose", action="store_true", help="Print plans of passing queries too")
+    args = parser.parse_args()
+
+    with bench_workdir() as workdir:
+        use_database(f"sqlite:///{os.path.join(workdir, 'plans.db')}")
+        os.environ.update({
+            "PAYME_MERCHANT_ID": BENCH_PAYME_MERCHANT_ID,
+            "PAYME_KEY": BENCH_PAYME_KEY,
+            "DIST_DIR": os.path.join(workdir, "dist"),
+        })
+        failures = run_check(args)
+
+    if failures:
+        print(f"\n❌ {failures} hot route(s) / job(s) have full scans or temp sorts")
+        sys.exit(1)
+    print("\n✅ All hot queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Local stub of the Telegram Bot API and a burst test for the notification dispatcher.
+
+The stub answers POST /bot<token>/sendMessage like Telegram does: it enforces a per-chat
+rate limit with 429 + parameters.retry_after, fails a share of requests with 502 and
+records every delivered message and the client connections it came over.
+
+Usage (from src/backend):
+    # burst of orders -> outbox -> dispatcher -> stub, reports delivery time, digests, retries
+    python -m benchmarks.telegram_stub run --orders 300 --chats 3 --fail-rate 0.1
+    python -m benchmarks.telegram_stub run --orders 300 --output results/telegram.json
+
+    # standalone stub for a dev server: TELEGRAM_API_URL=http://127.0.0.1:8081 uvicorn main:app
+    python -m benchmarks.telegram_stub serve --port 8081
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from benchmarks.common import bench_workdir, free_port, use_database, write_results
+
+BENCH_BOT_TOKEN = "123456:bench-token"
+
+
+class StubState:
+    def __init__(self, chat_interval, fail_rate, seed=1):
+        self.chat_interval = chat_interval
+        self.fail_rate = fail_rate
+        self.rnd = random.Random(seed)
+        self.last_sent = {}
+        self.messages = []
+        self.connections = set()
+        self.counts = {"requests": 0, "rate_limited": 0, "failed": 0}
+
+
+def create_stub_app(state):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+
+    @app.post("/bot{token}/sendMessage")
+    async def send_message(token: str, request: Request):
+        state.counts["requests"] += 1
+        state.connections.add(tuple(request.scope.get("client") or ()))
+        if token != BENCH_BOT_TOKEN:
+            return JSONResponse({"ok": False, "error_code": 401, "description": "Unauthorized"}, status_code=401)
+        payload = await request.json()
+        chat_id = str(payload.get("chat_id"))
+        if not chat_id or not payload.get("text"):
+            return JSONResponse({"ok": False, "error_code": 400, "description": "Bad Request: message text is empty"},
+                                status_code=400)
+        if len(payload["text"]) > 4096:
+            return JSONResponse({"ok": False, "error_code": 400, "description": "Bad Request: message is too long"},
+                                status_code=400)
+
+        if state.rnd.random() < state.fail_rate:
+            state.counts["failed"] += 1
+            return JSONResponse({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status_code=502)
+
+        now = time.monotonic()
+        wait = state.last_sent.get(chat_id, -math.inf) + state.chat_interval - now
+        if wait > 0:
+            state.counts["rate_limited"] += 1
+            retry_after = math.ceil(wait)
+            return JSONResponse({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }, status_code=429)
+
+        state.last_sent[chat_id] = now
+        state.messages.append({"chat_id": chat_id, "text": payload["text"], "at": now})
+        return {"ok": True, "result": {"message_id": len(state.messages), "chat": {"id": chat_id}}}
+
+    return app
+
+
+def start_stub(state, port):
+    """Run the stub with uvicorn in a daemon thread; returns the server (set should_exit to stop)"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(create_stub_app(state), host="127.0.0.1", port=port,
+                                           log_level="warning", access_log=False))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Stub server did not start")
+        time.sleep(0.05)
+    return server
+
+
+def run_burst(args):
+    # Лимиты диспетчера читаются при импорте telegram_bot
+    os.environ.setdefault("TELEGRAM_POLL_INTERVAL", "0.2")
+    from sqlalchemy import func
+
+    from database import init_db, SessionLocal, Settings, Order, NotificationOutbox
+    from telegram_bot import TelegramDispatcher, notify_new_order
+
+    init_db()
+    chat_ids = [str(-1001000000000 - i) for i in range(args.chats)]
+    db = SessionLocal()
+    try:
+        db.add(Settings(id=1, telegram_bot_token=BENCH_BOT_TOKEN, telegram_chat_ids=",".join(chat_ids)))
+        db.commit()
+        started = time.perf_counter()
+        for i in range(args.orders):
+            order = Order(
+                order_number=f"ORD-TG-{i:06d}",
+                customer_data=json.dumps({"fullName": f"Клиент {i}", "phone": "+998901234567"}),
+                items=json.dumps([{"productId": "1", "quantity": 1}]),
+                subtotal=1_500_000, shipping=0, total=1_500_000,
+                payment_method="cash", delivery_method="pickup", status="pending",
+            )
+            db.add(order)
+            notify_new_order(db, order)
+            db.commit()
+        enqueue_seconds = time.perf_counter() - started
+        queued = db.query(NotificationOutbox).count()
+    finally:
+        db.close()
+    print(f"📨 {args.orders} orders, {queued} outbox rows in {enqueue_seconds:.2f}s")
+
+    state = StubState(args.chat_interval, args.fail_rate)
+    port = free_port()
+    server = start_stub(state, port)
+
+    async def deliver():
+        dispatcher = TelegramDispatcher(api_url=f"http://127.0.0.1:{port}")
+        await dispatcher.start()
+        started = time.perf_counter()
+        try:
+            while True:
+                db = SessionLocal()
+                try:
+                    left = db.query(NotificationOutbox).filter(
+                        NotificationOutbox.status.in_(("pending", "sending"))).count()
+                finally:
+                    db.close()
+                if not left or time.perf_counter() - started > args.timeout:
+                    break
+                dispatcher.wake()
+                await asyncio.sleep(0.1)
+        finally:
+            await dispatcher.stop()
+        return time.perf_counter() - started, left, dispatcher.stats
+
+    try:
+        elapsed, left, stats = asyncio.run(deliver())
+    finally:
+        server.should_exit = True
+
+    db = SessionLocal()
+    try:
+        statuses = dict(db.query(NotificationOutbox.status, func.count()).group_by(NotificationOutbox.status))
+    finally:
+        db.close()
+
+    delivered_orders = sum(message["text"].count("🔔 <b>Новый заказ!</b>") for message in state.messages)
+    results = {
+        "meta": {"orders": args.orders, "chats": args.chats, "chat_interval": args.chat_interval,
+                 "fail_rate": args.fail_rate},
+        "enqueue_seconds": round(enqueue_seconds, 3),
+        "delivery_seconds": round(elapsed, 3),
+        "outbox": statuses,
+        "http_requests": state.counts["requests"],
+        "rate_limited": state.counts["rate_limited"],
+        "stub_failures": state.counts["failed"],
+        "messages": len(state.messages),
+        "digests": stats["digests"],
+        "notifications_delivered": delivered_orders,
+        "notifications_expected": queued,
+        "connections": len(state.connections),
+    }
+    print(f"✅ delivered {delivered_orders}/{queued} notifications in {elapsed:.2f}s "
+          f"as {len(state.messages)} messages ({stats['digests']} digests)")
+    print(f"   HTTP requests: {state.counts['requests']}, 429: {state.counts['rate_limited']}, "
+          f"502: {state.counts['failed']}, connections: {len(state.connections)}, outbox: {statuses}")
+    if left:
+        print(f"⚠️ {left} rows still pending after {args.timeout}s")
+    if args.output:
+        write_results(args.output, results)
+    return 0 if delivered_orders == queued and not left else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telegram Bot API stub and notification dispatcher burst test")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Order burst through the outbox and dispatcher against the stub")
+    run.add_argument("--orders", type=int, default=300)
+    run.add_argument("--chats", type=int, default=3)
+    run.add_argument("--chat-interval", type=float, default=1.0, help="Stub per-chat limit, seconds")
+    run.add_argument("--fail-rate", type=float, default=0.05, help="Share of requests answered with 502")
+    run.add_argument("--timeout", type=float, default=120)
+    run.add_argument("--output")
+    run.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+
+    serve = sub.add_parser("serve", help="Run the stub only")
+    serve.add_argument("--port", type=int, default=8081)
+    serve.add_argument("--chat-interval", type=float, default=1.0)
+    serve.add_argument("--fail-rate", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        import uvicorn
+        state = StubState(args.chat_interval, args.fail_rate)
+        print(f"🤖 Telegram stub on http://127.0.0.1:{args.port} (token {BENCH_BOT_TOKEN})")
+        uvicorn.run(create_stub_app(state), host="127.0.0.1", port=args.port, log_level="info")
+        return 0
+
+    with bench_workdir(keep=args.keep) as workdir:
+        use_database(f"sqlite:///{os.path.join(workdir, 'telegram.db')}")
+        return run_burst(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
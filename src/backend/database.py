@@ -2,14 +2,15 @@
 Database configuration and connection
 SQLite database with SQLAlchemy ORM
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey, JSON,BigInteger,event
+from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey, JSON,BigInteger,event,Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 import json
+import os
 
-# Database URL
-DATABASE_URL = "sqlite:////var/www/orient/src/backend/orient.db"
+# Database URL (ORIENT_DATABASE_URL позволяет поднять приложение на другой базе, например для бенчмарков)
+DATABASE_URL = os.getenv("ORIENT_DATABASE_URL", "sqlite:////var/www/orient/src/backend/orient.db")
 
 # Create engine
 engine = create_engine(
@@ -85,12 +86,16 @@ class Product(Base):
     # Facebook Open Graph fields
     fb_title = Column(String, nullable=True)
     fb_description = Column(Text, nullable=True)
+
+    # schema.org JSON-LD (structured_data.py), собирается при записи товара
+    structured_data = Column(Text, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # сортировка в админке
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
-        return {
+    def to_dict(self, assets=None):
+        """assets: {"/uploads/..": variants} from image_pipeline.product_assets(), adds imageVariants"""
+        data = {
             "id": str(self.id),
             "name": self.name,
             "collection": self.collection,
@@ -120,6 +125,110 @@ class Product(Base):
             "createdAt": self.created_at.isoformat() if self.created_at else None,
             "updatedAt": self.updated_at.isoformat() if self.updated_at else None,
         }
+        if assets is not None:
+            from image_pipeline import variants_for
+            data["imageVariants"] = variants_for([data["image"], *data["images"]], assets)
+        return data
+
+
+class ImageAsset(Base):
+    """Адаптивные варианты загруженной картинки (WebP/AVIF разной ширины) и данные для плейсхолдера"""
+    __tablename__ = "image_assets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, unique=True, index=True)  # "/uploads/<file>" оригинала
+    width = Column(Integer)
+    height = Column(Integer)
+    variants = Column(Text)  # JSON: [{"width": 320, "format": "webp", "url": "/uploads/variants/..."}]
+    color = Column(String)  # доминирующий цвет "#rrggbb"
+    placeholder = Column(Text)  # LQIP: "data:image/webp;base64,..." 16px
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        srcset = {}
+        for variant in json.loads(self.variants) if self.variants else []:
+            srcset.setdefault(variant["format"], []).append(f'{variant["url"]} {variant["width"]}w')
+        return {
+            "width": self.width,
+            "height": self.height,
+            "color": self.color,
+            "placeholder": self.placeholder,
+            "srcset": {fmt: ", ".join(items) for fmt, items in srcset.items()},
+        }
+
+
+class UploadRef(Base):
+    """Какая строка (товар, контент) использует какой загруженный файл"""
+    __tablename__ = "upload_refs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, nullable=False, index=True)  # "/uploads/ab/cd/<sha256>.jpg"
+    sha256 = Column(String, index=True)  # None для старых файлов с uuid-именем
+    owner_type = Column(String, nullable=False)  # product, collection, hero, boutique, history, logo
+    owner_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_upload_refs_owner", "owner_type", "owner_id"),
+    )
+
+
+class NotificationOutbox(Base):
+    """Исходящие Telegram-уведомления; пишутся в одной транзакции с заказом / записью"""
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # order_new, order_status, booking_new, booking_status
+    chat_id = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # для sending - конец аренды
+    claim_token = Column(String, nullable=True)  # какой воркер забрал сообщение
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Выборка диспетчера: готовые к отправке по времени
+        Index("ix_notification_outbox_status_next", "status", "next_attempt_at"),
+        Index("ix_notification_outbox_claim", "claim_token"),
+    )
+
+
+class IdempotencyKey(Base):
+    """
+    Ответы на POST /api/orders и /api/bookings с заголовком Idempotency-Key: повтор запроса
+    получает сохраненный ответ. processing - запрос выполняется (expires_at = конец блокировки),
+    done - ответ сохранен до expires_at
+    """
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String, nullable=False)  # orders, bookings
+    key = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)  # sha256 тела запроса
+    claim_token = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="processing")  # processing, done
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ux_idempotency_keys_scope_key", "scope", "key", unique=True),
+        # Очистка истекших ключей
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+
+class NumberSequence(Base):
+    """Счетчики номеров документов по дням: name = "ORD-20260101", value = последний выданный номер"""
+    __tablename__ = "number_sequences"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
 
 
 class ContentBoutique(Base):
@@ -150,7 +259,7 @@ class Transaction(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     payme_trans_id = Column(String, unique=True, index=True)  # ID транзакции из Payme
-    time = Column(BigInteger)  # Время создания (timestamp ms)
+    time = Column(BigInteger, index=True)  # Время создания (timestamp ms), диапазон для GetStatement
     amount = Column(Integer)
     account = Column(Text)  # JSON с параметрами аккаунта (order_id)
     create_time = Column(BigInteger)
@@ -161,6 +270,17 @@ class Transaction(Base):
 
     # Связь с заказом (по order_id строковому)
     order_id = Column(String, ForeignKey("orders.order_number"))
+
+    __table_args__ = (
+        # Поиск активной транзакции заказа (CreateTransaction) и статус оплаты в админке
+        Index("ix_transactions_order_id_state", "order_id", "state"),
+        # Не больше одной созданной (state = 1) транзакции на заказ - и при одновременных CreateTransaction
+        Index("ux_transactions_order_active", "order_id", unique=True,
+              sqlite_where=state == 1, postgresql_where=state == 1),
+        # Фоновое истечение: созданные транзакции старше 12 часов (scheduler.py)
+        Index("ix_transactions_active_create_time", "create_time",
+              sqlite_where=state == 1, postgresql_where=state == 1),
+    )
 class ContentPolicy(Base):
     __tablename__ = "content_policies"
 
@@ -221,10 +341,66 @@ class Order(Base):
     delivery_method = Column(String)
     delivery_address = Column(Text)  # JSON object
     notes = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user = relationship("User", back_populates="orders")
+    order_items = relationship("OrderItem", back_populates="order", order_by="OrderItem.id")
+    stock_reservations = relationship("StockReservation", back_populates="order")
+
+    __table_args__ = (
+        # Список заказов в админке: фильтр по статусу + сортировка по дате
+        Index("ix_orders_status_created_at", "status", "created_at"),
+    )
+
+class OrderItem(Base):
+    """Строки заказа (копия Order.items) со снимком товара на момент покупки - для аналитики продаж"""
+    __tablename__ = "order_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(String, nullable=False)  # без FK: товар могут удалить, продажи остаются
+    sku = Column(String)
+    name = Column(String)
+    collection = Column(String)
+    quantity = Column(Integer, nullable=False, default=1)
+    unit_price = Column(Float, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)  # = дата заказа, чтобы отчеты по периоду шли по индексу
+
+    order = relationship("Order", back_populates="order_items")
+
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+        # Заказы товара (новые первыми), продажи товара за период
+        Index("ix_order_items_product_created", "product_id", "created_at"),
+        # Сводки за период: по товарам и по коллекциям
+        Index("ix_order_items_created", "created_at"),
+        Index("ix_order_items_collection_created", "collection", "created_at"),
+    )
+
+class StockReservation(Base):
+    """
+    Товар, списанный со склада под заказ (только для товаров с учетом остатка, stock_quantity > 0).
+    held - ждет оплаты Payme до expires_at, committed - продан, released - возвращен на склад
+    """
+    __tablename__ = "stock_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="held")  # held, committed, released
+    expires_at = Column(DateTime, nullable=True)  # только для held
+    created_at = Column(DateTime, default=datetime.utcnow)
+    released_at = Column(DateTime, nullable=True)
+
+    order = relationship("Order", back_populates="stock_reservations")
+
+    __table_args__ = (
+        # Поиск истекших резервов
+        Index("ix_stock_reservations_status_expires", "status", "expires_at"),
+        Index("ix_stock_reservations_order_id", "order_id"),
+    )
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -239,9 +415,14 @@ class Booking(Base):
     message = Column(Text, nullable=True)
     status = Column(String, default="pending")  # pending, confirmed, completed, cancelled
     boutique = Column(String, default="Orient Ташкент")
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Список записей в админке: фильтр по статусу + сортировка по дате
+        Index("ix_bookings_status_created_at", "status", "created_at"),
+    )
+
 class ContentSiteLogo(Base):
     __tablename__ = "content_site_logo"
     
@@ -0,0 +1,103 @@
+"""
+Garbage collection for uploads.
+Set difference between files on disk and image URLs referenced from the database
+(products, collections, hero, boutique, history, logo, order items, upload_refs).
+Unreferenced originals, their WebP/AVIF variants and image_assets rows are removed.
+
+Dry run by default:
+    python gc_uploads.py
+    python gc_uploads.py --delete --min-age-hours 24
+Files younger than --min-age-hours are kept: an image uploaded in the admin panel is not
+referenced until the product/content form is saved.
+"""
+import argparse
+import os
+import time
+
+from database import SessionLocal, UploadRef, ImageAsset
+from image_pipeline import VARIANTS_SUBDIR
+from storage import UPLOAD_DIR, UPLOAD_URL_PREFIX, collect_references, upload_path
+
+KEEP_FILES = {".gitkeep"}
+
+
+def referenced_paths(db):
+    paths = {upload_path(url) for _, _, url in collect_references(db)}
+    paths.update(path for (path,) in db.query(UploadRef.path))
+    paths.discard(None)
+    return paths
+
+
+def scan_uploads(root):
+    """{'/uploads/<relative path>': (size, mtime)} for originals and variants"""
+    originals, variants = {}, {}
+    for dirpath, _, filenames in os.walk(root):
+        relative_dir = os.path.relpath(dirpath, root).replace(os.sep, "/")
+        target = variants if relative_dir == VARIANTS_SUBDIR or relative_dir.startswith(f"{VARIANTS_SUBDIR}/") else originals
+        for name in filenames:
+            if name in KEEP_FILES:
+                continue
+            relative = name if relative_dir == "." else f"{relative_dir}/{name}"
+            stat = os.stat(os.path.join(dirpath, name))
+            target[UPLOAD_URL_PREFIX + relative] = (stat.st_size, stat.st_mtime)
+    return originals, variants
+
+
+def variant_stem(path):
+    """'/uploads/variants/<stem>-640w.webp' -> '<stem>'"""
+    return os.path.basename(path).rsplit("-", 1)[0]
+
+
+def original_stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def gc(delete=False, min_age_hours=24):
+    db = SessionLocal()
+    try:
+        referenced = referenced_paths(db)
+        originals, variants = scan_uploads(UPLOAD_DIR)
+        cutoff = time.time() - min_age_hours * 3600
+
+        orphans = {path for path in originals.keys() - referenced if originals[path][1] < cutoff}
+        live_stems = {original_stem(path) for path in originals.keys() - orphans}
+        orphan_variants = {
+            path for path, (_, mtime) in variants.items() if variant_stem(path) not in live_stems and mtime < cutoff
+        }
+
+        orphan_bytes = sum(originals[p][0] for p in orphans) + sum(variants[p][0] for p in orphan_variants)
+        missing = sorted(path for path in referenced if path not in originals)
+        print(f"📁 {len(originals)} files, {len(variants)} variants on disk, {len(referenced)} referenced")
+        print(f"🗑️  {len(orphans)} orphan files + {len(orphan_variants)} variants ({orphan_bytes / 1024 / 1024:.1f} MB)")
+        if missing:
+            print(f"⚠️ {len(missing)} referenced files are missing on disk, e.g. {missing[0]}")
+
+        if not delete:
+            for path in sorted(orphans)[:20]:
+                print(f"   {path}")
+            print("Dry run. Re-run with --delete to remove them.")
+            return
+
+        for path in sorted(orphans | orphan_variants):
+            try:
+                os.remove(os.path.join(UPLOAD_DIR, path[len(UPLOAD_URL_PREFIX):]))
+            except FileNotFoundError:
+                pass
+        if orphans:
+            db.query(ImageAsset).filter(ImageAsset.path.in_(orphans)).delete(synchronize_session=False)
+            db.commit()
+        print(f"✅ Removed {len(orphans) + len(orphan_variants)} files")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove uploads no database row refers to")
+    parser.add_argument("--delete", action="store_true", help="Actually delete (default: dry run)")
+    parser.add_argument("--min-age-hours", type=float, default=24)
+    args = parser.parse_args()
+    gc(delete=args.delete, min_age_hours=args.min_age_hours)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Idempotency-Key for POST /api/orders and /api/bookings: a retried request gets the stored
+response instead of creating a second order (and a second Telegram notification).
+
+    - the first request with a key inserts an idempotency_keys row (INSERT ... ON CONFLICT DO
+      NOTHING in its own short transaction), so concurrent duplicates are serialized by the
+      unique index without holding any lock while the order is written
+    - the response is stored in the order's own transaction (claim.save before commit):
+      either both the order and its response are committed or neither is
+    - a duplicate arriving while the first is still running waits up to IDEMPOTENCY_WAIT
+      seconds for its response, then gets 503 with Retry-After: the one answer of these
+      endpoints that means "send the same request again" (409 is out of stock, a final refusal)
+    - a failed request releases the key; a worker that died mid-request holds it for
+      IDEMPOTENCY_LOCK_SECONDS at most
+    - the same key with a different body is rejected with 422
+Requests without the header work as before.
+
+Settings (env):
+    IDEMPOTENCY_TTL           - hours a stored response is replayed, default 24
+    IDEMPOTENCY_LOCK_SECONDS  - how long a running request holds its key, default 30
+    IDEMPOTENCY_WAIT          - seconds a concurrent duplicate waits for the response, default 10
+"""
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import DateTime, bindparam, text
+
+from database import engine, IdempotencyKey
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "24"))
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "10"))
+MAX_KEY_LENGTH = 255
+RETRY_AFTER = "1"  # секунд до повтора для дубликата, чей первый запрос еще выполняется
+
+_INSERT = text(
+    "INSERT INTO idempotency_keys (scope, key, fingerprint, claim_token, status, created_at, expires_at) "
+    "VALUES (:scope, :key, :fingerprint, :token, 'processing', :now, :lock_until) "
+    "ON CONFLICT (scope, key) DO NOTHING RETURNING id"
+).bindparams(bindparam("now", type_=DateTime), bindparam("lock_until", type_=DateTime))
+# Истекший ответ или брошенная блокировка - ключ можно занять заново
+_TAKE_OVER = text(
+    "UPDATE idempotency_keys SET fingerprint = :fingerprint, claim_token = :token, status = 'processing', "
+    "response_code = NULL, response_body = NULL, created_at = :now, expires_at = :lock_until "
+    "WHERE scope = :scope AND key = :key AND expires_at < :now"
+).bindparams(bindparam("now", type_=DateTime), bindparam("lock_until", type_=DateTime))
+_LOOKUP = text(
+    "SELECT fingerprint, status, response_code, response_body FROM idempotency_keys "
+    "WHERE scope = :scope AND key = :key"
+)
+_RELEASE = text("DELETE FROM idempotency_keys WHERE claim_token = :token AND status = 'processing'")
+
+
+def fingerprint(payload):
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+
+class IdempotencyClaim:
+    """
+    Result of claim(): `replay` is the stored response for a repeated request, otherwise the
+    caller runs the request inside `with claim:` and calls claim.save(response) before commit.
+    """
+
+    def __init__(self, db, scope=None, key=None, token=None, replay=None):
+        self.db = db
+        self.scope = scope
+        self.key = key
+        self.token = token
+        self.replay = replay
+
+    def save(self, response, status_code=200):
+        """Store the response in the caller's transaction"""
+        if self.token is None:
+            return
+        db = self.db
+        stored = db.query(IdempotencyKey).filter(IdempotencyKey.claim_token == self.token,
+                                                 IdempotencyKey.status == "processing").update({
+            IdempotencyKey.status: "done",
+            IdempotencyKey.response_code: status_code,
+            IdempotencyKey.response_body: json.dumps(jsonable_encoder(response), ensure_ascii=False),
+            IdempotencyKey.expires_at: datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL),
+        }, synchronize_session=False)
+        if not stored:
+            # Блокировка истекла и ключ занял повтор - этот запрос не должен ничего записать
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Idempotency-Key was taken over by a retried request")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # Откат сразу, а не при закрытии сессии после ответа: снимает блокировку записи
+            self.db.rollback()
+            if self.token is not None:
+                with engine.begin() as conn:
+                    conn.execute(_RELEASE, {"token": self.token})
+        return False
+
+
+def _replay(row):
+    return JSONResponse(content=json.loads(row.response_body), status_code=row.response_code,
+                        headers={"Idempotent-Replayed": "true"})
+
+
+async def claim(db, scope, key, payload):
+    """Claim the key for this request or return the stored response (IdempotencyClaim.replay)"""
+    if key is None:
+        return IdempotencyClaim(db)
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    params = {"scope": scope, "key": key, "fingerprint": fingerprint(payload)}
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT
+    delay = 0.05
+    while True:
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        with engine.begin() as conn:
+            values = {**params, "token": token, "now": now,
+                      "lock_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}
+            if conn.execute(_INSERT, values).first() or conn.execute(_TAKE_OVER, values).rowcount:
+                return IdempotencyClaim(db, scope, key, token)
+            row = conn.execute(_LOOKUP, params).first()
+
+        if row is None:
+            continue  # ключ удалили между запросами - пробуем занять снова
+        if row.fingerprint != params["fingerprint"]:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if row.status == "done":
+            return IdempotencyClaim(db, scope, key, replay=_replay(row))
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(status_code=503, detail="A request with this Idempotency-Key is still in progress",
+                                headers={"Retry-After": RETRY_AFTER})
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def purge_expired(db, now=None):
+    """Delete expired responses and abandoned claims; returns the number of rows removed"""
+    return db.query(IdempotencyKey).filter(IdempotencyKey.expires_at < (now or datetime.utcnow())) \
+        .delete(synchronize_session=False)
@@ -0,0 +1,251 @@
+"""
+Responsive image variants.
+After an upload the original is resized to the configured widths and transcoded to WebP
+(and optionally AVIF) in a process pool, off the request path. The same pass records the
+size, the dominant color and a tiny blurred WebP (LQIP data URI) for placeholders. Results
+are stored in image_assets and exposed ("imageVariants") next to the original URL.
+
+Settings (env):
+    IMAGE_VARIANT_WIDTHS   - comma separated widths, default 320,640,960,1280,1920
+    IMAGE_VARIANT_FORMATS  - webp and/or avif, default webp
+    IMAGE_VARIANT_QUALITY  - encoder quality, default 80
+    IMAGE_PIPELINE_WORKERS - worker processes, default 2
+"""
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+from PIL import UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, ImageAsset
+from storage import UPLOAD_DIR, UPLOAD_URL_PREFIX
+
+logger = logging.getLogger("orient.images")
+
+VARIANTS_SUBDIR = "variants"
+
+VARIANT_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,960,1280,1920").split(",") if w.strip()))
+VARIANT_FORMATS = tuple(f.strip().lower() for f in os.getenv("IMAGE_VARIANT_FORMATS", "webp").split(",") if f.strip())
+VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+PIPELINE_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", "2"))
+
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+PLACEHOLDER_SIZE = 16  # px по большей стороне, ~200-400 байт в base64
+
+_pool = None
+
+
+def asset_key(url):
+    """'/uploads/<file>' for images stored in our uploads dir (full or relative URL), else None"""
+    if not url:
+        return None
+    path = urlparse(url).path
+    if not path.startswith(UPLOAD_URL_PREFIX) or path.startswith(f"{UPLOAD_URL_PREFIX}{VARIANTS_SUBDIR}/"):
+        return None
+    if os.path.splitext(path)[1].lower() not in SOURCE_EXTENSIONS:
+        return None
+    return path
+
+
+def _open_normalized(source_path):
+    """Open an image upright in RGB / RGBA"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+        image.load()
+    return image
+
+
+def image_meta(image):
+    """Dominant color ("#rrggbb", transparent areas count as white) and LQIP data URI of an RGB(A) image"""
+    from PIL import Image
+
+    small = image.copy()
+    small.thumbnail((64, 64))
+    if small.mode == "RGBA":
+        background = Image.new("RGB", small.size, (255, 255, 255))
+        background.paste(small, mask=small.getchannel("A"))
+        small = background
+    palette = small.quantize(colors=5)
+    _, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+
+    thumb = image.copy()
+    thumb.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = io.BytesIO()
+    thumb.save(buffer, "WEBP", quality=40)
+    return {
+        "color": f"#{r:02x}{g:02x}{b:02x}",
+        "placeholder": "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def render_meta(source_path):
+    """Runs in a worker process: size, dominant color and placeholder only (backfill)"""
+    image = _open_normalized(source_path)
+    return {"width": image.width, "height": image.height, **image_meta(image)}
+
+
+def render_variants(source_path, output_dir, stem, widths, formats, quality):
+    """
+    Runs in a worker process: resize + transcode one image.
+    Widths larger than the original are skipped; the original width is always included.
+    Returns {"width", "height", "color", "placeholder", "variants": [{"width", "format", "file"}]}.
+    """
+    from PIL import Image, features
+
+    os.makedirs(output_dir, exist_ok=True)
+    image = _open_normalized(source_path)
+    width, height = image.size
+    targets = [w for w in widths if w < width] + [width]
+    variants = []
+    for fmt in formats:
+        if fmt == "avif" and not features.check("avif"):
+            continue
+        for target in targets:
+            resized = image if target == width else image.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS
+            )
+            filename = f"{stem}-{target}w.{fmt}"
+            resized.save(os.path.join(output_dir, filename), fmt.upper(), quality=quality)
+            variants.append({"width": target, "format": fmt, "file": filename})
+
+    return {"width": width, "height": height, **image_meta(image), "variants": variants}
+
+
+def render_resized(source_path, dest_path, width, height, fmt, quality):
+    """
+    Runs in a worker process: fit the image into width x height (0 = no limit, never upscales)
+    and write it to dest_path atomically.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if fmt == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+        image.thumbnail((width or image.width, height or image.height), Image.LANCZOS)
+        tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, fmt.upper(), quality=quality)
+    os.replace(tmp_path, dest_path)
+    return os.path.getsize(dest_path)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PIPELINE_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def save_asset(key, result):
+    """Insert or refresh the image_assets row for one original (result without "variants" = metadata only)"""
+    db = SessionLocal()
+    try:
+        asset = db.query(ImageAsset).filter(ImageAsset.path == key).first()
+        if not asset:
+            asset = ImageAsset(path=key)
+            db.add(asset)
+        asset.width = result["width"]
+        asset.height = result["height"]
+        asset.color = result["color"]
+        asset.placeholder = result["placeholder"]
+        if "variants" in result:
+            asset.variants = json.dumps([
+                {"width": v["width"], "format": v["format"], "url": f"{UPLOAD_URL_PREFIX}{VARIANTS_SUBDIR}/{v['file']}"}
+                for v in result["variants"]
+            ])
+        asset.updated_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+def asset_exists(key):
+    db = SessionLocal()
+    try:
+        return db.query(ImageAsset.id).filter(ImageAsset.path == key).first() is not None
+    finally:
+        db.close()
+
+
+async def process_upload(url):
+    """Background task: generate and record variants for an uploaded image"""
+    key = asset_key(url)
+    # Файлы адресуются по содержимому: повторная загрузка - те же варианты
+    if key is None or await run_in_threadpool(asset_exists, key):
+        return
+    source_path = os.path.join(UPLOAD_DIR, key[len(UPLOAD_URL_PREFIX):])
+    stem = os.path.splitext(os.path.basename(key))[0]
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            get_pool(), render_variants, source_path, os.path.join(UPLOAD_DIR, VARIANTS_SUBDIR),
+            stem, VARIANT_WIDTHS, VARIANT_FORMATS, VARIANT_QUALITY,
+        )
+        await run_in_threadpool(save_asset, key, result)
+    except UnidentifiedImageError:
+        logger.warning("Not an image, no variants for %s", key)
+    except Exception:
+        logger.exception("Failed to build image variants for %s", key)
+
+
+async def process_uploads(urls):
+    """Background task for batch uploads: all images go to the pool at once"""
+    await asyncio.gather(*(process_upload(url) for url in urls))
+
+
+def load_assets(db, urls):
+    """{asset key: srcset data} for the given image URLs, one query"""
+    keys = {key for key in map(asset_key, urls) if key}
+    if not keys:
+        return {}
+    rows = db.query(ImageAsset).filter(ImageAsset.path.in_(keys)).all()
+    return {row.path: row.to_dict() for row in rows}
+
+
+def product_assets(db, products):
+    """Batch-load variants for the main image and gallery of several products"""
+    urls = []
+    for product in products:
+        urls.append(product.image)
+        if product.images:
+            try:
+                urls.extend(json.loads(product.images))
+            except (ValueError, TypeError):
+                pass
+    return load_assets(db, urls)
+
+
+def variants_for(urls, assets):
+    """{original url: srcset data} for the URLs that have variants"""
+    result = {}
+    for url in urls:
+        key = asset_key(url)
+        if key in assets:
+            result[url] = assets[key]
+    return result
+
+
+def image_variants(db, urls):
+    """Shortcut for content endpoints: {original url: srcset data}"""
+    return variants_for(urls, load_assets(db, urls))
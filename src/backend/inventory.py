@@ -0,0 +1,229 @@
+"""
+Stock: products are taken off the shelf inside the order transaction, never oversold.
+
+    - a product with stock_quantity > 0 is tracked: checkout runs
+      UPDATE products SET stock_quantity = stock_quantity - :q ... WHERE stock_quantity >= :q
+      and the order fails with 409 if any line doesn't fit; selling the last unit sets in_stock = 0
+    - in_stock = 1 with stock_quantity = 0 means the stock isn't tracked (made to order) -
+      such products are sold without limits, as before
+    - what was taken is recorded in stock_reservations:
+        held      - Payme order waiting for payment, until expires_at (STOCK_RESERVATION_TTL after
+                    checkout, extended to the Payme transaction timeout by CreateTransaction)
+        committed - sold (PerformTransaction, or any other payment method at checkout)
+        released  - returned to stock (CancelTransaction, order cancelled in the admin, hold expired)
+    - every status change is a compare-and-set on the reservation row, so a release racing with
+      the expiry sweep or a repeated callback never returns stock twice
+
+Products whose in_stock flips get their JSON-LD availability rebuilt in the same transaction;
+the caller drops their cached pages after commit (invalidate_product_pages).
+
+Expired holds are released by the "stock_holds" job of scheduler.py.
+
+Settings (env):
+    STOCK_RESERVATION_TTL   - minutes an unpaid Payme order holds stock, default 30
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import update, or_
+
+from database import SessionLocal, Order, Product, StockReservation
+
+logger = logging.getLogger("orient.inventory")
+
+STOCK_RESERVATION_TTL = float(os.getenv("STOCK_RESERVATION_TTL", "30"))
+PAYME_HOLD = timedelta(milliseconds=43200000)  # тайм-аут транзакции Payme - 12 часов
+
+# Способы оплаты, при которых товар держится до оплаты, а не продается сразу
+HOLD_PAYMENT_METHODS = ("payme",)
+RESERVATION_STATUSES = ("held", "committed", "released")
+
+
+class OutOfStock(HTTPException):
+    """Not enough stock for one or more cart lines"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # [{"productId", "name", "requested", "available"}]
+        names = ", ".join(f"{s['name'] or s['productId']} (в наличии: {s['available']})" for s in shortages)
+        super().__init__(status_code=409, detail=f"Недостаточно товара на складе: {names}")
+
+
+def _take(db, product_id, quantity):
+    """Conditional decrement; returns the remaining stock or None if it didn't fit"""
+    remaining = db.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.in_stock == True, Product.stock_quantity >= quantity)
+        .values(stock_quantity=Product.stock_quantity - quantity, in_stock=Product.stock_quantity > quantity)
+        .returning(Product.stock_quantity)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    return remaining
+
+
+def _put_back(db, product_id, quantity):
+    """Return stock; a sold-out product is back on sale, one hidden by the admin stays hidden"""
+    return db.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock_quantity=Product.stock_quantity + quantity,
+                in_stock=or_(Product.in_stock == True, Product.stock_quantity == 0))
+        .returning(Product.stock_quantity)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+
+def reserve_stock(db, order, lines, hold=False):
+    """
+    Take [(product_id, quantity)] for the order in the caller's transaction (before commit).
+    Raises OutOfStock - the caller must not commit then; rolling back returns what was taken.
+    Returns ids of products that sold out.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(minutes=STOCK_RESERVATION_TTL) if hold else None
+    sold_out, shortages = [], []
+    # Один порядок строк во всех заказах - блокировки строк в Postgres не перекрещиваются
+    for product_id, quantity in sorted(lines):
+        remaining = _take(db, product_id, quantity)
+        if remaining is None:
+            product = db.query(Product.name, Product.in_stock, Product.stock_quantity) \
+                .filter(Product.id == product_id).first()
+            if product and product.in_stock and not product.stock_quantity:
+                continue  # остаток не ведется
+            shortages.append({"productId": product_id, "name": product.name if product else None,
+                              "requested": quantity,
+                              "available": product.stock_quantity if product and product.in_stock else 0})
+            continue
+        if remaining == 0:
+            sold_out.append(product_id)
+        order.stock_reservations.append(StockReservation(
+            product_id=product_id, quantity=quantity, status="held" if hold else "committed",
+            expires_at=expires_at, created_at=now,
+        ))
+    if shortages:
+        raise OutOfStock(shortages)
+    refresh_availability(db, sold_out)
+    return sold_out
+
+
+def reserve_order_stock(db, order, hold=None):
+    """reserve_stock for an order's lines (order_items); hold defaults to the payment method rule"""
+    lines = {}
+    for item in order.order_items:
+        lines[item.product_id] = lines.get(item.product_id, 0) + item.quantity
+    if hold is None:
+        hold = order.payment_method in HOLD_PAYMENT_METHODS
+    return reserve_stock(db, order, list(lines.items()), hold=hold)
+
+
+def _set_status(db, order_id, from_statuses, values):
+    """Compare-and-set reservations of the order; returns the rows this call moved"""
+    rows = db.query(StockReservation.id, StockReservation.product_id, StockReservation.quantity) \
+        .filter(StockReservation.order_id == order_id, StockReservation.status.in_(from_statuses)).all()
+    moved = []
+    for row in rows:
+        changed = db.query(StockReservation) \
+            .filter(StockReservation.id == row.id, StockReservation.status.in_(from_statuses)) \
+            .update(values, synchronize_session=False)
+        if changed:
+            moved.append(row)
+    return moved
+
+
+def release_order_stock(db, order_id, statuses=("held", "committed")):
+    """Return the order's stock (cancelled order / payment); returns ids of products back on sale"""
+    back_on_sale = []
+    for row in _set_status(db, order_id, statuses, {"status": "released", "released_at": datetime.utcnow()}):
+        if _put_back(db, row.product_id, row.quantity) == row.quantity:
+            back_on_sale.append(row.product_id)
+    refresh_availability(db, back_on_sale)
+    return back_on_sale
+
+
+def release_orders_stock(db, order_ids, statuses=("held",)):
+    """
+    release_order_stock for a batch of orders: one UPDATE ... RETURNING for the reservations,
+    one _put_back per product. Returns (reservations released, ids of products back on sale).
+    """
+    if not order_ids:
+        return 0, []
+    # Статус - через NOT IN: на "status IN" SQLite без ANALYZE берет индекс (status, expires_at)
+    # и обходит все удерживаемые резервы вместо резервов этих заказов
+    others = [status for status in RESERVATION_STATUSES if status not in statuses]
+    released = db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_id.in_(order_ids), StockReservation.status.notin_(others))
+        .values(status="released", released_at=datetime.utcnow())
+        .returning(StockReservation.product_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    quantities = {}
+    for product_id, quantity in released:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    back_on_sale = [product_id for product_id, quantity in sorted(quantities.items())
+                    if _put_back(db, product_id, quantity) == quantity]
+    refresh_availability(db, back_on_sale)
+    return len(released), back_on_sale
+
+
+def commit_order_stock(db, order_id):
+    """Paid: held -> committed, the stock stays taken"""
+    return len(_set_status(db, order_id, ("held",), {"status": "committed", "expires_at": None}))
+
+
+def extend_hold(db, order_id, until):
+    """Keep held stock until `until` (Payme transaction created - it may be paid for 12 hours)"""
+    return db.query(StockReservation) \
+        .filter(StockReservation.order_id == order_id, StockReservation.status == "held") \
+        .update({"expires_at": until}, synchronize_session=False)
+
+
+def release_expired(db, now=None):
+    """
+    Release holds past expires_at; an order that still waits for payment with nothing held is
+    cancelled (a transaction created later gets "order cancelled"). Returns (orders, product ids back on sale).
+    """
+    now = now or datetime.utcnow()
+    # Без DISTINCT: строк у заказа единицы, а сортировка для DISTINCT шла бы мимо индекса
+    order_ids = sorted({order_id for (order_id,) in db.query(StockReservation.order_id).filter(
+        StockReservation.status == "held", StockReservation.expires_at < now)})
+    _, back_on_sale = release_orders_stock(db, order_ids)
+    if order_ids:
+        db.query(Order).filter(Order.id.in_(order_ids), Order.status == "pending") \
+            .update({"status": "cancelled"}, synchronize_session=False)
+    return order_ids, back_on_sale
+
+
+def refresh_availability(db, product_ids):
+    """Rebuild JSON-LD (schema.org availability) of products whose in_stock flipped"""
+    if not product_ids:
+        return
+    from structured_data import refresh_structured_data
+
+    refresh_structured_data(db, db.query(Product).filter(Product.id.in_(product_ids)).all())
+
+
+def invalidate_product_pages(product_ids):
+    """After commit: drop cached pages of products whose availability changed"""
+    if product_ids:
+        from page_cache import invalidate_pages
+
+        invalidate_pages(*(f"product/{product_id}" for product_id in product_ids))
+
+
+def sweep_expired():
+    """Scheduler job: release expired holds; returns what was swept"""
+    db = SessionLocal()
+    try:
+        order_ids, back_on_sale = release_expired(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    invalidate_product_pages(back_on_sale)
+    if order_ids:
+        logger.info("Released stock of %d unpaid orders", len(order_ids))
+    return {"orders": len(order_ids)}
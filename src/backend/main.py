@@ -10,13 +10,23 @@ load_dotenv()
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 
 # Ваши модули
-from database import init_db
+from database import init_db, engine
+from query_profiler import SQL_PROFILER_ENABLED, QueryProfilerMiddleware, install_query_profiler
+from monitoring import MetricsMiddleware, start_loop_lag_monitor, stop_loop_lag_monitor
+from image_pipeline import shutdown_pool as shutdown_image_pool
+from telegram_bot import DISPATCHER as telegram_dispatcher
+from scheduler import SCHEDULER as scheduler
+from storage import UPLOAD_DIR, UploadLimitMiddleware
+from static_files import CachedStaticFiles, VITE_HASHED_NAME, precompress_assets
 from routes import (
     admin, products, collections, orders, content, upload,
     bookings, products_export, settings, payme, promocodes,
+    analytics,     # Сводки продаж по order_items
+    images,        # /img/{w}x{h}/... ресайз по запросу
+    metrics,       # Prometheus /metrics
     sitemap,       # Sitemap для роботов
     seo_renderer   # Рендер HTML для людей и роботов
 )
@@ -48,15 +58,63 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=3600,
 )
+# Ограничение размера загрузок: 413 сразу при превышении, без буферизации всего тела
+app.add_middleware(UploadLimitMiddleware)
+# Метрики по каждому роуту (латентность, размер ответа, статусы)
+app.add_middleware(MetricsMiddleware)
+
+# Профилирование SQL (SQL_PROFILER=1): счетчик запросов, N+1, медленные запросы
+if SQL_PROFILER_ENABLED:
+    install_query_profiler(engine)
+    app.add_middleware(QueryProfilerMiddleware)
+    print("🔍 SQL profiler enabled")
+
+@app.on_event("startup")
+async def start_monitoring():
+    start_loop_lag_monitor()
+
+@app.on_event("startup")
+async def precompress_static():
+    # STATIC_PRECOMPRESS=1: сжать dist/assets при старте, если не сделали после билда
+    if os.getenv("STATIC_PRECOMPRESS", "0") == "1" and os.path.exists(DIST_ASSETS):
+        count, _, _ = await run_in_threadpool(precompress_assets, DIST_ASSETS)
+        print(f"🗜️ Precompressed {count} asset files")
+
+@app.on_event("startup")
+async def start_telegram_dispatcher():
+    # Доставка уведомлений из notification_outbox
+    await telegram_dispatcher.start()
+
+@app.on_event("shutdown")
+async def stop_telegram_dispatcher():
+    await telegram_dispatcher.stop()
+
+@app.on_event("startup")
+async def start_scheduler():
+    # Фоновые задачи: истекшие резервы товара, транзакции Payme и неоплаченные заказы, Idempotency-Key
+    await scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
+@app.on_event("shutdown")
+async def stop_monitoring():
+    await stop_loop_lag_monitor()
+    shutdown_image_pool()
+
 app.include_router(sitemap.router)
+app.include_router(metrics.router)
 # --- ПОДКЛЮЧЕНИЕ РОУТЕРОВ (API) ---
 app.include_router(admin.router)
 app.include_router(products_export.router)
 app.include_router(products.router)
 app.include_router(collections.router)
 app.include_router(orders.router)
+app.include_router(analytics.router)
 app.include_router(content.router)
 app.include_router(upload.router)
+app.include_router(images.router)
 app.include_router(bookings.router)
 app.include_router(settings.router)
 app.include_router(payme.router)
@@ -66,19 +124,20 @@ app.include_router(promocodes.router)
 # --- ПОДКЛЮЧЕНИЕ СТАТИКИ ---
 
 # 1. Загруженные файлы (картинки товаров)
-upload_dir = os.getenv("UPLOAD_DIR", "uploads")
-if not os.path.exists(upload_dir):
-    os.makedirs(upload_dir)
-app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
+if not os.path.exists(UPLOAD_DIR):
+    os.makedirs(UPLOAD_DIR)
+# Имена по хешу содержимого -> immutable кэш на год
+app.mount("/uploads", CachedStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 # 2. Статика фронтенда (JS/CSS) - Исправленный путь
 # Вычисляем корень проекта (на 3 уровня выше текущего файла)
 BASE_DIR = "/var/www/orient"
-DIST_ASSETS = os.path.join(BASE_DIR, "dist", "assets")
+DIST_ASSETS = os.path.join(os.getenv("DIST_DIR", os.path.join(BASE_DIR, "dist")), "assets")
 
 # Подключаем assets ТОЛЬКО если папка существует (после билда фронтенда)
 if os.path.exists(DIST_ASSETS):
-    app.mount("/assets", StaticFiles(directory=DIST_ASSETS), name="assets")
+    # Vite добавляет хеш в имена файлов; .br/.gz рядом с файлами - от precompress_assets.py
+    app.mount("/assets", CachedStaticFiles(directory=DIST_ASSETS, hashed_name=VITE_HASHED_NAME), name="assets")
     print(f"✅ Assets mounted from: {DIST_ASSETS}")
 else:
     print(f"⚠️ Warning: Assets directory not found at {DIST_ASSETS}. Did you run 'npm run build'?")
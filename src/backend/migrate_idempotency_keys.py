@@ -0,0 +1,15 @@
+"""
+Migration script: idempotency_keys table (Idempotency-Key for POST /api/orders and /api/bookings).
+Run from src/backend:  python migrate_idempotency_keys.py
+"""
+from database import init_db
+
+
+def migrate():
+    print("Running migration: idempotency keys...")
+    init_db()  # create_all: таблица создается, если ее еще нет
+    print("✅ idempotency_keys ready")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,73 @@
+"""
+Migration script: dominant color + LQIP placeholder columns on image_assets, backfilled
+for images processed before they existed.
+Run from src/backend:  python migrate_image_meta.py [--force]
+Only the metadata is computed (variants are left as they are), in a process pool.
+Images that have no image_assets row yet are handled by migrate_image_variants.py.
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sqlalchemy import text
+
+from database import engine, init_db, SessionLocal, ImageAsset
+from image_pipeline import UPLOAD_DIR, UPLOAD_URL_PREFIX, PIPELINE_WORKERS, render_meta, save_asset
+
+COLUMNS = (
+    ("color", "VARCHAR"),
+    ("placeholder", "TEXT"),
+)
+
+
+def add_columns():
+    with engine.connect() as conn:
+        for name, column_type in COLUMNS:
+            try:
+                conn.execute(text(f"ALTER TABLE image_assets ADD COLUMN {name} {column_type}"))
+                print(f"✅ Added {name}")
+            except Exception as e:
+                if "duplicate column name" in str(e):
+                    print(f"ℹ️ {name} already exists")
+                else:
+                    print(f"⚠️ Error adding {name}: {e}")
+        conn.commit()
+
+
+def migrate(force=False):
+    print("Running migration: image metadata...")
+    init_db()
+    add_columns()
+
+    db = SessionLocal()
+    try:
+        query = db.query(ImageAsset.path)
+        if not force:
+            query = query.filter(ImageAsset.placeholder.is_(None))
+        keys = sorted(path for (path,) in query)
+    finally:
+        db.close()
+
+    sources = {key: os.path.join(UPLOAD_DIR, key[len(UPLOAD_URL_PREFIX):]) for key in keys}
+    missing = [key for key, source in sources.items() if not os.path.exists(source)]
+    for key in missing:
+        del sources[key]
+    print(f"  {len(sources)} images to process, {len(missing)} files not found")
+
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=PIPELINE_WORKERS) as pool:
+        futures = {pool.submit(render_meta, source): key for key, source in sources.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                save_asset(key, future.result())
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"  ❌ {key}: {e}")
+
+    print(f"✅ Migration complete! {done} images processed, {failed} failed.")
+
+
+if __name__ == "__main__":
+    migrate(force="--force" in sys.argv)
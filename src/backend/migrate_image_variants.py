@@ -0,0 +1,62 @@
+"""
+Migration script: image_assets table + WebP/AVIF variants for images uploaded before the pipeline.
+Run from src/backend:  python migrate_image_variants.py [--force]
+Already processed images are skipped unless --force is given.
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from database import init_db, SessionLocal, ImageAsset
+from image_pipeline import (
+    UPLOAD_DIR, UPLOAD_URL_PREFIX, VARIANTS_SUBDIR, VARIANT_WIDTHS, VARIANT_FORMATS, VARIANT_QUALITY,
+    PIPELINE_WORKERS, asset_key, render_variants, save_asset,
+)
+from storage import collect_references
+
+
+def collect_keys(db):
+    """All /uploads/ images referenced by products and content blocks"""
+    return {key for key in (asset_key(url) for _, _, url in collect_references(db)) if key}
+
+
+def migrate(force=False):
+    print("Running migration: image variants...")
+    init_db()
+
+    db = SessionLocal()
+    try:
+        keys = collect_keys(db)
+        if not force:
+            keys -= {path for (path,) in db.query(ImageAsset.path)}
+    finally:
+        db.close()
+
+    missing = [key for key in keys if not os.path.exists(os.path.join(UPLOAD_DIR, key[len(UPLOAD_URL_PREFIX):]))]
+    keys = sorted(keys - set(missing))
+    print(f"  {len(keys)} images to process, {len(missing)} referenced files not found")
+
+    output_dir = os.path.join(UPLOAD_DIR, VARIANTS_SUBDIR)
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=PIPELINE_WORKERS) as pool:
+        futures = {
+            pool.submit(
+                render_variants, os.path.join(UPLOAD_DIR, key[len(UPLOAD_URL_PREFIX):]), output_dir,
+                os.path.splitext(os.path.basename(key))[0], VARIANT_WIDTHS, VARIANT_FORMATS, VARIANT_QUALITY,
+            ): key
+            for key in keys
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                save_asset(key, future.result())
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"  ❌ {key}: {e}")
+
+    print(f"✅ Migration complete! {done} images processed, {failed} failed.")
+
+
+if __name__ == "__main__":
+    migrate(force="--force" in sys.argv)
@@ -0,0 +1,23 @@
+"""
+Migration script to add indexes for hot admin / Payme queries
+(orders and bookings by status + date, transactions by order and time, products by date).
+create_all() does not add indexes to existing tables, so they are created here one by one.
+Verify plans afterwards with: python -m benchmarks.query_plans
+"""
+from database import engine, Base
+
+TABLES = ("products", "orders", "bookings", "transactions")
+
+
+def migrate():
+    print("Creating missing indexes...")
+    for table_name in TABLES:
+        table = Base.metadata.tables[table_name]
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            index.create(bind=engine, checkfirst=True)
+            print(f"  ✓ {index.name}")
+    print("✅ Migration complete!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,15 @@
+"""
+Migration script: notification_outbox table (durable Telegram notifications).
+Run from src/backend:  python migrate_notification_outbox.py
+"""
+from database import init_db
+
+
+def migrate():
+    print("Running migration: notification outbox...")
+    init_db()  # create_all: таблица и индексы создаются, если их еще нет
+    print("✅ notification_outbox ready")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,15 @@
+"""
+Migration script: number_sequences table (ORD-YYYYMMDD-NNNNNN / BK-YYYYMMDD-NNNNNN numbers).
+Run from src/backend:  python migrate_number_sequences.py
+"""
+from database import init_db
+
+
+def migrate():
+    print("Running migration: number sequences...")
+    init_db()  # create_all: таблица создается, если ее еще нет
+    print("✅ number_sequences ready")
+
+
+if __name__ == "__main__":
+    migrate()
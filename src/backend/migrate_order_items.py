@@ -0,0 +1,45 @@
+"""
+Migration script: order_items table + backfill from the Order.items JSON of existing orders.
+Run from src/backend:  python migrate_order_items.py
+Safe to re-run: only orders without order_items rows are processed.
+"""
+import json
+
+from database import init_db, SessionLocal, Order, OrderItem
+from order_items import product_snapshots, make_order_items
+
+BATCH_SIZE = 1000
+
+
+def migrate():
+    print("Running migration: order items...")
+    init_db()  # create_all: таблица и индексы
+
+    db = SessionLocal()
+    try:
+        has_items = db.query(OrderItem.id).filter(OrderItem.order_id == Order.id).exists()
+        ids = [order_id for (order_id,) in db.query(Order.id).filter(~has_items).order_by(Order.id)]
+        print(f"  {len(ids)} orders to backfill")
+        lines = broken = 0
+        for i in range(0, len(ids), BATCH_SIZE):
+            orders = db.query(Order.id, Order.items, Order.created_at).filter(Order.id.in_(ids[i:i + BATCH_SIZE])).all()
+            decoded = {}
+            for order in orders:
+                try:
+                    decoded[order.id] = json.loads(order.items) if order.items else []
+                except ValueError:
+                    broken += 1
+            snapshots = product_snapshots(db, [item.get("productId") for items in decoded.values() for item in items])
+            for order in orders:
+                for row in make_order_items(decoded.get(order.id, []), snapshots, order.created_at):
+                    row.order_id = order.id
+                    db.add(row)
+                    lines += 1
+            db.commit()
+        print(f"✅ {lines} order items written" + (f", ⚠️ {broken} orders with unreadable items" if broken else ""))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
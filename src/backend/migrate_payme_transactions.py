@@ -0,0 +1,68 @@
+"""
+Migration script for the Payme callback state machine:
+  - partial unique index: one created (state = 1) transaction per order
+  - "[Payme Transaction] {json}" lines of Order.notes (written by the old callback) are moved
+    to the transactions table where it has no row for them yet, and removed from the notes
+Run from src/backend:  python migrate_payme_transactions.py
+Safe to re-run.
+"""
+import json
+
+from sqlalchemy.exc import IntegrityError
+
+from database import engine, SessionLocal, Order, Transaction
+from payme_legacy import MARKER, get_transaction_data, strip_transaction_data
+
+ACTIVE_INDEX = "ux_transactions_order_active"
+
+
+def create_active_index():
+    index = next(i for i in Transaction.__table__.indexes if i.name == ACTIVE_INDEX)
+    try:
+        index.create(bind=engine, checkfirst=True)
+        print(f"  ✓ {ACTIVE_INDEX}")
+    except IntegrityError:
+        print(f"  ⚠️ {ACTIVE_INDEX} not created: some orders have several transactions in state 1.")
+        print("     Cancel the extra ones (CancelTransaction or state = -1) and run the migration again.")
+
+
+def move_notes():
+    db = SessionLocal()
+    try:
+        orders = db.query(Order).filter(Order.notes.contains(MARKER)).all()
+        known = {payme_id for (payme_id,) in db.query(Transaction.payme_trans_id)}
+        created = 0
+        for order in orders:
+            data = get_transaction_data(order.notes) or {}
+            payme_id = data.get("transaction_id")
+            if payme_id and payme_id not in known:
+                create_time = data.get("create_time") or 0
+                db.add(Transaction(
+                    payme_trans_id=payme_id,
+                    time=create_time,
+                    amount=int(round(order.total * 100)),
+                    account=json.dumps({"order_id": order.order_number}),
+                    create_time=create_time,
+                    perform_time=data.get("perform_time") or 0,
+                    cancel_time=data.get("cancel_time") or 0,
+                    state=data.get("state"),
+                    order_id=order.order_number,
+                ))
+                known.add(payme_id)
+                created += 1
+            order.notes = strip_transaction_data(order.notes)
+        db.commit()
+        print(f"  ✓ {len(orders)} orders cleaned, {created} transactions restored from notes")
+    finally:
+        db.close()
+
+
+def migrate():
+    print("Running migration: Payme transactions...")
+    move_notes()
+    create_active_index()
+    print("✅ Migration complete!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,16 @@
+"""
+Migration script: stock_reservations table (stock taken by orders, holds of unpaid Payme orders).
+Existing orders get no reservations - stock is counted from the next checkout on.
+Run from src/backend:  python migrate_stock_reservations.py
+"""
+from database import init_db
+
+
+def migrate():
+    print("Running migration: stock reservations...")
+    init_db()  # create_all: таблица создается, если ее еще нет
+    print("✅ stock_reservations ready")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,46 @@
+"""
+Migration script: products.structured_data (schema.org JSON-LD) + backfill for all products.
+Run from src/backend:  python migrate_structured_data.py
+Safe to re-run: rebuilds the JSON-LD of every product (e.g. after changing SITE_URL).
+"""
+from sqlalchemy import text
+
+from database import engine, init_db, SessionLocal, Product
+from page_cache import invalidate_pages
+from structured_data import refresh_structured_data
+
+BATCH_SIZE = 500
+
+
+def migrate():
+    print("Running migration: product structured data...")
+    init_db()
+
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("ALTER TABLE products ADD COLUMN structured_data TEXT"))
+            conn.commit()
+            print("✅ Added structured_data")
+        except Exception as e:
+            if "duplicate column name" in str(e):
+                print("ℹ️ structured_data already exists")
+            else:
+                print(f"⚠️ Error adding structured_data: {e}")
+
+    db = SessionLocal()
+    try:
+        ids = [product_id for (product_id,) in db.query(Product.id).order_by(Product.id)]
+        for i in range(0, len(ids), BATCH_SIZE):
+            products = db.query(Product).filter(Product.id.in_(ids[i:i + BATCH_SIZE])).all()
+            refresh_structured_data(db, products)
+            db.commit()
+        print(f"  ✓ {len(ids)} products")
+    finally:
+        db.close()
+
+    invalidate_pages()
+    print("✅ Migration complete! Re-run prerender.py if pages are pre-generated.")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,30 @@
+"""
+Migration script: upload_refs table, filled from the image URLs already stored in the database.
+Files uploaded before content addressing keep their old uuid names and URLs.
+"""
+from collections import defaultdict
+
+from database import init_db, SessionLocal
+from storage import collect_references, sync_refs
+
+
+def migrate():
+    print("Running migration: upload_refs...")
+    init_db()
+
+    db = SessionLocal()
+    try:
+        owners = defaultdict(list)
+        for owner_type, owner_id, url in collect_references(db):
+            if owner_type != "order":  # заказы не редактируются, GC читает их напрямую
+                owners[(owner_type, str(owner_id))].append(url)
+        for (owner_type, owner_id), urls in owners.items():
+            sync_refs(db, owner_type, owner_id, urls)
+        db.commit()
+        print(f"✅ Migration complete! References rebuilt for {len(owners)} rows.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
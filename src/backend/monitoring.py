@@ -0,0 +1,252 @@
+"""
+Request metrics: per-route counters and histograms, in-flight requests and event-loop lag,
+runs and swept rows of the background jobs (scheduler.py).
+Rendered in Prometheus text format by routes/metrics.py.
+
+Metrics live in process memory, so with several uvicorn workers each worker reports its own numbers.
+"""
+import asyncio
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+JOB_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0)
+LOOP_LAG_INTERVAL = 0.5  # seconds between event-loop probes
+
+
+class Histogram:
+    """Cumulative-at-render histogram: stores per-bucket counts, sum and count"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний элемент - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RouteStats:
+    __slots__ = ("latency", "size", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.statuses = {}
+
+
+class JobStats:
+    __slots__ = ("duration", "outcomes", "swept", "last_success")
+
+    def __init__(self):
+        self.duration = Histogram(JOB_DURATION_BUCKETS)
+        self.outcomes = {}
+        self.swept = {}  # вид строк -> сколько обработано за все запуски
+        self.last_success = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.routes = {}
+        self.jobs = {}
+        self.in_flight = 0
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.loop_lag_last = 0.0
+        self.started_at = time.time()
+
+    def observe_request(self, method, route, status, duration, size):
+        key = (method, route)
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = RouteStats()
+        stats.latency.observe(duration)
+        stats.size.observe(size)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def observe_job(self, name, duration, ok, swept=None):
+        stats = self.jobs.get(name)
+        if stats is None:
+            stats = self.jobs[name] = JobStats()
+        stats.duration.observe(duration)
+        outcome = "success" if ok else "failure"
+        stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+        if ok:
+            stats.last_success = time.time()
+        for kind, count in (swept or {}).items():
+            stats.swept[kind] = stats.swept.get(kind, 0) + count
+
+    def observe_loop_lag(self, lag):
+        self.loop_lag_last = lag
+        self.loop_lag.observe(lag)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP orient_http_requests_total Total HTTP requests by route template and status code.",
+            "# TYPE orient_http_requests_total counter",
+        ]
+        items = sorted(self.routes.items())
+        for (method, route), stats in items:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'orient_http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP orient_http_request_duration_seconds Request latency by route template.",
+            "# TYPE orient_http_request_duration_seconds histogram",
+        ]
+        for (method, route), stats in items:
+            lines += stats.latency.render("orient_http_request_duration_seconds", f'method="{method}",route="{_escape(route)}"')
+
+        lines += [
+            "# HELP orient_http_response_size_bytes Response body size by route template.",
+            "# TYPE orient_http_response_size_bytes histogram",
+        ]
+        for (method, route), stats in items:
+            lines += stats.size.render("orient_http_response_size_bytes", f'method="{method}",route="{_escape(route)}"')
+
+        lines += [
+            "# HELP orient_http_requests_in_flight Requests currently being processed.",
+            "# TYPE orient_http_requests_in_flight gauge",
+            f"orient_http_requests_in_flight {self.in_flight}",
+            "# HELP orient_event_loop_lag_seconds Last measured event-loop scheduling delay.",
+            "# TYPE orient_event_loop_lag_seconds gauge",
+            f"orient_event_loop_lag_seconds {self.loop_lag_last:.6f}",
+            "# HELP orient_event_loop_lag_distribution_seconds Event-loop scheduling delay.",
+            "# TYPE orient_event_loop_lag_distribution_seconds histogram",
+        ]
+        lines += self.loop_lag.render("orient_event_loop_lag_distribution_seconds", 'probe="sleep"')
+
+        jobs = sorted(self.jobs.items())
+        lines += [
+            "# HELP orient_job_runs_total Background job runs by outcome.",
+            "# TYPE orient_job_runs_total counter",
+        ]
+        for name, stats in jobs:
+            for outcome, count in sorted(stats.outcomes.items()):
+                lines.append(f'orient_job_runs_total{{job="{name}",outcome="{outcome}"}} {count}')
+        lines += [
+            "# HELP orient_job_swept_total Rows a background job expired, cancelled, released or deleted.",
+            "# TYPE orient_job_swept_total counter",
+        ]
+        for name, stats in jobs:
+            for kind, count in sorted(stats.swept.items()):
+                lines.append(f'orient_job_swept_total{{job="{name}",kind="{kind}"}} {count}')
+        lines += [
+            "# HELP orient_job_duration_seconds Background job run time.",
+            "# TYPE orient_job_duration_seconds histogram",
+        ]
+        for name, stats in jobs:
+            lines += stats.duration.render("orient_job_duration_seconds", f'job="{name}"')
+        lines += [
+            "# HELP orient_job_last_success_time_seconds Last successful run of a background job (unix).",
+            "# TYPE orient_job_last_success_time_seconds gauge",
+        ]
+        for name, stats in jobs:
+            lines.append(f'orient_job_last_success_time_seconds{{job="{name}"}} {stats.last_success:.3f}')
+        lines += [
+            "# HELP orient_process_start_time_seconds Process start time (unix).",
+            "# TYPE orient_process_start_time_seconds gauge",
+            f"orient_process_start_time_seconds {self.started_at:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+REGISTRY = MetricsRegistry()
+
+
+def route_template(scope):
+    """Route path template ('/api/products/{product_id}') instead of the raw URL, to keep label cardinality low"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # StaticFiles mounts (/uploads, /assets) don't set "route", only root_path
+    root_path = scope.get("root_path")
+    if root_path:
+        return f"{root_path}/{{path}}"
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: records latency, status and body size per route template"""
+
+    def __init__(self, app, registry=REGISTRY):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        registry.in_flight += 1
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight -= 1
+            registry.observe_request(
+                scope["method"], route_template(scope), status, time.perf_counter() - start, size
+            )
+
+
+async def monitor_loop_lag(registry=REGISTRY, interval=LOOP_LAG_INTERVAL):
+    """Sleeps `interval` in a loop; any extra delay is time the loop spent busy with other work"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        registry.observe_loop_lag(max(0.0, loop.time() - start - interval))
+
+
+_lag_task = None
+
+
+def start_loop_lag_monitor():
+    global _lag_task
+    if _lag_task is None:
+        _lag_task = asyncio.get_running_loop().create_task(monitor_loop_lag())
+
+
+async def stop_loop_lag_monitor():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        try:
+            await _lag_task
+        except asyncio.CancelledError:
+            pass
+        _lag_task = None
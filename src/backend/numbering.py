@@ -0,0 +1,29 @@
+"""
+Human-readable unique order / booking numbers: ORD-20261019-000042, BK-20261019-000007.
+
+Every prefix + day has a row in number_sequences. next_number() increments it with one
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement (SQLite 3.35+, PostgreSQL) in its
+own short transaction, so the database serializes the increment across concurrent requests
+and uvicorn workers, and the lock is released before the order itself is written.
+A failed checkout leaves a gap in the day's sequence, never a duplicate.
+Old ORD-YYYYMMDDHHMMSS numbers have no dash after the date and can't collide with these.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import engine
+
+_NEXT_VALUE = text(
+    "INSERT INTO number_sequences (name, value) VALUES (:name, 1) "
+    "ON CONFLICT (name) DO UPDATE SET value = number_sequences.value + 1 "
+    "RETURNING value"
+)
+
+
+def next_number(prefix, day=None):
+    """Next number for prefix ("ORD", "BK") on day (local date, default today)"""
+    name = f"{prefix}-{(day or datetime.now()):%Y%m%d}"
+    with engine.begin() as conn:
+        value = conn.execute(_NEXT_VALUE, {"name": name}).scalar_one()
+    return f"{name}-{value:06d}"
@@ -0,0 +1,52 @@
+"""
+order_items rows for an order: one per checkout item with a snapshot of the product
+(sku, name, collection) taken when the order is placed, so sales reports stay correct after
+products are renamed, moved or deleted. Checkout builds them from the priced cart
+(pricing.price_cart), migrate_order_items.py from the Order.items JSON.
+"""
+from database import Product, OrderItem
+
+
+def product_snapshots(db, product_ids):
+    """product id -> (sku, name, collection, price) in one query"""
+    ids = {str(product_id) for product_id in product_ids}
+    if not ids:
+        return {}
+    rows = db.query(Product.id, Product.sku, Product.name, Product.collection, Product.price) \
+        .filter(Product.id.in_(ids))
+    return {row.id: row for row in rows}
+
+
+def make_order_items(items, snapshots, created_at=None):
+    """OrderItem objects for decoded Order.items ([{"productId", "quantity", "price"}])"""
+    extra = {"created_at": created_at} if created_at else {}
+    rows = []
+    for item in items:
+        product_id = str(item.get("productId"))
+        product = snapshots.get(product_id)
+        price = item.get("price")
+        rows.append(OrderItem(
+            product_id=product_id,
+            sku=product.sku if product else None,
+            name=product.name if product else None,
+            collection=product.collection if product else None,
+            quantity=int(item.get("quantity") or 1),
+            # цена, по которой клиент оформил заказ; каталожная - если ее нет в старых заказах
+            unit_price=float(price if price is not None else (product.price if product else 0)),
+            **extra,
+        ))
+    return rows
+
+
+def priced_order_items(lines, created_at=None):
+    """OrderItem objects for price_cart() lines, which already carry the product snapshot"""
+    extra = {"created_at": created_at} if created_at else {}
+    return [OrderItem(
+        product_id=line["productId"],
+        sku=line["sku"],
+        name=line["name"],
+        collection=line["collection"],
+        quantity=line["quantity"],
+        unit_price=line["price"],
+        **extra,
+    ) for line in lines]
@@ -0,0 +1,77 @@
+"""
+Cache of HTML pages rendered by seo_renderer.
+Pages (meta tags + hydration payload) are kept in memory for PAGE_CACHE_TTL seconds.
+Admin writes call invalidate_pages() for the paths they affect. With several workers the
+TTL bounds how long another worker can serve a stale page. Pages pre-generated to disk by
+prerender.py are re-rendered in the background at the same time.
+
+Settings (env):
+    PAGE_CACHE_TTL         - seconds, 0 disables the cache, default 300
+    PAGE_CACHE_MAX_ENTRIES - pages kept, oldest are dropped first, default 5000
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "300"))
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "5000"))
+
+
+class PageCache:
+    """path -> html with a TTL; insertion ordered so the oldest page is dropped first"""
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, max_entries=PAGE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        entry = self.pages.get(path)
+        if entry is None:
+            return None
+        expires, html = entry
+        if expires < time.monotonic():
+            with self.lock:
+                self.pages.pop(path, None)
+            return None
+        return html
+
+    def set(self, path, html):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.pages.pop(path, None)
+            self.pages[path] = (time.monotonic() + self.ttl, html)
+            while len(self.pages) > self.max_entries:
+                self.pages.popitem(last=False)
+
+    def invalidate(self, paths=(), prefixes=()):
+        with self.lock:
+            for path in paths:
+                self.pages.pop(path, None)
+            if prefixes:
+                for path in [p for p in self.pages if p.startswith(tuple(prefixes))]:
+                    del self.pages[path]
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+
+
+PAGE_CACHE = PageCache()
+
+
+def invalidate_pages(*paths, prefixes=()):
+    """
+    Drop rendered pages after a write. Paths are without slashes ("product/<id>", "" = home).
+    No arguments = everything (logo, promo banner and settings are embedded in every page).
+    """
+    from prerender import REGENERATOR  # prerender -> seo_renderer -> page_cache
+
+    if not paths and not prefixes:
+        PAGE_CACHE.clear()
+    else:
+        PAGE_CACHE.invalidate(paths, prefixes)
+    REGENERATOR.schedule(paths, prefixes)
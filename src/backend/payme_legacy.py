@@ -0,0 +1,51 @@
+"""
+Payme transaction data that older code kept in Order.notes as a "[Payme Transaction] {json}" line.
+The callback no longer writes it (transactions table is the only source); these helpers are
+used by migrate_payme_transactions.py to move what is left in old orders.
+"""
+import json
+
+MARKER = "[Payme Transaction]"
+
+
+def get_transaction_data(order_notes: str) -> dict:
+    """Извлекает JSON данные транзакции из поля notes"""
+    if not order_notes or MARKER not in order_notes:
+        return None
+    for line in order_notes.split('\n'):
+        if MARKER in line:
+            try:
+                return json.loads(line.split(MARKER, 1)[1].strip())
+            except ValueError:
+                return None
+    return None
+
+
+def update_transaction_data(order, new_data: dict):
+    """Обновляет данные транзакции в notes"""
+    new_line = f"{MARKER} {json.dumps(new_data)}"
+
+    if not order.notes:
+        order.notes = new_line
+    elif MARKER in order.notes:
+        # Заменяем существующую строку (первую), остальные удаляем
+        lines = []
+        replaced = False
+        for line in order.notes.split('\n'):
+            if MARKER in line:
+                if not replaced:
+                    lines.append(new_line)
+                    replaced = True
+            else:
+                lines.append(line)
+        order.notes = '\n'.join(lines)
+    else:
+        order.notes = f"{order.notes}\n{new_line}"
+
+
+def strip_transaction_data(order_notes: str):
+    """Notes without the transaction lines (None if nothing else is left)"""
+    if not order_notes:
+        return order_notes
+    lines = [line for line in order_notes.split('\n') if MARKER not in line]
+    return '\n'.join(lines) or None
@@ -0,0 +1,39 @@
+"""
+Precompress the frontend build: writes .br (if the `brotli` package is installed) and .gz
+next to every JS/CSS/SVG/... file in dist/assets. CachedStaticFiles serves them to clients
+that accept the encoding, so nothing is compressed per request.
+
+Run after `npm run build`:
+    python precompress_assets.py
+    python precompress_assets.py /var/www/orient/dist/assets --force
+Or set STATIC_PRECOMPRESS=1 to do it on backend startup.
+"""
+import argparse
+import os
+
+from static_files import brotli, precompress_assets
+
+DEFAULT_ASSETS_DIR = os.path.join(os.getenv("DIST_DIR", "/var/www/orient/dist"), "assets")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write .br/.gz siblings for frontend assets")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_ASSETS_DIR)
+    parser.add_argument("--force", action="store_true", help="Recompress files that already have siblings")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"❌ Directory not found: {args.directory}. Did you run 'npm run build'?")
+        return
+    if brotli is None:
+        print("⚠️ brotli is not installed, writing .gz only (pip install brotli)")
+
+    count, before, after = precompress_assets(args.directory, force=args.force)
+    if count:
+        print(f"✅ Compressed {count} files: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
+    else:
+        print("✅ Nothing to compress, all assets are up to date")
+
+
+if __name__ == "__main__":
+    main()
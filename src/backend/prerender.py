@@ -0,0 +1,183 @@
+"""
+Static pre-generation of SEO pages.
+Renders every STATIC_SEO path, every active collection and every product with the same
+code as seo_renderer and writes them to PRERENDER_DIR/<path>/index.html (+ .gz/.br), so
+Nginx can answer crawlers and first visits from disk:
+
+    location / {
+        gzip_static on;          # brotli_static on; с модулем ngx_brotli
+        try_files /prerendered/$uri/index.html @backend;
+    }
+
+Build (after `npm run build`, the pages reference the hashed assets of that build):
+    python prerender.py
+    python prerender.py --output /var/www/orient/dist/prerendered
+
+Once the directory exists, admin writes regenerate only the affected pages in the
+background (see invalidate_pages in page_cache.py); deleted products lose their file.
+
+Settings (env):
+    PRERENDER_DIR - output directory, default <DIST_DIR>/prerendered
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, Product, Collection
+from routes.seo_renderer import DIST_DIR, STATIC_SEO, render_page
+from static_files import write_compressed
+
+logger = logging.getLogger("orient.prerender")
+
+PRERENDER_DIR = os.getenv("PRERENDER_DIR", os.path.join(DIST_DIR, "prerendered"))
+
+
+def page_file(path, output_dir=PRERENDER_DIR):
+    """
+    'product/abc' -> <output_dir>/product/abc/index.html, '' -> <output_dir>/index.html.
+    ValueError for paths that would leave their own directory (id '..' would overwrite the home page).
+    """
+    parts = [part for part in path.split("/") if part]
+    if any(part in (".", "..") or "\\" in part for part in parts):
+        raise ValueError(f"Unsafe page path: {path!r}")
+    return os.path.join(output_dir, *parts, "index.html")
+
+
+def write_page(path, html, output_dir=PRERENDER_DIR):
+    file_path = page_file(path, output_dir)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    data = html.encode("utf-8")
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(data)
+    os.replace(tmp_path, file_path)
+    write_compressed(file_path, data)
+
+
+def remove_page(path, output_dir=PRERENDER_DIR):
+    file_path = page_file(path, output_dir)
+    for suffix in ("", ".gz", ".br"):
+        if os.path.exists(file_path + suffix):
+            os.remove(file_path + suffix)
+
+
+def all_paths(db):
+    """Every path worth pre-generating"""
+    paths = list(STATIC_SEO)
+    paths += [f"collection/{collection_id}" for (collection_id,) in
+              db.query(Collection.id).filter(Collection.active == True).order_by(Collection.id)]
+    paths += [f"product/{product_id}" for (product_id,) in db.query(Product.id).order_by(Product.id)]
+    return list(dict.fromkeys(paths))
+
+
+def existing_paths(prefix, output_dir=PRERENDER_DIR):
+    """Paths under prefix ("collection/") that currently have a file on disk"""
+    root = os.path.join(output_dir, prefix.strip("/"))
+    if not os.path.isdir(root):
+        return []
+    return [f"{prefix.strip('/')}/{name}" for name in os.listdir(root)
+            if os.path.exists(os.path.join(root, name, "index.html"))]
+
+
+async def render_paths(paths, output_dir=PRERENDER_DIR):
+    """Render and write the given paths with a fresh session; unknown ones are removed. Returns (written, removed)."""
+    written = removed = 0
+    db = SessionLocal()
+    try:
+        for path in paths:
+            try:
+                page_file(path, output_dir)
+            except ValueError:
+                logger.warning("Skipping page with unsafe path %r", path)
+                continue
+            html, found = await render_page(db, path)
+            if found:
+                write_page(path, html, output_dir)
+                written += 1
+            else:
+                remove_page(path, output_dir)
+                removed += 1
+    finally:
+        db.close()
+    return written, removed
+
+
+def _regenerate(paths, prefixes, everything):
+    """Blocking (worker thread, own event loop): expand prefixes and re-render"""
+    db = SessionLocal()
+    try:
+        current = all_paths(db) if everything or prefixes else []
+        targets = set(current) if everything else set(paths)
+        for prefix in prefixes:
+            # и уже сгенерированные страницы (могли быть удалены), и текущие из базы
+            targets.update(existing_paths(prefix))
+            targets.update(path for path in current if path.startswith(prefix))
+    finally:
+        db.close()
+    return asyncio.run(render_paths(sorted(targets)))
+
+
+class Regenerator:
+    """Coalesces invalidations into one background re-render at a time"""
+
+    def __init__(self):
+        self.paths = set()
+        self.prefixes = set()
+        self.everything = False
+        self.task = None
+
+    def schedule(self, paths=(), prefixes=()):
+        if not os.path.isdir(PRERENDER_DIR):
+            return  # статическая генерация не используется
+        if not paths and not prefixes:
+            self.everything = True
+        self.paths.update(paths)
+        self.prefixes.update(prefixes)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # вне event loop (скрипты) - файлы обновит следующий запуск prerender.py
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._drain())
+
+    async def _drain(self):
+        while self.paths or self.prefixes or self.everything:
+            paths, prefixes, everything = self.paths, self.prefixes, self.everything
+            self.paths, self.prefixes, self.everything = set(), set(), False
+            try:
+                written, removed = await run_in_threadpool(_regenerate, paths, prefixes, everything)
+                logger.info("Prerendered %d pages, removed %d", written, removed)
+            except Exception:
+                logger.exception("Prerender regeneration failed")
+
+
+REGENERATOR = Regenerator()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate SEO pages for Nginx")
+    parser.add_argument("--output", default=PRERENDER_DIR)
+    parser.add_argument("--clean", action="store_true", help="Remove the output directory first")
+    args = parser.parse_args()
+
+    if args.clean and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        paths = all_paths(db)
+    finally:
+        db.close()
+    print(f"🔄 Rendering {len(paths)} pages to {args.output} ...")
+    written, removed = asyncio.run(render_paths(paths, args.output))
+    print(f"✅ {written} pages written, {removed} skipped in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Server-side cart pricing: the authoritative subtotal, promo discount, shipping and total.
+Used by POST /api/cart/price (the cart page) and by create_order, so the client only sends
+product ids, quantities, the promo code and the delivery method.
+
+    - current prices come from one IN query by primary key (never from a cache, so a price
+      change applies to the next checkout in every worker)
+    - promo codes are kept as an index code -> rule with precomputed product / collection sets
+    - shipping costs come from a cached Settings snapshot
+The promo index and the snapshot live for PRICING_CACHE_TTL seconds and are dropped on
+promo code and settings writes (invalidate_pricing); the TTL bounds staleness in other workers.
+
+Settings (env):
+    PRICING_CACHE_TTL - seconds, default 30
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from fastapi import HTTPException
+
+from database import Product, Collection, PromoCode, Settings
+
+PRICING_CACHE_TTL = float(os.getenv("PRICING_CACHE_TTL", "30"))
+DELIVERY_METHODS = ("standard", "express", "pickup")
+
+PromoRule = namedtuple("PromoRule", "code percent active valid_from valid_until products collections listed")
+ShippingRules = namedtuple("ShippingRules", "free_threshold standard express currency")
+
+
+class PricingError(HTTPException):
+    """Cart can't be priced (unknown product, invalid promo code, bad delivery method)"""
+
+    def __init__(self, detail):
+        super().__init__(status_code=400, detail=detail)
+
+
+class PromoNotFound(PricingError):
+    """No promo code with that code; a 400 in the cart, /api/promocodes/validate answers 404"""
+
+
+_cache = {}  # key -> (expires, value)
+_lock = threading.Lock()
+
+
+def _cached(key, loader, db):
+    entry = _cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    value = loader(db)
+    with _lock:
+        _cache[key] = (time.monotonic() + PRICING_CACHE_TTL, value)
+    return value
+
+
+def invalidate_pricing():
+    """Call after promo code or settings writes"""
+    with _lock:
+        _cache.clear()
+
+
+def _load_promos(db):
+    # Коллекции в промокоде задают и id ("sports"), и названием ("SPORTS") - храним оба варианта
+    collection_ids = {name.lower(): collection_id.lower() for name, collection_id in db.query(Collection.name, Collection.id)}
+    promos = {}
+    for promo in db.query(PromoCode):
+        listed_products = json.loads(promo.applicable_products or "[]")
+        listed_collections = json.loads(promo.applicable_collections or "[]")
+        collections = {c.strip().lower() for c in listed_collections if c.strip()}
+        collections |= {name for name, collection_id in collection_ids.items() if collection_id in collections}
+        promos[promo.code] = PromoRule(
+            code=promo.code,
+            percent=promo.discount_percent,
+            active=promo.active,
+            valid_from=promo.valid_from,
+            valid_until=promo.valid_until,
+            products=frozenset(str(p).strip() for p in listed_products if str(p).strip()),
+            collections=frozenset(collections),
+            listed=(listed_products, listed_collections),  # как заданы в админке
+        )
+    return promos
+
+
+def _load_shipping(db):
+    settings = db.query(Settings.free_shipping_threshold, Settings.standard_shipping_cost,
+                        Settings.express_shipping_cost, Settings.currency_code).filter(Settings.id == 1).first()
+    if not settings:
+        return ShippingRules(100000.0, 50000.0, 100000.0, "UZS")  # значения по умолчанию модели Settings
+    return ShippingRules(settings.free_shipping_threshold or 0.0, settings.standard_shipping_cost or 0.0,
+                         settings.express_shipping_cost or 0.0, settings.currency_code or "UZS")
+
+
+def promo_rule(db, code):
+    """Valid PromoRule for code or PricingError with the message shown in the cart"""
+    rule = _cached("promos", _load_promos, db).get(code.strip())
+    if rule is None:
+        raise PromoNotFound("Промокод не найден")
+    if not rule.active:
+        raise PricingError("Промокод неактивен")
+    now = datetime.utcnow()
+    if rule.valid_from and rule.valid_from > now:
+        raise PricingError("Срок действия промокода еще не начался")
+    if rule.valid_until and rule.valid_until < now:
+        raise PricingError("Срок действия промокода истек")
+    return rule
+
+
+def promo_applies(rule, product_id, collection):
+    if rule.products and product_id not in rule.products:
+        return False
+    if rule.collections and (collection or "").lower() not in rule.collections:
+        return False
+    return True
+
+
+def shipping_cost(rules, delivery_method, amount):
+    if delivery_method == "pickup":
+        return 0.0
+    if delivery_method == "express":
+        return rules.express
+    return 0.0 if amount >= rules.free_threshold else rules.standard
+
+
+def price_cart(db, items, promo_code=None, delivery_method="standard"):
+    """
+    Price [{"productId", "quantity"}]. Returns the priced cart; "subtotal" is after the
+    discount (as stored in Order.subtotal), "itemsTotal" before it.
+    """
+    if delivery_method not in DELIVERY_METHODS:
+        raise PricingError(f"Неизвестный способ доставки: {delivery_method}")
+    if not items:
+        raise PricingError("Корзина пуста")
+
+    quantities = {}
+    for item in items:
+        product_id = str(item["productId"])
+        quantities[product_id] = quantities.get(product_id, 0) + max(int(item.get("quantity") or 1), 1)
+
+    products = {row.id: row for row in db.query(
+        Product.id, Product.name, Product.sku, Product.collection, Product.price, Product.image, Product.in_stock,
+    ).filter(Product.id.in_(quantities))}
+    missing = [product_id for product_id in quantities if product_id not in products]
+    if missing:
+        raise PricingError(f"Товар не найден: {', '.join(missing)}")
+
+    rule = promo_rule(db, promo_code) if promo_code and promo_code.strip() else None
+    rules = _cached("shipping", _load_shipping, db)
+
+    lines = []
+    items_total = discount = 0.0
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        unit_discount = 0.0
+        if rule and promo_applies(rule, product_id, product.collection):
+            unit_discount = round(product.price * rule.percent / 100, 2)
+        unit_price = round(product.price - unit_discount, 2)
+        items_total += product.price * quantity
+        discount += unit_discount * quantity
+        lines.append({
+            "productId": product_id,
+            "name": product.name,
+            "sku": product.sku,
+            "collection": product.collection,
+            "image": product.image,
+            "inStock": bool(product.in_stock),
+            "quantity": quantity,
+            "listPrice": product.price,
+            "discount": unit_discount,
+            "price": unit_price,
+            "lineTotal": round(unit_price * quantity, 2),
+        })
+
+    subtotal = round(items_total - discount, 2)
+    shipping = shipping_cost(rules, delivery_method, subtotal)
+    return {
+        "items": lines,
+        "itemsTotal": round(items_total, 2),
+        "discount": round(discount, 2),
+        "subtotal": subtotal,
+        "shipping": shipping,
+        "total": round(subtotal + shipping, 2),
+        "currency": rules.currency,
+        "deliveryMethod": delivery_method,
+        "shippingOptions": {method: shipping_cost(rules, method, subtotal) for method in DELIVERY_METHODS},
+        "freeShippingThreshold": rules.free_threshold,
+        "promo": {"code": rule.code, "discountPercent": rule.percent} if rule else None,
+    }
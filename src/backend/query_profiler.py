@@ -0,0 +1,138 @@
+"""
+SQL query profiler.
+Counts queries and SQL time per request, flags repeated statement shapes as N+1 candidates
+and logs slow statements together with their EXPLAIN QUERY PLAN.
+
+Enabled with SQL_PROFILER=1. With DEBUG=1 the per-request summary is also returned as
+X-SQL-* response headers.
+"""
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger("orient.sql")
+
+SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER", "0") == "1"
+SQL_PROFILER_HEADERS = os.getenv("DEBUG", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+_current_profile = ContextVar("sql_profile", default=None)
+
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """Normalize whitespace and collapse `IN (?, ?, ?)` so the same query with different ids has one shape"""
+    return _IN_LIST_RE.sub("(?...)", _SPACES_RE.sub(" ", statement).strip())
+
+
+class QueryProfile:
+    """Queries executed while handling one request"""
+    __slots__ = ("count", "total_time", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = {}
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Statement shapes executed at least `threshold` times, most frequent first"""
+        repeated = [(shape, count) for shape, count in self.shapes.items() if count >= threshold]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+
+def explain_query_plan(cursor, statement, parameters):
+    """EXPLAIN QUERY PLAN lines for a SQLite statement, or [] if it can't be explained"""
+    try:
+        rows = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+        return [row[-1] for row in rows]
+    except Exception:
+        return []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(statement, elapsed)
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        plan = []
+        if not executemany and conn.dialect.name == "sqlite" and statement.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE"):
+            plan = explain_query_plan(cursor, statement, parameters)
+        logger.warning(
+            "Slow query %.1f ms: %s | params=%r | plan: %s",
+            elapsed * 1000, _SPACES_RE.sub(" ", statement), parameters if not executemany else "<executemany>",
+            "; ".join(plan) or "n/a",
+        )
+
+
+def install_query_profiler(engine):
+    """Attach cursor events to the engine (idempotent)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def start_profile():
+    """Begin collecting queries for the current context; returns (profile, token)"""
+    profile = QueryProfile()
+    return profile, _current_profile.set(profile)
+
+
+def stop_profile(token):
+    _current_profile.reset(token)
+
+
+class QueryProfilerMiddleware:
+    """Pure ASGI middleware: one QueryProfile per HTTP request"""
+
+    def __init__(self, app, add_headers=SQL_PROFILER_HEADERS):
+        self.app = app
+        self.add_headers = add_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile, token = start_profile()
+
+        async def send_wrapper(message):
+            if self.add_headers and message["type"] == "http.response.start":
+                suspects = profile.n_plus_one()
+                headers = list(message.get("headers", []))
+                headers += [
+                    (b"x-sql-query-count", str(profile.count).encode()),
+                    (b"x-sql-time-ms", f"{profile.total_time * 1000:.2f}".encode()),
+                    (b"x-sql-n-plus-one", str(len(suspects)).encode()),
+                ]
+                if suspects:
+                    shape, count = suspects[0]
+                    headers.append((b"x-sql-n-plus-one-top", f"{count}x {shape[:200]}".encode("utf-8", "replace")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stop_profile(token)
+            for shape, count in profile.n_plus_one():
+                logger.warning("Possible N+1 in %s %s: %d x %s", scope["method"], scope["path"], count, shape)
@@ -0,0 +1,159 @@
+"""
+Sales analytics routes - single SQL aggregates over order_items
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import get_db, Order, OrderItem
+from auth import require_admin
+
+router = APIRouter()
+
+# Отмененные заказы в продажи не попадают (если статус не задан явно)
+EXCLUDED_STATUSES = ("cancelled",)
+GROUPINGS = ("product", "collection", "day")
+
+
+def parse_period(date_from: Optional[str], date_to: Optional[str], days: int):
+    """[start, end) from YYYY-MM-DD strings (to is inclusive) or the last `days` days"""
+    try:
+        end = datetime.fromisoformat(date_to) + timedelta(days=1) if date_to else datetime.utcnow()
+        start = datetime.fromisoformat(date_from) if date_from else end - timedelta(days=days)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    return start, end
+
+
+def sales_query(db: Session, columns, start, end, status: Optional[str]):
+    query = db.query(*columns).join(Order, Order.id == OrderItem.order_id) \
+        .filter(OrderItem.created_at >= start, OrderItem.created_at < end)
+    if status:
+        return query.filter(Order.status == status)
+    return query.filter(Order.status.notin_(EXCLUDED_STATUSES))
+
+
+def sales_totals():
+    return [
+        func.coalesce(func.sum(OrderItem.quantity), 0).label("units"),
+        func.coalesce(func.sum(OrderItem.quantity * OrderItem.unit_price), 0).label("revenue"),
+        func.count(func.distinct(OrderItem.order_id)).label("orders"),
+    ]
+
+
+@router.get("/api/admin/analytics/sales")
+async def get_sales(
+    groupBy: str = Query("product"),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    days: int = Query(30, ge=1, le=3660),
+    status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user=Depends(require_admin)
+):
+    """Units, revenue and orders for a period grouped by product, collection or day"""
+    if groupBy not in GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"groupBy must be one of: {', '.join(GROUPINGS)}")
+    start, end = parse_period(date_from, date_to, days)
+    units, revenue, orders = sales_totals()
+
+    if groupBy == "product":
+        keys = [OrderItem.product_id, func.max(OrderItem.sku).label("sku"), func.max(OrderItem.name).label("name")]
+        group, order_by = OrderItem.product_id, units.desc()
+    elif groupBy == "collection":
+        keys = [OrderItem.collection]
+        group, order_by = OrderItem.collection, units.desc()
+    else:
+        day = func.date(OrderItem.created_at).label("day")
+        keys = [day]
+        group, order_by = day, day
+
+    rows = sales_query(db, keys + [units, revenue, orders], start, end, status) \
+        .group_by(group).order_by(order_by).limit(limit).all()
+    totals = sales_query(db, sales_totals(), start, end, status).one()
+
+    data = []
+    for row in rows:
+        item = {"units": row.units, "revenue": row.revenue, "orders": row.orders}
+        if groupBy == "product":
+            item.update({"productId": row.product_id, "sku": row.sku, "name": row.name})
+        elif groupBy == "collection":
+            item["collection"] = row.collection
+        else:
+            item["date"] = str(row.day)
+        data.append(item)
+
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "groupBy": groupBy,
+        "totals": {"units": totals.units, "revenue": totals.revenue, "orders": totals.orders},
+        "data": data
+    }
+
+
+@router.get("/api/admin/analytics/bestsellers")
+async def get_bestsellers(
+    days: int = Query(30, ge=1, le=3660),
+    limit: int = Query(10, ge=1, le=100),
+    collection: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user=Depends(require_admin)
+):
+    """Top products by units sold in the last `days` days"""
+    start, end = parse_period(None, None, days)
+    units, revenue, orders = sales_totals()
+    query = sales_query(db, [
+        OrderItem.product_id, func.max(OrderItem.sku).label("sku"), func.max(OrderItem.name).label("name"),
+        units, revenue, orders,
+    ], start, end, None)
+    if collection:
+        query = query.filter(OrderItem.collection == collection)
+    rows = query.group_by(OrderItem.product_id).order_by(units.desc(), revenue.desc()).limit(limit).all()
+
+    return [
+        {"productId": row.product_id, "sku": row.sku, "name": row.name,
+         "units": row.units, "revenue": row.revenue, "orders": row.orders}
+        for row in rows
+    ]
+
+
+@router.get("/api/admin/analytics/products/{product_id}/orders")
+async def get_product_orders(
+    product_id: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user=Depends(require_admin)
+):
+    """Orders containing the product, newest first"""
+    total = db.query(func.count(OrderItem.id)).filter(OrderItem.product_id == product_id).scalar()
+    rows = db.query(OrderItem.quantity, OrderItem.unit_price, OrderItem.created_at,
+                    Order.order_number, Order.status, Order.total) \
+        .join(Order, Order.id == OrderItem.order_id) \
+        .filter(OrderItem.product_id == product_id) \
+        .order_by(OrderItem.created_at.desc()) \
+        .offset((page - 1) * limit).limit(limit).all()
+
+    return {
+        "data": [{
+            "orderNumber": row.order_number,
+            "status": row.status,
+            "quantity": row.quantity,
+            "unitPrice": row.unit_price,
+            "orderTotal": row.total,
+            "createdAt": row.created_at.isoformat() if row.created_at else None
+        } for row in rows],
+        "pagination": {
+            "page": page,
+            "limit": limit,
+            "total": total,
+            "totalPages": (total + limit - 1) // limit
+        }
+    }
@@ -1,58 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import Optional
-from datetime import datetime
 
 from database import get_db, Booking
+from idempotency import claim as claim_idempotency_key
+from numbering import next_number
 from schemas import BookingCreate, BookingUpdate
 from auth import require_admin
 # Импортируем функции уведомлений
-from telegram_bot import notify_new_booking, notify_booking_status
+from telegram_bot import notify_new_booking, notify_booking_status, wake_dispatcher
 
 router = APIRouter()
 
 
 def generate_booking_number():
-    """Generate unique booking number"""
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    return f"BK-{timestamp}"
+    """Generate unique booking number (BK-YYYYMMDD-NNNNNN)"""
+    return next_number("BK")
 
 
 @router.post("/api/bookings")
 async def create_booking(
         booking: BookingCreate,
         background_tasks: BackgroundTasks,  # <-- Добавили BackgroundTasks
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_db),
+        idempotency_key: Optional[str] = Header(None)
 ):
     if booking.website_check:
         return {"message": "Booking created successfully", "bookingNumber": "BOT-IGNORED", "id": -1}
-    """Create new booking (public)"""
-    booking_number = generate_booking_number()
-
-    db_booking = Booking(
-        booking_number=booking_number,
-        name=booking.name,
-        phone=booking.phone,
-        email=booking.email,
-        date=booking.date,
-        time=booking.time,
-        message=booking.message,
-        boutique=booking.boutique,
-        status="pending"
-    )
-
-    db.add(db_booking)
-    db.commit()
-    db.refresh(db_booking)
+    """Create new booking (public); a retry with the same Idempotency-Key gets the same booking"""
+    claim = await claim_idempotency_key(db, "bookings", idempotency_key, booking.dict())
+    if claim.replay is not None:
+        return claim.replay
+    with claim:
+        booking_number = generate_booking_number()
+
+        db_booking = Booking(
+            booking_number=booking_number,
+            name=booking.name,
+            phone=booking.phone,
+            email=booking.email,
+            date=booking.date,
+            time=booking.time,
+            message=booking.message,
+            boutique=booking.boutique,
+            status="pending"
+        )
+
+        db.add(db_booking)
+        # Уведомление в Telegram: outbox в той же транзакции, отправит диспетчер
+        notify_new_booking(db, db_booking)
+        db.flush()
+        response = {
+            "message": "Booking created successfully",
+            "bookingNumber": booking_number,
+            "id": db_booking.id
+        }
+        claim.save(response)
+        db.commit()
 
-    # Отправка уведомления в Telegram (фоновая задача)
-    background_tasks.add_task(notify_new_booking, db, db_booking)
+    background_tasks.add_task(wake_dispatcher)
 
-    return {
-        "message": "Booking created successfully",
-        "bookingNumber": booking_number,
-        "id": db_booking.id
-    }
+    return response
 
 
 @router.get("/api/admin/bookings")
@@ -112,11 +120,13 @@ async def update_booking_status(
 
     old_status = booking.status
     booking.status = status_update.status
-    db.commit()
 
     # Уведомляем только если статус изменился
     if old_status != status_update.status:
-        background_tasks.add_task(notify_booking_status, db, booking.booking_number, old_status, status_update.status)
+        notify_booking_status(db, booking.booking_number, old_status, status_update.status)
+        background_tasks.add_task(wake_dispatcher)
+
+    db.commit()
 
     return {"message": "Booking status updated"}
 
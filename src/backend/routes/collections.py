@@ -8,6 +8,9 @@ from typing import Optional
 from database import get_db, Collection, Product
 from schemas import CollectionCreate, CollectionUpdate
 from auth import require_admin
+from image_pipeline import product_assets
+from storage import sync_refs
+from page_cache import invalidate_pages
 
 router = APIRouter()
 
@@ -80,7 +83,8 @@ async def get_collection_products(
     offset = (page - 1) * limit
     products = query.offset(offset).limit(limit).all()
     
-    data = [product.to_dict() for product in products]
+    assets = product_assets(db, products)
+    data = [product.to_dict(assets) for product in products]
     
     return {
         "data": data,
@@ -159,7 +163,9 @@ async def create_collection(
     
     db_collection = Collection(**collection.dict())
     db.add(db_collection)
+    sync_refs(db, "collection", db_collection.id, [db_collection.image])
     db.commit()
+    invalidate_pages(prefixes=("collection/",))
     db.refresh(db_collection)
     
     return {"message": "Collection created", "id": db_collection.id}
@@ -181,7 +187,9 @@ async def update_collection(
     for key, value in update_data.items():
         setattr(db_collection, key, value)
     
+    sync_refs(db, "collection", collection_id, [db_collection.image])
     db.commit()
+    invalidate_pages(prefixes=("collection/",))
     
     return {"message": "Collection updated"}
 
@@ -198,6 +206,8 @@ async def delete_collection(
         raise HTTPException(status_code=404, detail="Collection not found")
     
     db.delete(db_collection)
+    sync_refs(db, "collection", collection_id, [])
     db.commit()
+    invalidate_pages(prefixes=("collection/",))
     
     return {"message": "Collection deleted"}
\ No newline at end of file
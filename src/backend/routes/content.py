@@ -10,6 +10,9 @@ from schemas import BoutiquePageData
 from database import get_db, ContentHero, ContentPromoBanner, ContentHeritage, ContentSiteLogo, ContentHistoryEvent, Product
 from schemas import HeroContent, PromoBanner, HeritageSection, HistoryEventCreate, HistoryEventUpdate
 from auth import require_admin
+from image_pipeline import image_variants
+from storage import sync_refs, boutique_urls
+from page_cache import invalidate_pages
 from database import ContentPolicy
 from schemas import PolicyData
 router = APIRouter()
@@ -49,10 +52,10 @@ async def get_hero_content(db: Session = Depends(get_db)):
             "image": "https://images.unsplash.com/photo-1587836374828-4dbafa94cf0e?w=800&q=80",
             "ctaText": "Смотреть коллекцию",
             "ctaLink": "/catalog",
-            "buttonTextColor": hero.button_text_color or "#FFFFFF",
-            "buttonBgColor": hero.button_bg_color or "transparent",
-            "buttonHoverTextColor": hero.button_hover_text_color or "#000000",
-            "buttonHoverBgColor": hero.button_hover_bg_color or "#FFFFFF"
+            "buttonTextColor": "#FFFFFF",
+            "buttonBgColor": "transparent",
+            "buttonHoverTextColor": "#000000",
+            "buttonHoverBgColor": "#FFFFFF"
         }
     
     return {
@@ -60,6 +63,7 @@ async def get_hero_content(db: Session = Depends(get_db)):
         "subtitle": hero.subtitle,
         "image": hero.image,
         "mobileImage": hero.mobile_image or "",
+        "imageVariants": image_variants(db, [hero.image, hero.mobile_image]),
         "ctaText": hero.cta_text,
         "ctaLink": hero.cta_link
     }
@@ -93,6 +97,7 @@ async def get_featured_watches(db: Session = Depends(get_db)):
     """Get featured watches (public)"""
     # Return featured products (is_featured = True)
     products = db.query(Product).filter(Product.is_featured == True).limit(6).all()
+    variants = image_variants(db, [product.image for product in products])
     
     result = []
     for product in products:
@@ -102,6 +107,7 @@ async def get_featured_watches(db: Session = Depends(get_db)):
             "collection": product.collection,
             "price": product.price,
             "image": product.image,
+            "imageVariants": {product.image: variants[product.image]} if product.image in variants else {},
             "isNew": True  # Can be extended with a field in Product model
         })
     
@@ -166,8 +172,10 @@ async def update_site_logo(
     
     db_logo.logo_url = logo.logoUrl
     db_logo.logo_dark_url = logo.logoDarkUrl
+    sync_refs(db, "logo", 1, [logo.logoUrl, logo.logoDarkUrl])
     
     db.commit()
+    invalidate_pages()  # логотип есть на каждой странице
     
     return {"message": "Logo updated"}
 
@@ -203,6 +211,7 @@ async def get_hero_content_admin(
 async def get_history_events(db: Session = Depends(get_db)):
     """Get history timeline events (public)"""
     events = db.query(ContentHistoryEvent).order_by(ContentHistoryEvent.order.asc()).all()
+    variants = image_variants(db, [event.image for event in events])
 
     result = []
     for event in events:
@@ -212,6 +221,7 @@ async def get_history_events(db: Session = Depends(get_db)):
             "title": event.title,
             "description": event.description,
             "image": event.image,
+            "imageVariants": {event.image: variants[event.image]} if event.image in variants else {},
             "order": event.order
         })
 
@@ -233,6 +243,8 @@ async def create_history_event(
         order=event.order
     )
     db.add(db_event)
+    db.flush()  # нужен id для upload_refs
+    sync_refs(db, "history", db_event.id, [db_event.image])
     db.commit()
     db.refresh(db_event)
 
@@ -258,6 +270,7 @@ async def update_history_event(
     if event.image is not None: db_event.image = event.image
     if event.order is not None: db_event.order = event.order
 
+    sync_refs(db, "history", event_id, [db_event.image])
     db.commit()
 
     return {"message": "Event updated"}
@@ -276,6 +289,7 @@ async def delete_history_event(
         raise HTTPException(status_code=404, detail="Event not found")
 
     db.delete(db_event)
+    sync_refs(db, "history", event_id, [])
     db.commit()
 
     return {"message": "Event deleted"}
@@ -305,7 +319,9 @@ async def update_hero_content(
     hero.button_hover_text_color = content.buttonHoverTextColor
     hero.button_hover_bg_color = content.buttonHoverBgColor
 
+    sync_refs(db, "hero", 1, [hero.image, hero.mobile_image])
     db.commit()
+    invalidate_pages("")
     return {"message": "Hero content updated"}
 
 @router.get("/api/admin/content/promo-banner")
@@ -356,6 +372,7 @@ async def update_promo_banner(
     db_banner.highlight_color = banner.highlightColor
     
     db.commit()
+    invalidate_pages()
     
     return {"message": "Promo banner updated"}
 
@@ -469,6 +486,8 @@ async def get_boutique_content(db: Session = Depends(get_db)):
             "gallery": []
         }
 
+    gallery = json.loads(content.gallery) if content.gallery else []
+
     return {
         "hero": {
             "title": content.hero_title,
@@ -483,7 +502,10 @@ async def get_boutique_content(db: Session = Depends(get_db)):
             "imagePosition": content.info_image_position
         },
         "services": json.loads(content.services) if content.services else [],
-        "gallery": json.loads(content.gallery) if content.gallery else []
+        "gallery": gallery,
+        "imageVariants": image_variants(
+            db, [content.hero_image, content.info_image] + [item.get("url") for item in gallery]
+        )
     }
 
 
@@ -527,6 +549,7 @@ async def update_boutique_content(
     content.services = json.dumps([s.dict() for s in data.services], ensure_ascii=False)
     content.gallery = json.dumps([g.dict() for g in data.gallery], ensure_ascii=False)
 
+    sync_refs(db, "boutique", 1, boutique_urls(content))
     db.commit()
 
     return {"message": "Boutique content updated"}
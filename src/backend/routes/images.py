@@ -0,0 +1,187 @@
+"""
+On-demand image resize routes.
+/img/{width}x{height}/{path} serves any image from the uploads dir fitted into width x height
+(0 = no limit). The first request renders it in the image process pool; the result is kept
+in a content-addressed disk cache and later hits are plain file responses. Cache file system
+calls (the hit check, size accounting, eviction) run in the threadpool, not on the event loop.
+
+Settings (env):
+    IMAGE_CACHE_DIR         - cache directory, default <UPLOAD_DIR>/../image_cache
+    IMAGE_CACHE_MAX_MB      - cache size limit, least recently used files are evicted, default 1024
+    IMAGE_RESIZE_MAX_SIZE   - max width/height accepted, default 2560
+    IMAGE_RESIZE_CONCURRENCY - resizes running at once, default 2
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+from image_pipeline import UPLOAD_DIR, SOURCE_EXTENSIONS, VARIANT_QUALITY, get_pool, render_resized
+
+router = APIRouter()
+logger = logging.getLogger("orient.images")
+
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(UPLOAD_DIR)), "image_cache"))
+CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "1024")) * 1024 * 1024
+MAX_SIZE = int(os.getenv("IMAGE_RESIZE_MAX_SIZE", "2560"))
+RESIZE_CONCURRENCY = int(os.getenv("IMAGE_RESIZE_CONCURRENCY", "2"))
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+class ImageCache:
+    """Files named by the hash of (source, size, format); evicts least recently used when over max_bytes"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None  # считается при первой записи
+        self.lock = threading.Lock()  # added() идет из нескольких потоков threadpool
+        self.in_flight = {}
+        self.semaphore = None
+
+    def path_for(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    def hit(self, path):
+        """Mark a hit for LRU (mtime = last access); False if the file is not cached.
+        One utime instead of exists + utime (blocking, run in threadpool)."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            pass  # файл есть, но mtime не обновить - отдаем как есть
+        return True
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def added(self, path, nbytes):
+        """Account a new file and evict old ones when over the limit (blocking, run in threadpool).
+        The new file itself is never evicted - it is about to be served."""
+        with self.lock:
+            self._account(path, nbytes)
+
+    def _account(self, path, nbytes):
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self._scan())
+        else:
+            self.size += nbytes
+        if self.size <= self.max_bytes:
+            return
+        entries = sorted(self._scan())
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, old_path in entries:
+            if self.size <= target:
+                break
+            if old_path == path:
+                continue
+            try:
+                os.remove(old_path)
+                self.size -= size
+            except OSError:
+                pass
+
+    async def get_or_render(self, key, fmt, render):
+        """Path of the cached file; concurrent misses for one key share a single render"""
+        path = self.path_for(key, fmt)
+        task = self.in_flight.get(key)
+        if task is None:
+            if await run_in_threadpool(self.hit, path):
+                return path
+            task = self.in_flight.get(key)  # мог начаться, пока шла проверка
+        if task is None:
+            task = asyncio.ensure_future(self._render(path, render))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _render(self, path, render):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(RESIZE_CONCURRENCY)
+        await run_in_threadpool(os.makedirs, os.path.dirname(path), exist_ok=True)
+        async with self.semaphore:
+            nbytes = await render(path)
+        await run_in_threadpool(self.added, path, nbytes)
+        return path
+
+
+CACHE = ImageCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+
+_formats = None
+
+
+def _supported_formats():
+    global _formats
+    if _formats is None:
+        from PIL import features
+        _formats = {"webp", "jpeg", "png"} | ({"avif"} if features.check("avif") else set())
+    return _formats
+
+
+def negotiate_format(accept, source_ext):
+    """Best output format the browser accepts; falls back to the source format"""
+    if "image/avif" in accept and "avif" in _supported_formats():
+        return "avif"
+    if "image/webp" in accept:
+        return "webp"
+    return "png" if source_ext == ".png" else "jpeg"
+
+
+@router.get("/img/{width:int}x{height:int}/{path:path}")
+async def resized_image(width: int, height: int, path: str, request: Request):
+    """Resized copy of /uploads/<path>, e.g. /img/640x0/abc.jpg"""
+    if width > MAX_SIZE or height > MAX_SIZE or (width == 0 and height == 0):
+        raise HTTPException(status_code=400, detail=f"Size must be between 1 and {MAX_SIZE}")
+
+    upload_root = os.path.realpath(UPLOAD_DIR)
+    source = os.path.realpath(os.path.join(upload_root, path))
+    ext = os.path.splitext(source)[1].lower()
+    if not source.startswith(upload_root + os.sep) or ext not in SOURCE_EXTENSIONS:
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        stat = os.stat(source)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    fmt = negotiate_format(request.headers.get("accept", ""), ext)
+    # Ключ зависит от содержимого оригинала (размер + mtime), поэтому замена файла дает новый ключ
+    key = hashlib.sha256(
+        f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{width}x{height}|{fmt}|{VARIANT_QUALITY}".encode()
+    ).hexdigest()
+
+    async def render(dest_path):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_pool(), render_resized, source, dest_path, width, height, fmt, VARIANT_QUALITY)
+
+    try:
+        cached = await CACHE.get_or_render(key, fmt, render)
+    except Exception:
+        logger.exception("Failed to resize %s to %sx%s", path, width, height)
+        raise HTTPException(status_code=422, detail="Image could not be processed")
+
+    return FileResponse(
+        cached,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Cache-Control": CACHE_CONTROL, "Vary": "Accept"},
+    )
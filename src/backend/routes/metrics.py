@@ -0,0 +1,42 @@
+"""
+Metrics routes - Prometheus scrape endpoint
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from auth import verify_token, get_current_user, require_admin
+from monitoring import REGISTRY
+
+router = APIRouter()
+
+optional_bearer = HTTPBearer(auto_error=False)
+
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+PROXY_HEADERS = ("x-forwarded-for", "x-real-ip")
+
+
+def require_metrics_access(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    db: Session = Depends(get_db)
+):
+    """Local scrapers are let through; anything else (including requests proxied by Nginx) needs an admin token"""
+    client_host = request.client.host if request.client else None
+    proxied = any(header in request.headers for header in PROXY_HEADERS)
+    if client_host in LOCAL_HOSTS and not proxied:
+        return None
+
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Metrics are available from localhost or to admins")
+
+    return require_admin(get_current_user(verify_token(credentials), db))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(current_user=Depends(require_metrics_access)):
+    """Prometheus text exposition of request and event-loop metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,59 +1,103 @@
 """
 Orders routes
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import Optional
 import json
 from datetime import datetime
-from telegram_bot import notify_new_order, notify_order_status
+from telegram_bot import notify_new_order, notify_order_status, wake_dispatcher
 from fastapi import BackgroundTasks # Добавь BackgroundTasks в импорты fastapi
 from database import get_db, Order
-from schemas import OrderCreate, OrderStatusUpdate
+from inventory import HOLD_PAYMENT_METHODS, OutOfStock, reserve_stock, reserve_order_stock, release_order_stock, invalidate_product_pages
+from idempotency import claim as claim_idempotency_key
+from numbering import next_number
+from order_items import priced_order_items
+from pricing import price_cart
+from schemas import OrderCreate, OrderStatusUpdate, CartPriceRequest
 from auth import require_admin
 
 router = APIRouter()
 
 def generate_order_number():
-    """Generate unique order number"""
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    return f"ORD-{timestamp}"
+    """Generate unique order number (ORD-YYYYMMDD-NNNNNN)"""
+    return next_number("ORD")
 
 @router.post("/api/orders")
-async def create_order(order: OrderCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Create new order (public endpoint)"""
-    # Generate order number
+async def create_order(
+    order: OrderCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Create new order (public endpoint); a retry with the same Idempotency-Key gets the same order"""
     if order.website_check:
         # Можно вернуть ошибку, но лучше вернуть "Успех", чтобы бот думал, что все ок
         return {"message": "Order created successfully", "orderNumber": "BOT-IGNORED", "id": -1}
-    order_number = generate_order_number()
-    
-    # Create order
-    db_order = Order(
-        order_number=order_number,
-        customer_data=json.dumps(order.customer.dict()),
-        items=json.dumps([item.dict() for item in order.items]),
-        subtotal=order.subtotal,
-        shipping=order.shipping,
-        total=order.total,
-        payment_method=order.paymentMethod,
-        delivery_method=order.deliveryMethod,
-        delivery_address=json.dumps(order.deliveryAddress.dict()) if order.deliveryAddress else None,
-        notes=order.notes,
-        status="pending"
-    )
-    
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+    claim = await claim_idempotency_key(db, "orders", idempotency_key, order.dict())
+    if claim.replay is not None:
+        return claim.replay
+    # При ошибке сессия откатывается, а ключ освобождается для повтора
+    with claim:
+        # Цены, скидка и доставка - только серверные; суммы от клиента игнорируются
+        priced = price_cart(db, [item.dict() for item in order.items], order.promoCode, order.deliveryMethod)
+        items = [{"productId": line["productId"], "quantity": line["quantity"], "price": line["price"]}
+                 for line in priced["items"]]
+        notes = order.notes
+        if priced["promo"] and priced["promo"]["code"] not in (notes or ""):
+            promo_note = f"Промокод: {priced['promo']['code']} (-{priced['promo']['discountPercent']:g}%)"
+            notes = f"{promo_note}\n{notes}" if notes else promo_note
 
-    background_tasks.add_task(notify_new_order, db, db_order)
+        # Generate order number
+        order_number = generate_order_number()
+        created_at = datetime.utcnow()
+        db_order = Order(
+            order_number=order_number,
+            customer_data=json.dumps(order.customer.dict()),
+            items=json.dumps(items),
+            subtotal=priced["subtotal"],
+            shipping=priced["shipping"],
+            total=priced["total"],
+            payment_method=order.paymentMethod,
+            delivery_method=order.deliveryMethod,
+            delivery_address=json.dumps(order.deliveryAddress.dict()) if order.deliveryAddress else None,
+            notes=notes,
+            status="pending",
+            created_at=created_at,
+        )
+        # Строки заказа со снимком товаров (для аналитики) - из уже загруженной корзины
+        db_order.order_items = priced_order_items(priced["items"], created_at)
 
-    return {
-        "message": "Order created successfully",
-        "orderNumber": order_number,
-        "id": db_order.id
-    }
+        db.add(db_order)
+        # Списание со склада в той же транзакции; при нехватке - 409 и откат всего заказа
+        sold_out = reserve_stock(db, db_order, [(line["productId"], line["quantity"]) for line in priced["items"]],
+                                 hold=order.paymentMethod in HOLD_PAYMENT_METHODS)
+        # Уведомление пишется в outbox в той же транзакции, что и заказ
+        notify_new_order(db, db_order)
+        db.flush()
+        response = {
+            "message": "Order created successfully",
+            "orderNumber": order_number,
+            "id": db_order.id,
+            "subtotal": db_order.subtotal,
+            "shipping": db_order.shipping,
+            "total": db_order.total
+        }
+        # Ответ сохраняется для повторов с тем же Idempotency-Key - в той же транзакции
+        claim.save(response)
+        # Без refresh после commit: сессия не берет соединение снова и не держит его до закрытия
+        # (закрытие идет после ответа - при сотнях одновременных заказов пул соединений кончался)
+        db.commit()
+
+    invalidate_product_pages(sold_out)
+    background_tasks.add_task(wake_dispatcher)
+
+    return response
+
+@router.post("/api/cart/price")
+async def price_cart_endpoint(cart: CartPriceRequest, db: Session = Depends(get_db)):
+    """Authoritative cart pricing (public): current prices, promo discount, shipping"""
+    return price_cart(db, [item.dict() for item in cart.items], cart.promoCode, cart.deliveryMethod)
 
 @router.get("/api/admin/orders")
 async def get_orders(
@@ -153,11 +197,24 @@ async def update_order_status(
     if status_update.note:
         order.notes = status_update.note
 
-    db.commit()
+    # Отмена возвращает товар на склад, восстановление отмененного заказа списывает его снова
+    changed_products = []
+    if status_update.status == "cancelled" and old_status != "cancelled":
+        changed_products = release_order_stock(db, order.id)
+    elif old_status == "cancelled" and status_update.status != "cancelled":
+        try:
+            changed_products = reserve_order_stock(db, order, hold=False)
+        except OutOfStock:
+            db.rollback()
+            raise
 
     # Отправка уведомления только если статус реально изменился
     if old_status != status_update.status:
-        background_tasks.add_task(notify_order_status, db, order_id, old_status, status_update.status)
+        notify_order_status(db, order_id, old_status, status_update.status)
+        background_tasks.add_task(wake_dispatcher)
+
+    db.commit()
+    invalidate_product_pages(changed_products)
 
     return {
         "message": "Order status updated",
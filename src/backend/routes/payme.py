@@ -1,21 +1,43 @@
 """
 Payme payment integration routes
 Documentation: https://developer.help.paycom.uz/
+
+The callback is a state machine over Transaction.state:
+    1 (created) -> 2 (performed) -> -2 (cancelled after perform, refund)
+    1 (created) -> -1 (cancelled: CancelTransaction or the 12 h timeout)
+Every method does one indexed lookup per entity (transactions.payme_trans_id, orders.order_number)
+and at most one commit. State changes are compare-and-set (UPDATE ... WHERE state = <seen state>),
+so concurrent calls for one transaction serialize on the row and the loser answers from the state
+the winner left. A partial unique index keeps one created transaction per order.
+Handlers are synchronous and run in the threadpool, off the event loop.
+Created transactions past the timeout are also expired in the background (expire_stale_transactions,
+run by scheduler.py), and unpaid Payme orders are abandoned there (abandon_unpaid_orders).
+GetStatement is streamed: one range scan over the transactions.time index, PAYME_STATEMENT_BATCH
+rows per chunk, only the columns the answer needs and `account` spliced in as the stored JSON.
 """
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, exists, select, true, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
 import base64
+import logging
 import time
 import json
-import sys
 import os
+from datetime import datetime, timedelta
 
-from database import get_db, Order, Transaction
+from database import engine, get_db, Order, Transaction
+from inventory import (
+    PAYME_HOLD, STOCK_RESERVATION_TTL, commit_order_stock, extend_hold, release_order_stock, release_orders_stock,
+    invalidate_product_pages,
+)
 from auth import require_admin
 
 router = APIRouter()
+logger = logging.getLogger("orient.payme")
 
 # === НАСТРОЙКИ PAYME ===
 PAYME_MERCHANT_ID = os.getenv("PAYME_MERCHANT_ID")
@@ -23,50 +45,29 @@ PAYME_TEST_KEY = os.getenv("PAYME_TEST_KEY")
 PAYME_KEY = os.getenv("PAYME_KEY") # Боевой ключ
 # Читаем URL из env, если нет — ставим боевой по умолчанию
 PAYME_CHECKOUT_URL = os.getenv("PAYME_CHECKOUT_URL", "https://checkout.paycom.uz")
-# --- Хелперы для работы с данными транзакции в Notes ---
 
-def get_transaction_data(order_notes: str) -> dict:
-    """Извлекает JSON данные транзакции из поля notes"""
-    if not order_notes:
-        return None
+# Состояния транзакции
+STATE_CREATED = 1
+STATE_PERFORMED = 2
+STATE_CANCELLED = -1
+STATE_CANCELLED_AFTER_PERFORM = -2
+REASON_EXECUTION_ERROR = 3
+REASON_TIMEOUT = 4
+TRANSACTION_TIMEOUT_MS = 43200000  # 12 часов
+AMOUNT_TOLERANCE = 10  # тийинов
+STATEMENT_BATCH = int(os.getenv("PAYME_STATEMENT_BATCH", "1000"))  # строк GetStatement на чанк ответа
+EXPIRY_BATCH = int(os.getenv("PAYME_EXPIRY_BATCH", "500"))  # строк на транзакцию фонового истечения
+FINAL_STATUSES = ("completed", "cancelled")
 
-    marker = "[Payme Transaction]"
-    if marker not in order_notes:
-        return None
 
-    try:
-        # Ищем строку с маркером
-        for line in order_notes.split('\n'):
-            if marker in line:
-                json_str = line.split(marker)[1].strip()
-                return json.loads(json_str)
-    except:
-        return None
-    return None
-
-def update_transaction_data(order, new_data: dict):
-    """Обновляет данные транзакции в notes"""
-    marker = "[Payme Transaction]"
-    json_str = json.dumps(new_data)
-    new_line = f"{marker} {json_str}"
-
-    if not order.notes:
-        order.notes = new_line
-    elif marker in order.notes:
-        # Заменяем существующую строку
-        lines = order.notes.split('\n')
-        new_lines = []
-        replaced = False
-        for line in lines:
-            if marker in line:
-                if not replaced:
-                    new_lines.append(new_line)
-                    replaced = True
-            else:
-                new_lines.append(line)
-        order.notes = '\n'.join(new_lines)
-    else:
-        order.notes = f"{order.notes}\n{new_line}"
+class PaymeError(Exception):
+    """JSON-RPC error returned to Payme; the session is rolled back unless already committed"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
 
 def verify_payme_auth(auth_header: str) -> bool:
     """Проверка авторизации"""
@@ -87,12 +88,11 @@ def verify_payme_auth(auth_header: str) -> bool:
         # Проверяем ключ (сначала боевой, потом тестовый)
         # Важно: В Payme Sandbox пароль может быть тестовым ключом
         if key != PAYME_KEY and key != PAYME_TEST_KEY:
-            print(f"PAYME AUTH FAILED: {merchant_id}:{key}")
-            sys.stdout.flush()
+            logger.warning("Payme auth failed for merchant %r", merchant_id)
             return False
 
         return True
-    except:
+    except Exception:
         return False
 
 # --- Endpoints ---
@@ -106,11 +106,12 @@ class PaymeInitResponse(BaseModel):
 
 @router.post("/api/payme/init")
 async def init_payme_payment(data: PaymeInitRequest, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.order_number == data.order_id).first()
-    if not order:
+    total = db.query(Order.total).filter(Order.order_number == data.order_id).scalar()
+    if total is None:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    amount_tiyin = int(data.amount * 100)
+    # Сумма - из заказа (цены считает сервер), а не присланная клиентом
+    amount_tiyin = int(round(total * 100))
 
     # Определяем URL сайта для редиректа
     site_url = os.getenv("VITE_SITE_URL", "https://orientwatch.uz")
@@ -124,17 +125,7 @@ async def init_payme_payment(data: PaymeInitRequest, db: Session = Depends(get_d
     params_str = ";".join([f"{k}={v}" for k, v in params.items()])
     params_base64 = base64.b64encode(params_str.encode()).decode()
     checkout_url = f"{PAYME_CHECKOUT_URL}/{params_base64}"
-    print("\n" + "=" * 60)
-    print("PAYME INIT DEBUG")
-    print("=" * 60)
-    print(f"1. ИСПОЛЬЗУЕМЫЙ MERCHANT ID: '{PAYME_MERCHANT_ID}'")
-    print(f"2. БАЗОВЫЙ URL PAYME:       '{PAYME_CHECKOUT_URL}'")
-    print(f"3. ПАРАМЕТРЫ (ДЕКОДИРОВАННЫЕ):")
-    print(f"   {params_str}")
-    print(f"4. ИТОГОВАЯ ССЫЛКА (ЧТО МЫ ОТДАЕМ КЛИЕНТУ):")
-    print(f"   {checkout_url}")
-    print("=" * 60 + "\n")
-    sys.stdout.flush()
+    logger.debug("Payme checkout for %s: %s -> %s", data.order_id, params_str, checkout_url)
     return PaymeInitResponse(checkout_url=checkout_url)
 
 @router.post("/api/payme/callback")
@@ -146,305 +137,375 @@ async def payme_callback(request: Request, db: Session = Depends(get_db)):
     try:
         body = await request.json()
         method = body.get("method")
-        params = body.get("params", {})
+        params = body.get("params") or {}
         request_id = body.get("id")
-    except:
+    except Exception:
         return {"error": {"code": -32700, "message": "Parse error"}}
 
-    handlers = {
-        "CheckPerformTransaction": handle_check_perform_transaction,
-        "CreateTransaction": handle_create_transaction,
-        "PerformTransaction": handle_perform_transaction,
-        "CancelTransaction": handle_cancel_transaction,
-        "CheckTransaction": handle_check_transaction,
-        "GetStatement": handle_get_statement,  # <--- ДОБАВЛЕН МЕТОД
-        "ChangePassword": lambda p, i, d: {"result": {"success": True}, "id": i}
-    }
-
-    if method in handlers:
-        return handlers[method](params, request_id, db)
-    else:
+    if method == "GetStatement":
+        try:
+            window = statement_window(params)
+        except PaymeError as e:
+            return {"error": {"code": e.code, "message": e.message}, "id": request_id}
+        return StreamingResponse(statement_chunks(*window, request_id), media_type="application/json")
+    handler = HANDLERS.get(method)
+    if handler is None:
         return {"error": {"code": -32601, "message": "Method not found"}, "id": request_id}
+    return await run_in_threadpool(dispatch, handler, params, request_id, db)
 
-# --- Handlers ---
 
-def handle_check_perform_transaction(params: dict, request_id: int, db: Session):
-    order_id = params.get("account", {}).get("order_id")
-    amount = params.get("amount")
+def dispatch(handler, params: dict, request_id, db: Session):
+    try:
+        return {"result": handler(db, params), "id": request_id}
+    except PaymeError as e:
+        db.rollback()
+        return {"error": {"code": e.code, "message": e.message}, "id": request_id}
+    except Exception:
+        # Payme ждет HTTP 200 с объектом error, а не 500
+        db.rollback()
+        logger.exception("Payme %s failed", handler.__name__)
+        return {"error": {"code": -32400, "message": "System error"}, "id": request_id}
 
-    if not order_id:
-        return {"error": {"code": -31050, "message": "Order ID missing"}, "id": request_id}
+# --- Lookups ---
 
-    order = db.query(Order).filter(Order.order_number == order_id).first()
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def find_order(db: Session, params: dict) -> Order:
+    order_id = (params.get("account") or {}).get("order_id")
+    if not order_id:
+        raise PaymeError(-31050, "Order ID missing")
+    order = db.query(Order).filter(Order.order_number == str(order_id)).first()
     if not order:
-        return {"error": {"code": -31050, "message": "Order not found"}, "id": request_id}
+        raise PaymeError(-31050, "Order not found")
+    return order
+
+
+def find_transaction(db: Session, payme_id) -> Transaction:
+    transaction = db.query(Transaction).filter(Transaction.payme_trans_id == payme_id).first()
+    if not transaction:
+        raise PaymeError(-31003, "Transaction not found")
+    return transaction
 
-    expected_amount = int(order.total * 100)
-    if abs(int(amount) - expected_amount) > 10:
-        return {"error": {"code": -31001, "message": "Wrong amount"}, "id": request_id}
 
+def check_payable(order: Order, amount):
+    """CheckPerformTransaction rules on an already loaded order"""
+    try:
+        amount = int(amount)
+    except (TypeError, ValueError):
+        raise PaymeError(-31001, "Wrong amount")
+    if abs(amount - int(round(order.total * 100))) > AMOUNT_TOLERANCE:
+        raise PaymeError(-31001, "Wrong amount")
+    if order.status == "cancelled":
+        # Заказ отменен (в т.ч. истек резерв товара) - товар мог уже уйти другому покупателю
+        raise PaymeError(-31051, "Order cancelled")
     if order.status == "completed":
-        # Если статус уже completed, но транзакция не найдена (редкий кейс),
-        # то позволяем, иначе Payme может вернуть ошибку.
-        # Но по документации, если заказ оплачен - возвращаем ошибку, если это новая попытка
-        return {"error": {"code": -31008, "message": "Order already paid"}, "id": request_id}
+        raise PaymeError(-31008, "Order already paid")
 
-    return {"result": {"allow": True}, "id": request_id}
 
-def handle_create_transaction(params: dict, request_id: int, db: Session):
-    transaction_id = params.get("id")
-    order_id = params.get("account", {}).get("order_id")
-    time_param = params.get("time") # Время создания от Payme
-    amount = params.get("amount")
+def expired(transaction: Transaction, at_ms: int) -> bool:
+    return at_ms - transaction.create_time > TRANSACTION_TIMEOUT_MS
 
-    # 1. Сначала проверяем CheckPerform логику
-    check_res = handle_check_perform_transaction(params, request_id, db)
-    if "error" in check_res and check_res["error"]["code"] != -31008:
-        return check_res
 
-    # 2. Ищем существующую транзакцию в БД
-    transaction = db.query(Transaction).filter(Transaction.payme_trans_id == transaction_id).first()
+def change_state(db: Session, transaction: Transaction, values: dict) -> bool:
+    """Compare-and-set from the state we have read; False if another call changed it first"""
+    changed = db.query(Transaction).filter(
+        Transaction.id == transaction.id, Transaction.state == transaction.state,
+    ).update(values, synchronize_session=False)
+    return bool(changed)
 
-    if transaction:
-        # Идемпотентность: если транзакция уже есть, возвращаем её статус
-        if transaction.state != 1:
-             return {"error": {"code": -31008, "message": "Transaction already processed"}, "id": request_id}
-
-        # Проверка тайм-аута (43200000 ms = 12 часов)
-        if int(time.time() * 1000) - transaction.create_time > 43200000:
-             transaction.state = -1
-             transaction.reason = 4
-             db.commit()
-             return {"error": {"code": -31008, "message": "Transaction expired"}, "id": request_id}
-
-        return {
-            "result": {
-                "create_time": transaction.create_time,
-                "transaction": str(transaction.id),
-                "state": 1
-            },
-            "id": request_id
-        }
-
-    # 3. Проверяем, нет ли другой активной транзакции для этого заказа
-    active_tx = db.query(Transaction).filter(
-        Transaction.order_id == order_id,
-        Transaction.state == 1
-    ).first()
-
-    if active_tx:
-        return {"error": {"code": -31050, "message": "Order has pending transaction"}, "id": request_id}
-
-    # 4. Создаем новую транзакцию
-    try:
-        new_tx = Transaction(
-            payme_trans_id=transaction_id,
-            time=time_param,
-            amount=amount,
-            account=json.dumps(params.get("account")),
-            create_time=time_param, # Важно использовать время Payme
-            state=1,
-            order_id=order_id
-        )
-        db.add(new_tx)
-
-        # Обновляем статус заказа
-        order = db.query(Order).filter(Order.order_number == order_id).first()
-        if order:
-            order.status = "processing"
-            # Сохраняем в notes для совместимости со старым кодом, если нужно
-            update_transaction_data(order, {
-                "transaction_id": transaction_id,
-                "create_time": time_param,
-                "state": 1
-            })
 
-        db.commit()
-        db.refresh(new_tx)
-
-        return {
-            "result": {
-                "create_time": time_param,
-                "transaction": str(new_tx.id),
-                "state": 1
-            },
-            "id": request_id
-        }
-    except Exception as e:
-        print(f"Error creating transaction: {e}")
-        return {"error": {"code": -31008, "message": "Internal error"}, "id": request_id}
-
-def handle_perform_transaction(params: dict, request_id: int, db: Session):
-    transaction_id = params.get("id")
-
-    # Ищем транзакцию в таблице Transaction
-    transaction = db.query(Transaction).filter(Transaction.payme_trans_id == transaction_id).first()
+def cancel_order(db: Session, order_number: str, stock_statuses):
+    """Order -> cancelled, its stock back on the shelf; returns products to re-render after commit"""
+    order = db.query(Order).filter(Order.order_number == order_number).first()
+    if not order:
+        return []
+    order.status = "cancelled"
+    return release_order_stock(db, order.id, statuses=stock_statuses)
 
-    if not transaction:
-        return {"error": {"code": -31003, "message": "Transaction not found"}, "id": request_id}
-
-    if transaction.state == 1:
-        if int(time.time() * 1000) - transaction.create_time > 43200000:
-             transaction.state = -1
-             transaction.reason = 4
-             db.commit()
-             return {"error": {"code": -31008, "message": "Timeout"}, "id": request_id}
-
-        # Выполняем
-        perform_time = int(time.time() * 1000)
-        transaction.state = 2
-        transaction.perform_time = perform_time
-        db.commit()
 
-        # Обновляем заказ
-        order = db.query(Order).filter(Order.order_number == transaction.order_id).first()
-        if order:
-            order.status = "completed"
-            # Обновляем legacy notes
-            update_transaction_data(order, {
-                "transaction_id": transaction_id,
-                "create_time": transaction.create_time,
-                "perform_time": perform_time,
-                "state": 2
-            })
+def expire(db: Session, transaction: Transaction, at_ms: int):
+    """12 h passed without PerformTransaction: cancel with reason 4 and commit"""
+    if change_state(db, transaction, {"state": STATE_CANCELLED, "reason": REASON_TIMEOUT, "cancel_time": at_ms}):
+        released = cancel_order(db, transaction.order_id, ("held",))
+        db.commit()
+        invalidate_product_pages(released)
+
+# --- Background expiry (scheduler.py) ---
+
+def _cancel_orders(db: Session, candidates, recheck, batch: int):
+    """
+    Cancel up to `batch` orders matching `candidates` and return their held stock. The UPDATE goes
+    by primary key and re-checks the order is still open plus `recheck`, conditions no index is
+    picked for - otherwise SQLite (no ANALYZE stats) walks ix_orders_status_created_at instead.
+    Returns (orders picked, orders cancelled, reservations released, products back on sale).
+    """
+    picked = db.execute(select(Order.id).where(candidates).limit(batch)).scalars().all()
+    if not picked:
+        return 0, [], 0, []
+    order_ids = db.execute(
+        update(Order).where(Order.id.in_(picked), Order.status.notin_(FINAL_STATUSES), recheck)
+        .values(status="cancelled").returning(Order.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    released, back_on_sale = release_orders_stock(db, order_ids, ("held",))
+    return len(picked), order_ids, released, back_on_sale
+
+
+def expire_stale_transactions(db: Session, at_ms: int = None, batch: int = EXPIRY_BATCH):
+    """
+    What a late Payme call would do to every created transaction past the 12 h timeout: state -1,
+    reason 4, the order cancelled and its held stock returned. `batch` transactions per commit,
+    found through ix_transactions_active_create_time; the UPDATE re-checks state = 1, so a Perform
+    or Cancel that got there first is left alone. Returns swept counts.
+    """
+    at_ms = at_ms or now_ms()
+    swept = {"transactions": 0, "orders": 0, "reservations": 0}
+    while True:
+        stale = select(Transaction.id).where(
+            Transaction.state == STATE_CREATED, Transaction.create_time < at_ms - TRANSACTION_TIMEOUT_MS,
+        ).limit(batch)
+        order_numbers = db.execute(
+            update(Transaction).where(Transaction.id.in_(stale.scalar_subquery()), Transaction.state == STATE_CREATED)
+            .values(state=STATE_CANCELLED, reason=REASON_TIMEOUT, cancel_time=at_ms)
+            .returning(Transaction.order_id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if not order_numbers:
+            break
+        _, order_ids, released, back_on_sale = _cancel_orders(
+            db, and_(Order.order_number.in_(order_numbers), Order.status.notin_(FINAL_STATUSES)), true(), batch)
+        db.commit()
+        invalidate_product_pages(back_on_sale)
+        swept["transactions"] += len(order_numbers)
+        swept["orders"] += len(order_ids)
+        swept["reservations"] += released
+        if len(order_numbers) < batch:
+            break
+    return swept
+
+
+def abandon_unpaid_orders(db: Session, now: datetime = None, batch: int = EXPIRY_BATCH):
+    """
+    Payme orders nobody is going to pay, cancelled with their held stock returned:
+        pending     - no transaction was created within STOCK_RESERVATION_TTL of checkout
+        processing  - their transaction timed out (reason 4) and no other one is open or paid
+                      (left "processing" by the callback before timeouts cancelled the order)
+    Found by ranges on ix_orders_status_created_at, `batch` orders per commit. Returns swept counts.
+    """
+    now = now or datetime.utcnow()
+    has_transaction = exists().where(Transaction.order_id == Order.order_number)
+    timed_out = exists().where(Transaction.order_id == Order.order_number,
+                               Transaction.state == STATE_CANCELLED, Transaction.reason == REASON_TIMEOUT)
+    still_payable = exists().where(Transaction.order_id == Order.order_number,
+                                   Transaction.state.in_((STATE_CREATED, STATE_PERFORMED)))
+    rules = (
+        # (кандидаты, повторная проверка в UPDATE - вдруг пришел CreateTransaction)
+        (and_(Order.status == "pending", Order.payment_method == "payme",
+              Order.created_at < now - timedelta(minutes=STOCK_RESERVATION_TTL), ~has_transaction),
+         ~has_transaction),
+        (and_(Order.status == "processing", Order.payment_method == "payme",
+              Order.created_at < now - PAYME_HOLD, timed_out, ~still_payable),
+         ~still_payable),
+    )
+    swept = {"orders": 0, "reservations": 0}
+    for candidates, recheck in rules:
+        while True:
+            picked, order_ids, released, back_on_sale = _cancel_orders(db, candidates, recheck, batch)
             db.commit()
+            invalidate_product_pages(back_on_sale)
+            swept["orders"] += len(order_ids)
+            swept["reservations"] += released
+            if picked < batch:
+                break
+    return swept
 
-        return {
-            "result": {
-                "transaction": str(transaction.id),
-                "perform_time": perform_time,
-                "state": 2
-            },
-            "id": request_id
-        }
-
-    if transaction.state == 2:
-        return {
-            "result": {
-                "transaction": str(transaction.id),
-                "perform_time": transaction.perform_time,
-                "state": 2
-            },
-            "id": request_id
-        }
-
-    return {"error": {"code": -31008, "message": "Transaction cancelled/failed"}, "id": request_id}
-
-def handle_cancel_transaction(params: dict, request_id: int, db: Session):
-    transaction_id = params.get("id")
-    reason = params.get("reason")
-
-    transaction = db.query(Transaction).filter(Transaction.payme_trans_id == transaction_id).first()
 
-    if not transaction:
-        return {"error": {"code": -31003, "message": "Transaction not found"}, "id": request_id}
+# --- Handlers: (db, params) -> result, raise PaymeError ---
 
-    if transaction.state == 1:
-        cancel_time = int(time.time() * 1000)
-        transaction.state = -1
-        transaction.cancel_time = cancel_time
-        transaction.reason = reason
-        db.commit()
+def check_perform_transaction(db: Session, params: dict):
+    check_payable(find_order(db, params), params.get("amount"))
+    return {"allow": True}
 
-        # Обновляем заказ
-        order = db.query(Order).filter(Order.order_number == transaction.order_id).first()
-        if order:
-            order.status = "cancelled"
-            db.commit()
 
-        return {
-            "result": {
-                "transaction": str(transaction.id),
-                "cancel_time": cancel_time,
-                "state": -1
-            },
-            "id": request_id
-        }
-
-    if transaction.state == 2:
-        cancel_time = int(time.time() * 1000)
-        transaction.state = -2
-        transaction.cancel_time = cancel_time
-        transaction.reason = reason
+def create_transaction(db: Session, params: dict):
+    payme_id = params.get("id")
+    transaction = db.query(Transaction).filter(Transaction.payme_trans_id == payme_id).first()
+    if transaction:
+        # Повтор CreateTransaction: отвечаем по сохраненной транзакции
+        if transaction.state != STATE_CREATED:
+            raise PaymeError(-31008, "Transaction already processed")
+        if expired(transaction, now_ms()):
+            expire(db, transaction, now_ms())
+            raise PaymeError(-31008, "Transaction expired")
+        return {"create_time": transaction.create_time, "transaction": str(transaction.id), "state": STATE_CREATED}
+
+    order = find_order(db, params)
+    check_payable(order, params.get("amount"))
+    if db.query(Transaction.id).filter(Transaction.order_id == order.order_number,
+                                       Transaction.state == STATE_CREATED).first():
+        raise PaymeError(-31050, "Order has pending transaction")
+
+    create_time = params.get("time") or now_ms()  # Важно использовать время Payme
+    transaction = Transaction(
+        payme_trans_id=payme_id,
+        time=create_time,
+        amount=params.get("amount"),
+        account=json.dumps(params.get("account")),
+        create_time=create_time,
+        state=STATE_CREATED,
+        order_id=order.order_number,
+    )
+    db.add(transaction)
+    order.status = "processing"
+    # Товар держится, пока транзакцию можно оплатить
+    extend_hold(db, order.id, datetime.utcfromtimestamp(int(create_time) / 1000) + PAYME_HOLD)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Одновременный CreateTransaction: тот же id уже записан или у заказа уже есть активная транзакция
+        db.rollback()
+        existing = db.query(Transaction).filter(Transaction.payme_trans_id == payme_id).first()
+        if existing and existing.state == STATE_CREATED:
+            return {"create_time": existing.create_time, "transaction": str(existing.id), "state": STATE_CREATED}
+        raise PaymeError(-31050, "Order has pending transaction")
+    result = {"create_time": create_time, "transaction": str(transaction.id), "state": STATE_CREATED}
+    db.commit()
+    return result
+
+
+def perform_transaction(db: Session, params: dict):
+    transaction = find_transaction(db, params.get("id"))
+    if transaction.state == STATE_PERFORMED:
+        return {"transaction": str(transaction.id), "perform_time": transaction.perform_time, "state": STATE_PERFORMED}
+    if transaction.state != STATE_CREATED:
+        raise PaymeError(-31008, "Transaction cancelled/failed")
+    if expired(transaction, now_ms()):
+        expire(db, transaction, now_ms())
+        raise PaymeError(-31008, "Timeout")
+
+    order = db.query(Order).filter(Order.order_number == transaction.order_id).first()
+    if order is not None and order.status == "cancelled":
+        # Заказ отменили, пока транзакция ждала оплаты (админка) - резерв уже снят, списывать нечего
+        if not change_state(db, transaction, {"state": STATE_CANCELLED, "reason": REASON_EXECUTION_ERROR,
+                                              "cancel_time": now_ms()}):
+            db.rollback()
+            return perform_transaction(db, params)
         db.commit()
+        raise PaymeError(-31008, "Order cancelled")
+
+    perform_time = now_ms()
+    if not change_state(db, transaction, {"state": STATE_PERFORMED, "perform_time": perform_time}):
+        # Другой вызов успел раньше - отвечаем по его результату
+        db.rollback()
+        return perform_transaction(db, params)
+
+    if order is not None:
+        # Отмена могла успеть между проверкой и записью - тогда заново, уже по отмененному заказу
+        if not db.query(Order).filter(Order.id == order.id, Order.status != "cancelled").update(
+                {"status": "completed"}, synchronize_session=False):
+            db.rollback()
+            return perform_transaction(db, params)
+        commit_order_stock(db, order.id)
+    result = {"transaction": str(transaction.id), "perform_time": perform_time, "state": STATE_PERFORMED}
+    db.commit()
+    return result
+
+
+def cancel_transaction(db: Session, params: dict):
+    transaction = find_transaction(db, params.get("id"))
+    if transaction.state == STATE_CREATED:
+        new_state, stock_statuses = STATE_CANCELLED, ("held",)
+    elif transaction.state == STATE_PERFORMED:
+        # Возврат средств - товар возвращается на склад
+        new_state, stock_statuses = STATE_CANCELLED_AFTER_PERFORM, ("held", "committed")
+    else:
+        return {"transaction": str(transaction.id), "cancel_time": transaction.cancel_time, "state": transaction.state}
 
-        # Обновляем заказ (возврат средств)
-        order = db.query(Order).filter(Order.order_number == transaction.order_id).first()
-        if order:
-            order.status = "cancelled"
-            db.commit()
+    cancel_time = now_ms()
+    if not change_state(db, transaction, {"state": new_state, "cancel_time": cancel_time,
+                                          "reason": params.get("reason")}):
+        db.rollback()
+        return cancel_transaction(db, params)
 
-        return {
-            "result": {
-                "transaction": str(transaction.id),
-                "cancel_time": cancel_time,
-                "state": -2
-            },
-            "id": request_id
-        }
+    released = cancel_order(db, transaction.order_id, stock_statuses)
+    result = {"transaction": str(transaction.id), "cancel_time": cancel_time, "state": new_state}
+    db.commit()
+    invalidate_product_pages(released)
+    return result
 
+
+def check_transaction(db: Session, params: dict):
+    transaction = find_transaction(db, params.get("id"))
     return {
-        "result": {
-            "transaction": str(transaction.id),
-            "cancel_time": transaction.cancel_time,
-            "state": transaction.state
-        },
-        "id": request_id
+        "create_time": transaction.create_time,
+        "perform_time": transaction.perform_time,
+        "cancel_time": transaction.cancel_time,
+        "transaction": str(transaction.id),
+        "state": transaction.state,
+        "reason": transaction.reason
     }
 
-def handle_check_transaction(params: dict, request_id: int, db: Session):
-    transaction_id = params.get("id")
 
-    transaction = db.query(Transaction).filter(Transaction.payme_trans_id == transaction_id).first()
+# --- GetStatement ---
 
-    if not transaction:
-        return {"error": {"code": -31003, "message": "Transaction not found"}, "id": request_id}
+STATEMENT_COLUMNS = (
+    Transaction.payme_trans_id, Transaction.time, Transaction.amount, Transaction.account,
+    Transaction.create_time, Transaction.perform_time, Transaction.cancel_time,
+    Transaction.id, Transaction.state, Transaction.reason,
+)
 
-    return {
-        "result": {
-            "create_time": transaction.create_time,
-            "perform_time": transaction.perform_time,
-            "cancel_time": transaction.cancel_time,
-            "transaction": str(transaction.id),
-            "state": transaction.state,
-            "reason": transaction.reason
-        },
-        "id": request_id
-    }
 
-# --- НОВЫЙ МЕТОД: GetStatement ---
-def handle_get_statement(params: dict, request_id: int, db: Session):
-    from_time = params.get("from")
-    to_time = params.get("to")
-
-    # Ищем транзакции в указанном диапазоне по полю time (время создания в Payme)
-    # Используем таблицу Transactions, так как мы ее создали в миграции
-    transactions = db.query(Transaction).filter(
-        Transaction.time >= from_time,
-        Transaction.time <= to_time
-    ).all()
-
-    formatted_transactions = []
-    for tx in transactions:
-        formatted_transactions.append({
-            "id": tx.payme_trans_id,
-            "time": tx.time,
-            "amount": tx.amount,
-            "account": json.loads(tx.account) if tx.account else {},
-            "create_time": tx.create_time,
-            "perform_time": tx.perform_time,
-            "cancel_time": tx.cancel_time,
-            "transaction": str(tx.id),
-            "state": tx.state,
-            "reason": tx.reason
-        })
-
-    return {
-        "result": {
-            "transactions": formatted_transactions
-        },
-        "id": request_id
-    }
+def statement_window(params: dict):
+    try:
+        return int(params["from"]), int(params["to"])
+    except (KeyError, TypeError, ValueError):
+        raise PaymeError(-32600, "from and to are required")
+
+
+def statement_row(row) -> str:
+    """
+    One GetStatement entry as JSON text. Positional unpacking and inline NULL checks: this runs once
+    per transaction. account is stored as JSON by CreateTransaction and goes in as is.
+    """
+    payme_id, at, amount, account, create_time, perform_time, cancel_time, tx_id, state, reason = row
+    return (
+        f'{{"id":{json.dumps(payme_id)},"time":{"null" if at is None else at},'
+        f'"amount":{"null" if amount is None else amount},"account":{account or "{}"},'
+        f'"create_time":{"null" if create_time is None else create_time},'
+        f'"perform_time":{"null" if perform_time is None else perform_time},'
+        f'"cancel_time":{"null" if cancel_time is None else cancel_time},"transaction":"{tx_id}",'
+        f'"state":{"null" if state is None else state},"reason":{"null" if reason is None else reason}}}'
+    )
+
+
+def statement_chunks(start: int, end: int, request_id, batch: int = STATEMENT_BATCH):
+    """
+    GetStatement response body piece by piece. Transactions created in [start, end] (Payme time)
+    in time order; a single SELECT, so the statement is one consistent snapshot however long it streams.
+    """
+    query = select(*STATEMENT_COLUMNS).where(
+        Transaction.time >= start, Transaction.time <= end,
+    ).order_by(Transaction.time, Transaction.id)
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch).execute(query)
+        yield '{"result":{"transactions":['
+        separator = ""
+        for rows in result.partitions():
+            yield separator + ",".join(map(statement_row, rows))
+            separator = ","
+        yield ']},"id":' + json.dumps(request_id) + "}"
+
+
+HANDLERS = {
+    "CheckPerformTransaction": check_perform_transaction,
+    "CreateTransaction": create_transaction,
+    "PerformTransaction": perform_transaction,
+    "CancelTransaction": cancel_transaction,
+    "CheckTransaction": check_transaction,
+    "ChangePassword": lambda db, params: {"success": True},
+}
 
 # Admin endpoint (оставляем для админки)
 @router.get("/api/admin/payme/status/{order_id}")
@@ -467,4 +528,4 @@ async def get_payme_status(
             "state": tx.state,
             "perform_time": tx.perform_time
         } if tx else None
-    }
\ No newline at end of file
+    }
@@ -10,13 +10,60 @@ from datetime import datetime
 from database import get_db, Product
 from schemas import ProductCreate, ProductUpdate
 from auth import require_admin
+from image_pipeline import product_assets, process_upload, process_uploads
+from storage import UploadTooLarge, save_upload, store_stream, sync_refs, product_urls
+from page_cache import invalidate_pages
+from structured_data import refresh_structured_data
+import asyncio
 import os
-import shutil
-from fastapi import File, UploadFile
+import zipfile
+from contextlib import nullcontext
+from fastapi import BackgroundTasks, File, UploadFile
+from starlette.concurrency import run_in_threadpool
 router = APIRouter()
 
+BULK_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+BULK_MAX_FILES = int(os.getenv("BULK_IMAGES_MAX_FILES", "5000"))
+BULK_STORE_CONCURRENCY = 4
+
 # Public endpoints
 
+def feed_item(product: Product) -> dict:
+    """Serialize a product for the public feed"""
+    return {
+        "id": product.id,
+        "name": product.name,
+        "collection": product.collection,
+        "price": product.price,
+        "currency": "RUB",
+        "image": product.image,
+        "images": json.loads(product.images) if product.images else [],
+        "description": product.description,
+        "features": json.loads(product.features) if product.features else [],
+        "specs": json.loads(product.specs) if product.specs else {},
+        "inStock": product.in_stock,
+        "stockQuantity": product.stock_quantity,
+        "sku": product.sku,
+        "isFeatured": product.is_featured,
+        "movement": product.movement,
+        "caseMaterial": product.case_material,
+        "dialColor": product.dial_color,
+        "waterResistance": product.water_resistance,
+        "seo": {
+            "title": product.seo_title,
+            "description": product.seo_description,
+            "keywords": product.seo_keywords
+        },
+        "social": {
+            "fbTitle": product.fb_title,
+            "fbDescription": product.fb_description
+        },
+        "url": f"/product/{product.id}",
+        "createdAt": product.created_at.isoformat() if product.created_at else None,
+        "updatedAt": product.updated_at.isoformat() if product.updated_at else None
+    }
+
+
 @router.get("/api/products/feed")
 async def get_products_feed(db: Session = Depends(get_db)):
     """
@@ -31,41 +78,7 @@ async def get_products_feed(db: Session = Depends(get_db)):
             "currency": "RUB",
             "brand": "Orient Watch"
         },
-        "products": [
-            {
-                "id": product.id,
-                "name": product.name,
-                "collection": product.collection,
-                "price": product.price,
-                "currency": "RUB",
-                "image": product.image,
-                "images": json.loads(product.images) if product.images else [],
-                "description": product.description,
-                "features": json.loads(product.features) if product.features else [],
-                "specs": json.loads(product.specs) if product.specs else {},
-                "inStock": product.in_stock,
-                "stockQuantity": product.stock_quantity,
-                "sku": product.sku,
-                "isFeatured": product.is_featured,
-                "movement": product.movement,
-                "caseMaterial": product.case_material,
-                "dialColor": product.dial_color,
-                "waterResistance": product.water_resistance,
-                "seo": {
-                    "title": product.seo_title,
-                    "description": product.seo_description,
-                    "keywords": product.seo_keywords
-                },
-                "social": {
-                    "fbTitle": product.fb_title,
-                    "fbDescription": product.fb_description
-                },
-                "url": f"/product/{product.id}",
-                "createdAt": product.created_at.isoformat() if product.created_at else None,
-                "updatedAt": product.updated_at.isoformat() if product.updated_at else None
-            }
-            for product in products
-        ]
+        "products": [feed_item(product) for product in products]
     }
 
     return feed_data
@@ -163,9 +176,10 @@ async def get_products(
     total = query.count()
     offset = (page - 1) * limit
     products = query.offset(offset).limit(limit).all()
+    assets = product_assets(db, products)
 
     return {
-        "data": [product.to_dict() for product in products],
+        "data": [product.to_dict(assets) for product in products],
         "pagination": {
             "page": page,
             "limit": limit,
@@ -226,11 +240,54 @@ async def get_product(product_id: str, db: Session = Depends(get_db)):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return product.to_dict()
+    return product.to_dict(product_assets(db, [product]))
+
+def parse_bulk_filename(filename):
+    """'SKU-Index.ext' -> (sku, index); ValueError if the name doesn't match"""
+    name_without_ext = os.path.basename(filename).rsplit('.', 1)[0]
+    # Разделяем по последнему дефису
+    if '-' not in name_without_ext:
+        raise ValueError("No separator found")
+
+    sku_part, index_part = name_without_ext.rsplit('-', 1)
+    sku = sku_part.strip()
+    img_index = int(index_part)
+    if not sku or img_index < 1:
+        raise ValueError("Empty SKU or index")
+    return sku, img_index
+
+
+def apply_product_image(product, img_index, image_url):
+    """1 -> главное фото, 2+ -> позиция в галерее"""
+    if img_index == 1:
+        # Главное изображение
+        product.image = image_url
+        return
+
+    # Галерея
+    gallery_idx = img_index - 2  # 2 -> 0, 3 -> 1 ...
+
+    current_images = []
+    if product.images:
+        try:
+            current_images = json.loads(product.images)
+        except:
+            current_images = []
+
+    # Если индекс выходит за пределы, просто добавляем (или расширяем массив)
+    if gallery_idx < len(current_images):
+        current_images[gallery_idx] = image_url
+    else:
+        # Если нужно вставить на 5-е место, а всего 1 фото, просто добавляем в конец
+        current_images.append(image_url)
+
+    product.images = json.dumps(current_images)
+
 
 # Admin endpoints
 @router.post("/api/admin/products/bulk-image")
 async def upload_product_bulk_image(
+        background_tasks: BackgroundTasks,
         file: UploadFile = File(...),
         db: Session = Depends(get_db),
         current_user=Depends(require_admin)
@@ -246,14 +303,7 @@ async def upload_product_bulk_image(
     # 1. Парсинг имени файла
     # Ожидаем формат: SKU-Index.ext
     try:
-        name_without_ext = filename.rsplit('.', 1)[0]
-        # Разделяем по последнему дефису
-        if '-' not in name_without_ext:
-            raise ValueError("No separator found")
-
-        sku_part, index_part = name_without_ext.rsplit('-', 1)
-        sku = sku_part.strip()
-        img_index = int(index_part)
+        sku, img_index = parse_bulk_filename(filename)
     except Exception:
         # Если формат неверный, возвращаем ошибку, но с кодом 400
         # Чтобы клиент понял, что файл пропущен
@@ -265,51 +315,154 @@ async def upload_product_bulk_image(
         raise HTTPException(status_code=404, detail=f"Товар с SKU '{sku}' не найден")
 
     # 3. Сохранение файла (Логика аналогична upload.py)
-    # Создаем папку uploads если нет
-    UPLOAD_DIR = "uploads"
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
-
-    # Генерируем уникальное имя, чтобы избежать кэширования при замене
-    import uuid
-    file_ext = filename.split('.')[-1]
-    save_filename = f"{sku}-{img_index}-{str(uuid.uuid4())[:8]}.{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, save_filename)
-
-    with open(file_path, "wb+") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Имя = хэш содержимого: новая картинка получает новый URL (без проблем с кэшем),
+    # повторный импорт той же картинки не создает дубликат
+    file_ext = '.' + filename.split('.')[-1]
+    stored = await save_upload(file, file_ext)  # 413, если файл больше лимита
 
-    image_url = f"/uploads/{save_filename}"
+    image_url = stored.url
 
     # 4. Обновление товара
     # Логика: 1 -> Главное фото, >1 -> Галерея
+    apply_product_image(product, img_index, image_url)
 
-    if img_index == 1:
-        # Главное изображение
-        product.image = image_url
-    else:
-        # Галерея
-        gallery_idx = img_index - 2  # 2 -> 0, 3 -> 1 ...
+    sync_refs(db, "product", product.id, product_urls(product))
+    refresh_structured_data(db, [product])
+    db.commit()
+    invalidate_pages(f"product/{product.id}", prefixes=("collection/",))
 
-        current_images = []
-        if product.images:
+    # WebP/AVIF варианты для srcset - в фоне, после ответа
+    background_tasks.add_task(process_upload, image_url)
+
+    return {"status": "success", "sku": sku, "index": img_index, "url": image_url}
+
+
+def _bulk_entries(files):
+    """
+    Blocking: flatten uploaded images and ZIP archives into (name, open) entries.
+    Returns (entries, errors) - errors for unreadable archives / unsupported files.
+    """
+    entries, errors = [], []
+    for upload in files:
+        name = upload.filename or ""
+        ext = os.path.splitext(name)[1].lower()
+        if ext == ".zip":
             try:
-                current_images = json.loads(product.images)
-            except:
-                current_images = []
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                errors.append({"file": name, "status": "error", "error": "Поврежденный ZIP архив"})
+                continue
+            for info in archive.infolist():
+                member_ext = os.path.splitext(info.filename)[1].lower()
+                if info.is_dir() or os.path.basename(info.filename).startswith(".") or "__MACOSX" in info.filename:
+                    continue
+                if member_ext not in BULK_IMAGE_EXTENSIONS:
+                    errors.append({"file": info.filename, "status": "error", "error": "Не изображение"})
+                    continue
+                entries.append((info.filename, member_ext, lambda archive=archive, info=info: archive.open(info)))
+        elif ext in BULK_IMAGE_EXTENSIONS:
+            entries.append((name, ext, lambda upload=upload: nullcontext(upload.file)))
+        else:
+            errors.append({"file": name, "status": "error", "error": "Не изображение и не ZIP"})
+    return entries, errors
+
+
+def _store_entry(ext, open_entry):
+    """Blocking: store one image (uploaded file or ZIP member) by content hash"""
+    with open_entry() as source:
+        if source.seekable():
+            source.seek(0)
+        return store_stream(source, ext)
+
 
-        # Если индекс выходит за пределы, просто добавляем (или расширяем массив)
-        if gallery_idx < len(current_images):
-            current_images[gallery_idx] = image_url
+@router.post("/api/admin/products/bulk-images")
+async def upload_product_bulk_images(
+        background_tasks: BackgroundTasks,
+        files: List[UploadFile] = File(...),
+        db: Session = Depends(get_db),
+        current_user=Depends(require_admin)
+):
+    """
+    Batch version of bulk-image: many "SKU-Index.ext" images and/or ZIP archives in one request.
+    SKUs are resolved with one IN query, files are stored in parallel, all product updates
+    are committed in a single transaction. Returns a report per file.
+    """
+    entries, report = await run_in_threadpool(_bulk_entries, files)
+    if len(entries) > BULK_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Слишком много файлов: {len(entries)} (максимум {BULK_MAX_FILES})")
+
+    # 1. Разбор имен заранее
+    parsed = []
+    for name, ext, open_entry in entries:
+        try:
+            sku, img_index = parse_bulk_filename(name)
+        except ValueError:
+            report.append({"file": name, "status": "error", "error": "Неверный формат имени файла, ожидается SKU-Номер.ext"})
+            continue
+        parsed.append((name, ext, open_entry, sku, img_index))
+
+    # 2. Все товары одним запросом (IN по пачкам, чтобы не упереться в лимит параметров SQLite)
+    skus = sorted({item[3] for item in parsed})
+    products_by_sku = {}
+    for i in range(0, len(skus), 500):
+        for product in db.query(Product).filter(Product.sku.in_(skus[i:i + 500])):
+            products_by_sku[product.sku] = product
+
+    matched = []
+    for item in parsed:
+        if item[3] in products_by_sku:
+            matched.append(item)
         else:
-            # Если нужно вставить на 5-е место, а всего 1 фото, просто добавляем в конец
-            current_images.append(image_url)
+            report.append({"file": item[0], "status": "error", "sku": item[3], "error": f"Товар с SKU '{item[3]}' не найден"})
 
-        product.images = json.dumps(current_images)
+    # 3. Параллельное сохранение (хэширование и запись - в потоках)
+    semaphore = asyncio.Semaphore(BULK_STORE_CONCURRENCY)
 
+    async def store(item):
+        async with semaphore:
+            try:
+                return await run_in_threadpool(_store_entry, item[1], item[2])
+            except UploadTooLarge as e:
+                return e.detail
+            except Exception as e:
+                return f"Ошибка сохранения: {e}"
+
+    results = await asyncio.gather(*(store(item) for item in matched))
+
+    # 4. Все обновления товаров - одна транзакция; порядок SKU-Номер детерминирован
+    stored_items = []
+    for item, result in zip(matched, results):
+        name, _, _, sku, img_index = item
+        if isinstance(result, str):
+            report.append({"file": name, "status": "error", "sku": sku, "index": img_index, "error": result})
+        else:
+            stored_items.append((sku, img_index, name, result))
+    stored_items.sort(key=lambda x: (x[0], x[1]))
+
+    touched = {}
+    for sku, img_index, name, stored in stored_items:
+        product = products_by_sku[sku]
+        apply_product_image(product, img_index, stored.url)
+        touched[product.id] = product
+        report.append({"file": name, "status": "success", "sku": sku, "index": img_index, "url": stored.url})
+    for product in touched.values():
+        sync_refs(db, "product", product.id, product_urls(product))
+    refresh_structured_data(db, list(touched.values()))
     db.commit()
+    invalidate_pages(*(f"product/{product_id}" for product_id in touched), prefixes=("collection/",))
+
+    # WebP/AVIF варианты - в фоне, параллельно в пуле процессов
+    background_tasks.add_task(process_uploads, sorted({stored.url for *_, stored in stored_items}))
+
+    succeeded = sum(1 for r in report if r["status"] == "success")
+    return {
+        "total": len(report),
+        "succeeded": succeeded,
+        "failed": len(report) - succeeded,
+        "products": len(touched),
+        "results": report,
+    }
 
-    return {"status": "success", "sku": sku, "index": img_index, "url": image_url}
 
 @router.get("/api/admin/products")
 async def get_all_products_admin(
@@ -346,7 +499,8 @@ async def get_all_products_admin(
     offset = (page - 1) * limit
     products = query.offset(offset).limit(limit).all()
 
-    data = [product.to_dict() for product in products]
+    assets = product_assets(db, products)
+    data = [product.to_dict(assets) for product in products]
 
     return {
         "data": data,
@@ -370,7 +524,7 @@ async def get_product_admin(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return product.to_dict()
+    return product.to_dict(product_assets(db, [product]))
 
 @router.post("/api/admin/products")
 async def create_product(
@@ -421,9 +575,12 @@ async def create_product(
     )
 
     db.add(db_product)
+    sync_refs(db, "product", product_id, product_urls(db_product))
+    refresh_structured_data(db, [db_product])
     db.commit()
+    invalidate_pages(f"product/{product_id}", prefixes=("collection/",))
     db.refresh(db_product)
-    return db_product.to_dict()
+    return db_product.to_dict(product_assets(db, [db_product]))
 
 @router.put("/api/admin/products/{product_id}")
 async def update_product(
@@ -461,9 +618,12 @@ async def update_product(
         else:
             setattr(db_product, key, value)
 
+    sync_refs(db, "product", db_product.id, product_urls(db_product))
+    refresh_structured_data(db, [db_product])
     db.commit()
+    invalidate_pages(f"product/{product_id}", prefixes=("collection/",))
     db.refresh(db_product)
-    return db_product.to_dict()
+    return db_product.to_dict(product_assets(db, [db_product]))
 
 @router.delete("/api/admin/products/{product_id}")
 async def delete_product(
@@ -478,6 +638,8 @@ async def delete_product(
         raise HTTPException(status_code=404, detail="Product not found")
 
     db.delete(db_product)
+    sync_refs(db, "product", product_id, [])
     db.commit()
+    invalidate_pages(f"product/{product_id}", prefixes=("collection/",))
 
     return {"message": "Product deleted", "id": product_id}
\ No newline at end of file
@@ -11,6 +11,9 @@ import json
 from datetime import datetime
 
 from database import get_db, Product
+from storage import sync_refs, product_urls
+from page_cache import invalidate_pages
+from structured_data import refresh_structured_data
 from auth import require_admin
 
 router = APIRouter()
@@ -27,6 +30,112 @@ SPEC_FIELDS = [
     "Вес"
 ]
 
+def write_product_row(ws, row_num: int, product: Product):
+    """Записывает один товар в строку листа Excel"""
+    try:
+        specs = json.loads(product.specs) if product.specs else {}
+    except:
+        specs = {}
+
+    # 1. Основные поля
+    ws.cell(row=row_num, column=1).value = product.id
+    ws.cell(row=row_num, column=2).value = product.name
+    ws.cell(row=row_num, column=3).value = product.collection
+    ws.cell(row=row_num, column=4).value = product.price
+    ws.cell(row=row_num, column=5).value = product.image
+    ws.cell(row=row_num, column=6).value = product.images
+    ws.cell(row=row_num, column=7).value = product.description
+    ws.cell(row=row_num, column=8).value = product.features
+    ws.cell(row=row_num, column=9).value = product.in_stock
+    ws.cell(row=row_num, column=10).value = product.stock_quantity
+    ws.cell(row=row_num, column=11).value = product.sku
+    ws.cell(row=row_num, column=12).value = product.is_featured
+
+    # 2. Поля фильтров (из колонок БД)
+    ws.cell(row=row_num, column=13).value = product.brand
+    ws.cell(row=row_num, column=14).value = product.gender
+    ws.cell(row=row_num, column=15).value = product.case_diameter
+    ws.cell(row=row_num, column=16).value = product.strap_material
+    ws.cell(row=row_num, column=17).value = product.movement
+    ws.cell(row=row_num, column=18).value = product.case_material
+    ws.cell(row=row_num, column=19).value = product.dial_color
+    ws.cell(row=row_num, column=20).value = product.water_resistance
+
+    # 3. SEO
+    ws.cell(row=row_num, column=21).value = product.seo_title
+    ws.cell(row=row_num, column=22).value = product.seo_description
+    ws.cell(row=row_num, column=23).value = product.seo_keywords
+    ws.cell(row=row_num, column=24).value = product.fb_title
+    ws.cell(row=row_num, column=25).value = product.fb_description
+    ws.cell(row=row_num, column=26).value = product.created_at.isoformat() if product.created_at else ""
+    ws.cell(row=row_num, column=27).value = product.updated_at.isoformat() if product.updated_at else ""
+
+    # 4. Спецификации (из JSON)
+    # Начинаем с 28-й колонки
+    for col_offset, spec_field in enumerate(SPEC_FIELDS):
+        col_num = 28 + col_offset
+        ws.cell(row=row_num, column=col_num).value = specs.get(spec_field, "")
+
+
+def parse_product_row(row_data: dict) -> dict:
+    """Преобразует строку Excel (dict заголовок -> значение) в поля модели Product"""
+    # Build specs dict (только из оставшихся в SPEC_FIELDS)
+    specs = {}
+    for spec_field in SPEC_FIELDS:
+        if spec_field in row_data and row_data[spec_field]:
+            specs[spec_field] = str(row_data[spec_field])
+
+    # Features parsing
+    features_raw = row_data.get("features")
+    features_list = []
+    if features_raw:
+        try:
+            features_list = json.loads(features_raw)
+            if not isinstance(features_list, list): features_list = [str(features_list)]
+        except:
+            features_list = [f.strip() for f in str(features_raw).split(',') if f.strip()]
+
+    # Case Diameter Parsing
+    case_diameter = None
+    if row_data.get("case_diameter"):
+        try:
+            case_diameter = float(row_data.get("case_diameter"))
+        except:
+            pass
+
+    return {
+        "name": row_data["name"],
+        "collection": row_data["collection"],
+        "price": float(row_data["price"]) if row_data.get("price") else 0,
+        "image": row_data.get("image"),
+        "images": row_data.get("images"),
+        "description": row_data.get("description"),
+        "features": json.dumps(features_list, ensure_ascii=False),
+        "specs": json.dumps(specs, ensure_ascii=False),
+        "in_stock": bool(row_data.get("in_stock", True)),
+        "stock_quantity": int(row_data.get("stock_quantity", 0)) if row_data.get("stock_quantity") else 0,
+        "sku": row_data.get("sku"),
+        "is_featured": bool(row_data.get("is_featured", False)),
+
+        # Основные фильтры
+        "brand": row_data.get("brand", "Orient"),
+        "gender": row_data.get("gender"),
+        "case_diameter": case_diameter,
+        "strap_material": row_data.get("strap_material"),
+        "movement": row_data.get("movement"),
+        "case_material": row_data.get("case_material"),
+        "dial_color": row_data.get("dial_color"),
+        "water_resistance": row_data.get("water_resistance"),
+
+        # SEO
+        "seo_title": row_data.get("seo_title"),
+        "seo_description": row_data.get("seo_description"),
+        "seo_keywords": row_data.get("seo_keywords"),
+        "fb_title": row_data.get("fb_title"),
+        "fb_description": row_data.get("fb_description"),
+    }
+
+
 @router.get("/api/admin/products/export")
 async def export_products(
     db: Session = Depends(get_db),
@@ -69,49 +178,7 @@ async def export_products(
 
     # Запись данных
     for row_num, product in enumerate(products, 2):
-        try:
-            specs = json.loads(product.specs) if product.specs else {}
-        except:
-            specs = {}
-
-        # 1. Основные поля
-        ws.cell(row=row_num, column=1).value = product.id
-        ws.cell(row=row_num, column=2).value = product.name
-        ws.cell(row=row_num, column=3).value = product.collection
-        ws.cell(row=row_num, column=4).value = product.price
-        ws.cell(row=row_num, column=5).value = product.image
-        ws.cell(row=row_num, column=6).value = product.images
-        ws.cell(row=row_num, column=7).value = product.description
-        ws.cell(row=row_num, column=8).value = product.features
-        ws.cell(row=row_num, column=9).value = product.in_stock
-        ws.cell(row=row_num, column=10).value = product.stock_quantity
-        ws.cell(row=row_num, column=11).value = product.sku
-        ws.cell(row=row_num, column=12).value = product.is_featured
-
-        # 2. Поля фильтров (из колонок БД)
-        ws.cell(row=row_num, column=13).value = product.brand
-        ws.cell(row=row_num, column=14).value = product.gender
-        ws.cell(row=row_num, column=15).value = product.case_diameter
-        ws.cell(row=row_num, column=16).value = product.strap_material
-        ws.cell(row=row_num, column=17).value = product.movement
-        ws.cell(row=row_num, column=18).value = product.case_material
-        ws.cell(row=row_num, column=19).value = product.dial_color
-        ws.cell(row=row_num, column=20).value = product.water_resistance
-
-        # 3. SEO
-        ws.cell(row=row_num, column=21).value = product.seo_title
-        ws.cell(row=row_num, column=22).value = product.seo_description
-        ws.cell(row=row_num, column=23).value = product.seo_keywords
-        ws.cell(row=row_num, column=24).value = product.fb_title
-        ws.cell(row=row_num, column=25).value = product.fb_description
-        ws.cell(row=row_num, column=26).value = product.created_at.isoformat() if product.created_at else ""
-        ws.cell(row=row_num, column=27).value = product.updated_at.isoformat() if product.updated_at else ""
-
-        # 4. Спецификации (из JSON)
-        # Начинаем с 28-й колонки
-        for col_offset, spec_field in enumerate(SPEC_FIELDS):
-            col_num = 28 + col_offset
-            ws.cell(row=row_num, column=col_num).value = specs.get(spec_field, "")
+        write_product_row(ws, row_num, product)
 
     # Авто-ширина колонок
     for column in ws.columns:
@@ -162,6 +229,7 @@ async def import_products(
         created_count = 0
         updated_count = 0
         errors = []
+        written = []  # для JSON-LD одним проходом в конце
 
         for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), 2):
             try:
@@ -175,66 +243,14 @@ async def import_products(
                 if not existing_product and row_data.get("id"):
                     existing_product = db.query(Product).filter(Product.id == row_data["id"]).first()
 
-                # Build specs dict (только из оставшихся в SPEC_FIELDS)
-                specs = {}
-                for spec_field in SPEC_FIELDS:
-                    if spec_field in row_data and row_data[spec_field]:
-                        specs[spec_field] = str(row_data[spec_field])
-
-                # Features parsing
-                features_raw = row_data.get("features")
-                features_list = []
-                if features_raw:
-                    try:
-                        features_list = json.loads(features_raw)
-                        if not isinstance(features_list, list): features_list = [str(features_list)]
-                    except:
-                        features_list = [f.strip() for f in str(features_raw).split(',') if f.strip()]
-
-                # Case Diameter Parsing
-                case_diameter = None
-                if row_data.get("case_diameter"):
-                    try:
-                        case_diameter = float(row_data.get("case_diameter"))
-                    except:
-                        pass
-
-                product_data = {
-                    "name": row_data["name"],
-                    "collection": row_data["collection"],
-                    "price": float(row_data["price"]) if row_data.get("price") else 0,
-                    "image": row_data.get("image"),
-                    "images": row_data.get("images"),
-                    "description": row_data.get("description"),
-                    "features": json.dumps(features_list, ensure_ascii=False),
-                    "specs": json.dumps(specs, ensure_ascii=False),
-                    "in_stock": bool(row_data.get("in_stock", True)),
-                    "stock_quantity": int(row_data.get("stock_quantity", 0)) if row_data.get("stock_quantity") else 0,
-                    "sku": row_data.get("sku"),
-                    "is_featured": bool(row_data.get("is_featured", False)),
-
-                    # Основные фильтры
-                    "brand": row_data.get("brand", "Orient"),
-                    "gender": row_data.get("gender"),
-                    "case_diameter": case_diameter,
-                    "strap_material": row_data.get("strap_material"),
-                    "movement": row_data.get("movement"),
-                    "case_material": row_data.get("case_material"),
-                    "dial_color": row_data.get("dial_color"),
-                    "water_resistance": row_data.get("water_resistance"),
-
-                    # SEO
-                    "seo_title": row_data.get("seo_title"),
-                    "seo_description": row_data.get("seo_description"),
-                    "seo_keywords": row_data.get("seo_keywords"),
-                    "fb_title": row_data.get("fb_title"),
-                    "fb_description": row_data.get("fb_description"),
-                }
+                product_data = parse_product_row(row_data)
 
                 if existing_product:
                     for key, value in product_data.items():
                         if value is not None: setattr(existing_product, key, value)
                     existing_product.updated_at = datetime.utcnow()
+                    sync_refs(db, "product", existing_product.id, product_urls(existing_product))
+                    written.append(existing_product)
                     updated_count += 1
                 else:
                     product_id = row_data.get("id")
@@ -247,13 +263,17 @@ async def import_products(
 
                     new_product = Product(id=product_id, **product_data)
                     db.add(new_product)
+                    sync_refs(db, "product", product_id, product_urls(new_product))
+                    written.append(new_product)
                     created_count += 1
 
             except Exception as e:
                 errors.append(f"Row {row_num}: {str(e)}")
                 continue
 
+        refresh_structured_data(db, written)
         db.commit()
+        invalidate_pages()  # импорт затрагивает произвольные товары
         return {
             "success": True,
             "created": created_count,
@@ -10,6 +10,7 @@ from fastapi import Query
 from database import get_db, PromoCode
 from schemas import PromoCodeCreate, PromoCodeUpdate, PromoCodeResponse
 from auth import require_admin
+from pricing import PromoNotFound, promo_rule, invalidate_pricing
 
 router = APIRouter()
 
@@ -29,27 +30,18 @@ def get_promocodes(db: Session = Depends(get_db), current_user=Depends(require_a
 @router.get("/api/promocodes/validate")
 def validate_promocode(code: str = Query(...), db: Session = Depends(get_db)):
     """Check if promo code is valid and return its details"""
-    promo = db.query(PromoCode).filter(PromoCode.code == code).first()
-
-    if not promo:
-        raise HTTPException(status_code=404, detail="Промокод не найден")
-
-    if not promo.active:
-        raise HTTPException(status_code=400, detail="Промокод неактивен")
-
-    now = datetime.utcnow()
-    if promo.valid_from and promo.valid_from > now:
-        raise HTTPException(status_code=400, detail="Срок действия промокода еще не начался")
-
-    if promo.valid_until and promo.valid_until < now:
-        raise HTTPException(status_code=400, detail="Срок действия промокода истек")
+    # Проверка по кэшированному индексу промокодов (тот же, что при расчете корзины)
+    try:
+        rule = promo_rule(db, code)
+    except PromoNotFound as e:
+        raise HTTPException(status_code=404, detail=e.detail)
 
-    # Возвращаем данные, необходимые для расчета на клиенте
+    # Данные для отображения в корзине; итоговую сумму считает /api/cart/price
     return {
-        "code": promo.code,
-        "discount_percent": promo.discount_percent,
-        "applicable_products": json.loads(promo.applicable_products) if promo.applicable_products else [],
-        "applicable_collections": json.loads(promo.applicable_collections) if promo.applicable_collections else []
+        "code": rule.code,
+        "discount_percent": rule.percent,
+        "applicable_products": rule.listed[0],
+        "applicable_collections": rule.listed[1]
     }
 @router.get("/api/admin/promocodes/{id}", response_model=PromoCodeResponse)
 def get_promocode(id: int, db: Session = Depends(get_db), current_user=Depends(require_admin)):
@@ -80,6 +72,7 @@ def create_promocode(data: PromoCodeCreate, db: Session = Depends(get_db), curre
     db.add(new_promo)
     db.commit()
     db.refresh(new_promo)
+    invalidate_pricing()
 
     # Для ответа pydantic
     new_promo.applicable_products = data.applicable_products
@@ -103,6 +96,7 @@ def update_promocode(id: int, data: PromoCodeUpdate, db: Session = Depends(get_d
     promo.active = data.active
 
     db.commit()
+    invalidate_pricing()
     return {"message": "Updated successfully"}
 
 
@@ -113,6 +107,7 @@ def delete_promocode(id: int, db: Session = Depends(get_db), current_user=Depend
         raise HTTPException(status_code=404, detail="Not found")
     db.delete(promo)
     db.commit()
+    invalidate_pricing()
     return {"message": "Deleted successfully"}
 
 
@@ -220,6 +215,7 @@ async def import_promocodes(file: UploadFile = File(...), db: Session = Depends(
             count += 1
 
         db.commit()
+        invalidate_pricing()
         return {"message": f"Imported {count} codes successfully"}
 
     except Exception as e:
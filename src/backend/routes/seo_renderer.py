@@ -4,9 +4,14 @@ from fastapi import APIRouter, Request, Depends, Response
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from database import get_db, Product, Collection
+from image_pipeline import product_assets
+from page_cache import PAGE_CACHE
+from routes import collections as collection_routes, content as content_routes, settings as settings_routes
 import json
+import logging
 
 router = APIRouter()
+logger = logging.getLogger("orient.seo")
 
 # --- 1. SEO ДАННЫЕ (Статические страницы) ---
 STATIC_SEO = {
@@ -56,29 +61,111 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__fil
 if not os.path.exists(os.path.join(BASE_DIR, "dist")):
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
-DIST_DIR = os.path.join(BASE_DIR, "dist")
+DIST_DIR = os.getenv("DIST_DIR", os.path.join(BASE_DIR, "dist"))
 INDEX_PATH = os.path.join(DIST_DIR, "index.html")
 
+# Данные, которые нужны на каждой странице (шапка, настройки): endpoint -> обработчик
+SHARED_PAYLOAD = {
+    "/api/content/logo": content_routes.get_site_logo,
+    "/api/content/promo-banner": content_routes.get_promo_banner,
+    "/api/settings/currency": settings_routes.get_currency,
+    "/api/settings/site": settings_routes.get_site_info,
+    "/api/settings/social": settings_routes.get_social_links,
+    "/api/settings/shipping": settings_routes.get_shipping_info,
+}
+COLLECTION_PAGE_LIMIT = 50  # столько же товаров запрашивает CollectionDetail.tsx
 
-@router.get("/{full_path:path}")
-async def serve_spa(request: Request, full_path: str, db: Session = Depends(get_db)):
-    # 1. Если это файл (есть точка в конце, например .js, .png), отдаем 404 (пусть ищет Nginx)
-    if "." in full_path.split("/")[-1]:
-        return Response(status_code=404)
+_index_cache = {"mtime": None, "html": None}
+
+
+def load_index():
+    """index.html, re-read when the build changes (which also drops cached pages)"""
+    mtime = os.stat(INDEX_PATH).st_mtime_ns
+    if _index_cache["mtime"] != mtime:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            _index_cache["html"] = f.read()
+        _index_cache["mtime"] = mtime
+        PAGE_CACHE.clear()
+    return _index_cache["html"]
+
+
+async def hydration_payload(db: Session, clean_path: str, product=None, collection=None) -> dict:
+    """
+    Responses the SPA would request on first render, keyed by API endpoint
+    (publicApi.ts uses them instead of the network). Built by the API handlers themselves,
+    so the data is exactly what the API returns.
+    """
+    loaders = dict(SHARED_PAYLOAD)
+    if clean_path == "":
+        loaders["/api/content/hero"] = content_routes.get_hero_content
+
+    payload = {}
+    for endpoint, loader in loaders.items():
+        try:
+            payload[endpoint] = await loader(db=db)
+        except Exception:
+            logger.exception("Hydration data for %s failed", endpoint)
+
+    # Товар и коллекция уже загружены для мета-тегов
+    if product is not None:
+        payload[f"/api/products/{product.id}"] = product.to_dict(product_assets(db, [product]))
+    if collection is not None:
+        details = await collection_routes.get_collection(collection.id, db=db)
+        products = await collection_routes.get_collection_products(
+            collection.id, page=1, limit=COLLECTION_PAGE_LIMIT, db=db
+        )
+        # SPA запрашивает коллекцию по идентификатору из URL - это может быть и имя (/collection/sports)
+        for key in {collection.id, clean_path.split("/")[-1]}:
+            payload[f"/api/collections/{key}"] = details
+            payload[f"/api/collections/{key}/products?limit={COLLECTION_PAGE_LIMIT}"] = products
+    return payload
+
+
+def inject_hydration(html_content: str, payload: dict) -> str:
+    """Embeds the payload as <script type="application/json">, safe against </script> in the data"""
+    data = json.dumps(payload, ensure_ascii=False, default=str, separators=(",", ":"))
+    data = (data.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+            .replace("\u2028", "\\u2028").replace("\u2029", "\\u2029"))
+    script = f'<script id="__INITIAL_DATA__" type="application/json">{data}</script>'
+    return html_content.replace("</head>", f"{script}\n</head>", 1)
 
-    # 2. Читаем HTML
-    if not os.path.exists(INDEX_PATH):
-        return Response("Index file not found. Run npm run build", status_code=500)
 
-    with open(INDEX_PATH, "r", encoding="utf-8") as f:
-        html_content = f.read()
+def inject_seo_tags(html_content: str, final_title: str, final_desc: str, final_image: str, clean_path: str) -> str:
+    """Подставляет title, description и Open Graph теги в index.html"""
+    # Замена Title
+    html_content = re.sub(r"<title>.*?</title>", f"<title>{final_title}</title>", html_content, flags=re.DOTALL)
+
+    # Замена Description
+    meta_desc_tag = f'<meta name="description" content="{final_desc}" />'
+    if '<meta name="description"' in html_content:
+        html_content = re.sub(r'<meta name="description" content="[^"]*"\s*/?>', meta_desc_tag, html_content)
+    else:
+        # Если тега нет, добавляем перед закрывающим head
+        html_content = html_content.replace("</head>", f"{meta_desc_tag}\n</head>")
 
+    # Добавление Open Graph (для соцсетей и мессенджеров)
+    full_image_url = final_image if final_image.startswith("http") else f"https://orientwatch.uz{final_image}"
+
+    og_tags = f"""
+    <meta property="og:title" content="{final_title}" />
+    <meta property="og:description" content="{final_desc}" />
+    <meta property="og:image" content="{full_image_url}" />
+    <meta property="og:url" content="https://orientwatch.uz/{clean_path}" />
+    <meta property="og:type" content="website" />
+    """
+    return html_content.replace("</head>", f"{og_tags}\n</head>")
+
+
+async def render_page(db: Session, clean_path: str):
+    """
+    HTML for a site path ("product/<id>", "" = home) with meta tags and hydration data.
+    Returns (html, found): found is False for unknown products / collections / pages.
+    """
     # Дефолтные значения
     final_title = "Orient Watch Uzbekistan | Официальный дилер"
     final_desc = "Купить японские наручные часы Orient в Ташкенте. Официальный дилер, гарантия 2 года, бесплатная доставка."
     final_image = "/assets/og-image.jpg"
-
-    clean_path = full_path.strip("/")
+    product = collection = None
 
     # --- ЛОГИКА ПОДМЕНЫ ---
 
@@ -133,29 +220,38 @@ async def serve_spa(request: Request, full_path: str, db: Session = Depends(get_
             if collection.description:
                 final_desc = re.sub('<[^<]+?>', '', collection.description)[:160]
 
-    # --- ЗАМЕНА В HTML ---
+    html_content = inject_seo_tags(load_index(), final_title, final_desc, final_image, clean_path)
+    if product is not None and product.structured_data:
+        # JSON-LD собран заранее при сохранении товара (structured_data.py)
+        html_content = html_content.replace(
+            "</head>", f'<script type="application/ld+json">{product.structured_data}</script>\n</head>', 1
+        )
+    html_content = inject_hydration(html_content, await hydration_payload(db, clean_path, product, collection))
+    return html_content, clean_path in STATIC_SEO or product is not None or collection is not None
 
-    # Замена Title
-    html_content = re.sub(r"<title>.*?</title>", f"<title>{final_title}</title>", html_content, flags=re.DOTALL)
 
-    # Замена Description
-    meta_desc_tag = f'<meta name="description" content="{final_desc}" />'
-    if '<meta name="description"' in html_content:
-        html_content = re.sub(r'<meta name="description" content="[^"]*"\s*/?>', meta_desc_tag, html_content)
-    else:
-        # Если тега нет, добавляем перед закрывающим head
-        html_content = html_content.replace("</head>", f"{meta_desc_tag}\n</head>")
+@router.get("/{full_path:path}")
+async def serve_spa(request: Request, full_path: str, db: Session = Depends(get_db)):
+    # 1. Если это файл (есть точка в конце, например .js, .png), отдаем 404 (пусть ищет Nginx)
+    if "." in full_path.split("/")[-1]:
+        return Response(status_code=404)
 
-    # Добавление Open Graph (для соцсетей и мессенджеров)
-    full_image_url = final_image if final_image.startswith("http") else f"https://orientwatch.uz{final_image}"
+    # 2. Читаем HTML
+    if not os.path.exists(INDEX_PATH):
+        return Response("Index file not found. Run npm run build", status_code=500)
 
-    og_tags = f"""
-    <meta property="og:title" content="{final_title}" />
-    <meta property="og:description" content="{final_desc}" />
-    <meta property="og:image" content="{full_image_url}" />
-    <meta property="og:url" content="https://orientwatch.uz/{clean_path}" />
-    <meta property="og:type" content="website" />
-    """
-    html_content = html_content.replace("</head>", f"{og_tags}\n</head>")
+    clean_path = full_path.strip("/")
+    load_index()  # новый билд сбрасывает кэш страниц
+
+    # Готовая страница из кэша (сбрасывается при изменении товаров / контента)
+    cached = PAGE_CACHE.get(clean_path)
+    if cached is not None:
+        return HTMLResponse(content=cached, status_code=200)
+
+    html, found = await render_page(db, clean_path)
+
+    # Несуществующие пути не кэшируем, чтобы случайные URL не вытесняли реальные страницы
+    if found:
+        PAGE_CACHE.set(clean_path, html)
 
-    return HTMLResponse(content=html_content, status_code=200)
\ No newline at end of file
+    return HTMLResponse(content=html, status_code=200)
@@ -6,8 +6,11 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 import json
 
-from database import get_db, Settings
+from database import get_db, Settings, Product
 from auth import require_admin
+from page_cache import invalidate_pages
+from pricing import invalidate_pricing
+from structured_data import refresh_structured_data
 
 router = APIRouter()
 
@@ -131,6 +134,7 @@ async def update_settings(
     settings.express_shipping_cost = data.shipping.expressCost
 
     # Update currency
+    currency_changed = settings.currency_code != data.currency.code
     settings.currency_code = data.currency.code
     settings.currency_symbol = data.currency.symbol
 
@@ -144,7 +148,12 @@ async def update_settings(
 
     settings.telegram_bot_token = data.telegram.botToken
     settings.telegram_chat_ids = data.telegram.chatIds
+    if currency_changed:
+        db.flush()
+        refresh_structured_data(db, db.query(Product).all())  # priceCurrency в JSON-LD
     db.commit()
+    invalidate_pages()  # валюта и контакты встроены в каждую страницу
+    invalidate_pricing()  # стоимость доставки
 
     return {"message": "Settings updated successfully"}
 
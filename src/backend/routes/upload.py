@@ -1,21 +1,20 @@
 """
 File upload routes
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Request
 from auth import require_admin
-import os
-import uuid
+from image_pipeline import process_upload
+from storage import UPLOAD_URL_PREFIX, save_upload
 from pathlib import Path
 
 router = APIRouter()
 
-UPLOAD_DIR = "uploads"
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
 @router.post("/api/admin/upload")
 async def upload_file(
     request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user = Depends(require_admin)
 ):
@@ -28,33 +27,22 @@ async def upload_file(
             detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Read file
-    contents = await file.read()
-    
-    # Check file size
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Max size: {MAX_FILE_SIZE / 1024 / 1024}MB"
-        )
-    
-    # Generate unique filename
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    # Save file
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    # Save file (чанками в потоке, без чтения всего файла в память; 413 при превышении лимита).
+    # Имя файла - хэш содержимого, повторная загрузка той же картинки не создает копию
+    stored = await save_upload(file, file_ext)
     
     # Get base URL from request
     base_url = str(request.base_url).rstrip('/')
     
     # Return full URL
-    file_url = f"{base_url}/uploads/{unique_filename}"
+    file_url = f"{base_url}{stored.url}"
+
+    # WebP/AVIF варианты для srcset - в фоне, после ответа
+    background_tasks.add_task(process_upload, file_url)
     
     return {
         "url": file_url,
-        "filename": unique_filename,
-        "size": len(contents),
+        "filename": stored.url[len(UPLOAD_URL_PREFIX):],
+        "size": stored.size,
         "mimeType": file.content_type
     }
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+In-process periodic jobs: one asyncio task per job, the work itself runs in the threadpool.
+
+    stock_holds          - release expired stock holds, cancel the pending orders they belonged to
+    payme_expiry         - created Payme transactions past the 12 h timeout -> cancelled (reason 4)
+                           with their orders, unpaid Payme orders abandoned, held stock returned
+    idempotency_keys     - delete expired Idempotency-Key responses and abandoned claims
+    notification_outbox  - delete Telegram notifications sent more than TELEGRAM_SENT_RETENTION_DAYS ago
+
+Every uvicorn worker runs its own scheduler. The jobs are compare-and-set updates, so two workers
+sweeping at the same time never cancel or release anything twice. Runs, durations and swept rows
+are exported on /metrics (orient_job_*), per worker like the request metrics.
+
+Settings (env), 0 turns a job off:
+    STOCK_SWEEP_INTERVAL        - seconds between stock hold sweeps, default 60
+    PAYME_EXPIRY_INTERVAL       - seconds between Payme expiry sweeps, default 300
+    PAYME_EXPIRY_BATCH          - rows per transaction of the Payme sweep, default 500
+    IDEMPOTENCY_PURGE_INTERVAL  - seconds between Idempotency-Key purges, default 3600
+    OUTBOX_PURGE_INTERVAL       - seconds between purges of sent Telegram notifications, default 3600
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from idempotency import purge_expired
+from inventory import sweep_expired
+from monitoring import REGISTRY
+from routes.payme import abandon_unpaid_orders, expire_stale_transactions
+from telegram_bot import purge_sent
+
+logger = logging.getLogger("orient.scheduler")
+
+STOCK_SWEEP_INTERVAL = float(os.getenv("STOCK_SWEEP_INTERVAL", "60"))
+PAYME_EXPIRY_INTERVAL = float(os.getenv("PAYME_EXPIRY_INTERVAL", "300"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", "3600"))
+
+
+def sweep_payme():
+    db = SessionLocal()
+    try:
+        expired = expire_stale_transactions(db)
+        abandoned = abandon_unpaid_orders(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    swept = {
+        "transactions": expired["transactions"],
+        "orders": expired["orders"] + abandoned["orders"],
+        "reservations": expired["reservations"] + abandoned["reservations"],
+    }
+    if swept["transactions"] or swept["orders"]:
+        logger.info("Payme expiry: %d transactions timed out, %d unpaid orders cancelled, %d reservations released",
+                    swept["transactions"], swept["orders"], swept["reservations"])
+    return swept
+
+
+def purge_idempotency_keys():
+    db = SessionLocal()
+    try:
+        deleted = purge_expired(db)
+        db.commit()
+    finally:
+        db.close()
+    return {"keys": deleted}
+
+
+def purge_notification_outbox():
+    db = SessionLocal()
+    try:
+        deleted = purge_sent(db)
+        db.commit()
+    finally:
+        db.close()
+    return {"notifications": deleted}
+
+
+class Job:
+    __slots__ = ("name", "interval", "run")
+
+    def __init__(self, name, interval, run):
+        self.name = name
+        self.interval = interval
+        self.run = run  # синхронная функция -> {вид строк: сколько обработано}
+
+
+JOBS = [
+    Job("stock_holds", STOCK_SWEEP_INTERVAL, sweep_expired),
+    Job("payme_expiry", PAYME_EXPIRY_INTERVAL, sweep_payme),
+    Job("idempotency_keys", IDEMPOTENCY_PURGE_INTERVAL, purge_idempotency_keys),
+    Job("notification_outbox", OUTBOX_PURGE_INTERVAL, purge_notification_outbox),
+]
+
+
+class Scheduler:
+    """Runs JOBS on their intervals; one instance per process"""
+
+    def __init__(self, jobs=JOBS, registry=REGISTRY):
+        self.jobs = jobs
+        self.registry = registry
+        self.tasks = []
+
+    async def start(self):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs if job.interval > 0]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.tasks = []
+
+    async def run_job(self, job):
+        """One run in the threadpool, recorded in the metrics; returns the swept counts (None on failure)"""
+        started = time.perf_counter()
+        try:
+            swept = await run_in_threadpool(job.run)
+        except Exception:
+            logger.exception("Background job %s failed", job.name)
+            self.registry.observe_job(job.name, time.perf_counter() - started, False)
+            return None
+        self.registry.observe_job(job.name, time.perf_counter() - started, True, swept)
+        return swept
+
+    async def _loop(self, job):
+        # Случайный сдвиг первого запуска - воркеры не просыпаются одновременно
+        await asyncio.sleep(job.interval * random.uniform(0.5, 1.0))
+        while True:
+            await self.run_job(job)
+            await asyncio.sleep(job.interval)
+
+
+SCHEDULER = Scheduler()
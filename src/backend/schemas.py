@@ -1,7 +1,7 @@
 """
 Pydantic schemas for request/response validation
 """
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict
 from datetime import datetime
 # Auth schemas
@@ -150,8 +150,8 @@ class CollectionUpdate(BaseModel):
 # Order schemas
 class OrderItem(BaseModel):
     productId: str
-    quantity: int
-    price: float
+    quantity: int = Field(1, ge=1)
+    price: Optional[float] = None  # игнорируется: цену считает сервер (pricing.py)
 
 class CustomerData(BaseModel):
     fullName: str
@@ -170,12 +170,19 @@ class OrderCreate(BaseModel):
     deliveryMethod: str
     paymentMethod: str
     deliveryAddress: Optional[DeliveryAddress] = None
-    subtotal: float
-    shipping: float
-    total: float
+    # Суммы от клиента не используются - заказ пересчитывается на сервере
+    subtotal: Optional[float] = None
+    shipping: Optional[float] = None
+    total: Optional[float] = None
+    promoCode: Optional[str] = None
     notes: Optional[str] = None
     website_check: Optional[str] = None
 
+class CartPriceRequest(BaseModel):
+    items: List[OrderItem]
+    promoCode: Optional[str] = None
+    deliveryMethod: str = "standard"
+
 class OrderStatusUpdate(BaseModel):
     status: str
     note: Optional[str] = None
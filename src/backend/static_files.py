@@ -0,0 +1,253 @@
+"""
+Static file serving with cache headers.
+CachedStaticFiles is a drop-in StaticFiles for /uploads and /assets:
+    - hashed file names (content-addressed uploads, Vite build output) get
+      "Cache-Control: public, max-age=31536000, immutable", everything else a short max-age
+    - precompressed siblings (app.js.br, app.js.gz) are served when the client accepts them
+    - strong ETag + If-None-Match / If-Modified-Since -> 304
+    - single byte ranges (Range / If-Range) -> 206, unsatisfiable -> 416
+
+precompress_assets() writes the .gz / .br siblings; it runs from precompress_assets.py after
+`npm run build` or at startup with STATIC_PRECOMPRESS=1. Brotli needs the optional
+`brotli` package, gzip is always available.
+
+Settings (env):
+    STATIC_MAX_AGE     - max-age for files without a hash in the name, seconds, default 3600
+    STATIC_PRECOMPRESS - 1 = precompress dist/assets on startup, default 0
+"""
+import gzip
+import hashlib
+import os
+import re
+from email.utils import formatdate
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:  # optional: без него только gzip
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+# uploads/ab/cd/<sha256>.jpg, старые <uuid4>.jpg, варианты <sha256>-640w.webp
+UPLOAD_HASHED_NAME = re.compile(
+    r"^(?:[0-9a-f]{32,64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(-\d+w)?\.\w+$"
+)
+# Vite: index-4f3a9c1e.js, vendor-BvR2x_Kd.css
+VITE_HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8,}\.\w+$")
+
+# (encoding, suffix) в порядке предпочтения
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_EXTENSIONS = {".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml", ".wasm", ".ico"}
+MIN_COMPRESS_SIZE = 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def accepted_encodings(header):
+    """Content codings allowed by an Accept-Encoding header (q=0 excluded)"""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if name and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single 'bytes=' range, None = ignore header, False = unsatisfiable"""
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None  # несколько диапазонов или мусор - отдаем файл целиком
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def make_etag(stat_result):
+    return '"' + hashlib.md5(f"{stat_result.st_mtime_ns}-{stat_result.st_size}".encode()).hexdigest() + '"'
+
+
+def etag_matches(header, etag):
+    """If-None-Match comparison (weak, as RFC 9110 requires for it)"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class RangeFileResponse(FileResponse):
+    """206 Partial Content for bytes start..end of a file"""
+
+    def __init__(self, path, start, end, **kwargs):
+        self.start = start
+        self.end = end
+        super().__init__(path, status_code=206, **kwargs)
+
+    def set_stat_headers(self, stat_result):
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        self.headers["content-range"] = f"bytes {self.start}-{self.end}/{stat_result.st_size}"
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with immutable caching for hashed names, precompressed variants, ETag and Range"""
+
+    def __init__(self, *args, hashed_name=UPLOAD_HASHED_NAME, max_age=STATIC_MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hashed_name = hashed_name
+        self.max_age = max_age
+
+    def cache_control(self, full_path):
+        if self.hashed_name.search(os.path.basename(full_path)):
+            return IMMUTABLE_CACHE_CONTROL
+        return f"public, max-age={self.max_age}"
+
+    def precompressed(self, full_path, source_stat, request_headers):
+        """(path, stat, encoding) of the best precompressed sibling the client accepts, or None.
+        Siblings older than the file itself are stale (the asset was replaced) and skipped."""
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                stat_result = os.stat(f"{full_path}{suffix}")
+            except OSError:
+                continue
+            if stat_result.st_mtime < source_stat.st_mtime:
+                continue
+            return f"{full_path}{suffix}", stat_result, encoding
+        return None
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        method = scope["method"]
+        media_type = FileResponse(full_path).media_type
+        headers = {"cache-control": self.cache_control(full_path)}
+        path = full_path
+
+        # Range запросы обслуживаем только по несжатому файлу
+        range_header = request_headers.get("range") if status_code == 200 else None
+        variant = None
+        if os.path.splitext(full_path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            headers["vary"] = "Accept-Encoding"
+            if not range_header:
+                variant = self.precompressed(full_path, stat_result, request_headers)
+        if variant:
+            path, stat_result, encoding = variant
+            headers["content-encoding"] = encoding
+        else:
+            headers["accept-ranges"] = "bytes"
+
+        # У сжатого варианта свой stat, а значит и свой ETag
+        etag = make_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        headers["etag"] = etag
+        headers["last-modified"] = last_modified
+
+        if status_code == 200 and self.is_not_modified(Headers(headers=headers), request_headers):
+            return NotModifiedResponse(Headers(headers=headers))
+
+        if range_header and request_headers.get("if-range", etag) in (etag, last_modified):
+            byte_range = parse_range(range_header, stat_result.st_size)
+            if byte_range is False:
+                return Response(status_code=416, headers={"content-range": f"bytes */{stat_result.st_size}"})
+            if byte_range:
+                start, end = byte_range
+                return RangeFileResponse(
+                    path, start, end, headers=headers, media_type=media_type, stat_result=stat_result, method=method,
+                )
+
+        return FileResponse(
+            path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result, method=method,
+        )
+
+    def is_not_modified(self, response_headers, request_headers):
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            # If-Modified-Since игнорируется при наличии If-None-Match
+            return etag_matches(if_none_match, response_headers["etag"])
+        return super().is_not_modified(response_headers, request_headers)
+
+
+def write_compressed(path, data):
+    """Write .br (if available) and .gz siblings of path for data; returns the suffixes written.
+    A sibling that would not be noticeably smaller is removed instead, so it can't go stale."""
+    written = []
+    outputs = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        outputs.insert(0, (".br", lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in outputs:
+        compressed = compress()
+        if len(compressed) >= len(data) * 0.9:
+            if os.path.exists(f"{path}{suffix}"):
+                os.remove(f"{path}{suffix}")
+            continue  # не стоит того
+        tmp_path = f"{path}{suffix}.tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(compressed)
+        os.replace(tmp_path, f"{path}{suffix}")
+        written.append(suffix)
+    return written
+
+
+def precompress_assets(directory, force=False):
+    """
+    Blocking: write .br/.gz siblings for compressible files under directory.
+    Files whose siblings are newer than the source are skipped unless force.
+    Returns (files compressed, bytes before, bytes after best encoding).
+    """
+    compressed = before = after = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            stat_result = os.stat(path)
+            if stat_result.st_size < MIN_COMPRESS_SIZE:
+                continue
+            siblings = [f"{path}{suffix}" for _, suffix in ENCODINGS if suffix != ".br" or brotli is not None]
+            if not force and all(
+                os.path.exists(s) and os.stat(s).st_mtime >= stat_result.st_mtime for s in siblings
+            ):
+                continue
+            with open(path, "rb") as source:
+                data = source.read()
+            written = write_compressed(path, data)
+            if written:
+                compressed += 1
+                before += len(data)
+                after += min(os.path.getsize(f"{path}{suffix}") for suffix in written)
+    return compressed, before, after
@@ -0,0 +1,236 @@
+"""
+Upload storage.
+Uploads are copied to disk in chunks in a worker thread (hashing on the way) so the event loop
+never blocks on file IO, and oversized bodies are cut off by UploadLimitMiddleware while they
+are still being received instead of after the whole file is buffered.
+
+Files are content-addressed: uploads/ab/cd/<sha256>.<ext>. Uploading the same image twice
+stores it once. upload_refs records which product / content row uses which file;
+gc_uploads.py removes files nothing refers to.
+"""
+import hashlib
+import json
+import os
+import re
+import uuid
+from urllib.parse import urlparse
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from database import (
+    UploadRef, Product, Collection, Order, ContentHero, ContentBoutique, ContentHistoryEvent, ContentSiteLogo,
+)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_URL_PREFIX = "/uploads/"
+MAX_FILE_SIZE = int(os.getenv("MAX_UPLOAD_MB", "5")) * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # заголовки частей и boundary
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_UPLOAD_MB", "512")) * 1024 * 1024
+
+# Пути загрузки -> максимальный размер тела запроса
+UPLOAD_BODY_LIMITS = {
+    "/api/admin/upload": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    "/api/admin/products/bulk-image": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    "/api/admin/products/bulk-images": MAX_BATCH_SIZE,
+}
+
+
+class UploadTooLarge(HTTPException):
+    """413; an HTTPException so it also passes through FastAPI's form parsing untouched"""
+
+    def __init__(self, limit):
+        super().__init__(status_code=413, detail=f"File too large. Max size: {limit // 1024 // 1024}MB")
+        self.limit = limit
+
+
+_HASH_NAME_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class StoredFile:
+    __slots__ = ("path", "url", "size", "sha256", "created")
+
+    def __init__(self, path, url, size, sha256, created):
+        self.path = path
+        self.url = url  # "/uploads/ab/cd/<sha256>.jpg"
+        self.size = size
+        self.sha256 = sha256
+        self.created = created  # False - такой файл уже был
+
+
+def content_path(sha256, ext):
+    """Relative path of a content-addressed file: 'ab/cd/<sha256>.ext'"""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{ext.lower()}"
+
+
+def store_stream(source, ext, max_size=MAX_FILE_SIZE, directory=UPLOAD_DIR):
+    """
+    Blocking: chunked copy of a file-like object into content-addressed storage, hashing on the way.
+    The partial file is removed on any error; a duplicate of an existing file is dropped.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLarge(max_size)
+                digest.update(chunk)
+                out.write(chunk)
+
+        sha256 = digest.hexdigest()
+        relative = content_path(sha256, ext)
+        dest_path = os.path.join(directory, relative)
+        created = not os.path.exists(dest_path)
+        if created:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            os.replace(tmp_path, dest_path)
+        else:
+            os.remove(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return StoredFile(dest_path, UPLOAD_URL_PREFIX + relative, size, sha256, created)
+
+
+async def save_upload(upload, ext, max_size=MAX_FILE_SIZE):
+    """Store an UploadFile by content hash off the event loop; raises UploadTooLarge"""
+    await upload.seek(0)
+    return await run_in_threadpool(store_stream, upload.file, ext, max_size)
+
+
+def upload_path(url):
+    """'/uploads/...' path for URLs of our uploads (absolute or relative), else None"""
+    if not url or not isinstance(url, str):
+        return None
+    path = urlparse(url).path
+    return path if path.startswith(UPLOAD_URL_PREFIX) else None
+
+
+def sync_refs(db, owner_type, owner_id, urls):
+    """Replace the upload references of one row (call before db.commit(); urls=[] on delete)"""
+    owner_id = str(owner_id)
+    db.query(UploadRef).filter(UploadRef.owner_type == owner_type, UploadRef.owner_id == owner_id) \
+        .delete(synchronize_session=False)
+    for path in sorted({p for p in map(upload_path, urls) if p}):
+        name = os.path.splitext(os.path.basename(path))[0]
+        db.add(UploadRef(
+            path=path,
+            sha256=name if _HASH_NAME_RE.match(name) else None,
+            owner_type=owner_type,
+            owner_id=owner_id,
+        ))
+
+
+def _json_list(value):
+    try:
+        data = json.loads(value) if value else []
+    except (ValueError, TypeError):
+        return []
+    return data if isinstance(data, list) else []
+
+
+def product_urls(product):
+    return [product.image, *_json_list(product.images)]
+
+
+def boutique_urls(content):
+    return [content.hero_image, content.info_image] + [
+        item.get("url") for item in _json_list(content.gallery) if isinstance(item, dict)
+    ]
+
+
+def collect_references(db):
+    """(owner_type, owner_id, url) for every image URL stored in the database"""
+    for product_id, image, images in db.query(Product.id, Product.image, Product.images):
+        for url in [image, *_json_list(images)]:
+            yield "product", product_id, url
+    for collection_id, image in db.query(Collection.id, Collection.image):
+        yield "collection", collection_id, image
+    for hero in db.query(ContentHero):
+        yield "hero", hero.id, hero.image
+        yield "hero", hero.id, hero.mobile_image
+    for boutique in db.query(ContentBoutique):
+        for url in boutique_urls(boutique):
+            yield "boutique", boutique.id, url
+    for event_id, image in db.query(ContentHistoryEvent.id, ContentHistoryEvent.image):
+        yield "history", event_id, image
+    for logo in db.query(ContentSiteLogo):
+        yield "logo", logo.id, logo.logo_url
+        yield "logo", logo.id, logo.logo_dark_url
+    # Картинки в старых заказах должны продолжать открываться
+    for order_number, items in db.query(Order.order_number, Order.items):
+        for item in _json_list(items):
+            if isinstance(item, dict):
+                yield "order", order_number, item.get("image")
+
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI middleware: answers 413 for upload requests whose body is larger than the limit -
+    right away when Content-Length says so, otherwise as soon as the received bytes cross it.
+    """
+
+    def __init__(self, app, limits=UPLOAD_BODY_LIMITS):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await self._reject(send, limit)
+                return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        # Внутри роутов исключение превращается в 413 обработчиком HTTPException,
+        # здесь ловим только случаи, когда тело читалось вне роутера
+        try:
+            await self.app(scope, limited_receive, send_wrapper)
+        except UploadTooLarge:
+            if response_started:
+                raise
+            await self._reject(send, limit)
+
+    async def _reject(self, send, limit):
+        body = json.dumps({"detail": UploadTooLarge(limit).detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,86 @@
+"""
+schema.org JSON-LD for product pages (Product + Offer + BreadcrumbList).
+Built when a product is written (create / update / import / bulk images) and stored in
+products.structured_data, ready to be spliced into the page by seo_renderer, so rendering
+a product page does no JSON construction.
+Rebuild everything with: python migrate_structured_data.py
+"""
+import json
+import os
+import re
+
+from database import Collection, Settings
+
+SITE_URL = os.getenv("SITE_URL", "https://orientwatch.uz")
+SELLER_NAME = "Orient Watch Uzbekistan"
+
+_TAG_RE = re.compile(r"<[^<]+?>")
+
+
+def absolute_url(url):
+    return url if url.startswith("http") else f"{SITE_URL}{url}"
+
+
+def script_safe_json(data):
+    """JSON that can be placed inside <script> as is"""
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return (text.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+            .replace("\u2028", "\\u2028").replace("\u2029", "\\u2029"))
+
+
+def product_structured_data(product, currency, collection_id=None):
+    """JSON-LD text for one product; collection_id links the breadcrumb to the collection page"""
+    url = f"{SITE_URL}/product/{product.id}"
+    images = []
+    for image in [product.image, *(json.loads(product.images) if product.images else [])]:
+        if image and absolute_url(image) not in images:
+            images.append(absolute_url(image))
+    description = product.seo_description or _TAG_RE.sub("", product.description or "").strip()
+
+    item = {
+        "@context": "https://schema.org",
+        "@type": "Product",
+        "name": product.name,
+        "sku": product.sku,
+        "url": url,
+        "brand": {"@type": "Brand", "name": product.brand or "Orient"},
+        "category": product.collection,
+        "offers": {
+            "@type": "Offer",
+            "url": url,
+            "price": f"{product.price:.2f}",
+            "priceCurrency": currency,
+            "availability": "https://schema.org/InStock" if product.in_stock else "https://schema.org/OutOfStock",
+            "itemCondition": "https://schema.org/NewCondition",
+            "seller": {"@type": "Organization", "name": SELLER_NAME},
+        },
+    }
+    if images:
+        item["image"] = images
+    if description:
+        item["description"] = description[:5000]
+
+    crumbs = [("Главная", f"{SITE_URL}/"), ("Каталог", f"{SITE_URL}/catalog")]
+    if collection_id:
+        crumbs.append((product.collection, f"{SITE_URL}/collection/{collection_id}"))
+    crumbs.append((product.name, url))
+    breadcrumbs = {
+        "@context": "https://schema.org",
+        "@type": "BreadcrumbList",
+        "itemListElement": [
+            {"@type": "ListItem", "position": position, "name": name, "item": item_url}
+            for position, (name, item_url) in enumerate(crumbs, 1)
+        ],
+    }
+    return script_safe_json([item, breadcrumbs])
+
+
+def refresh_structured_data(db, products):
+    """Rebuild products.structured_data for the given products (two queries in total; call before commit)"""
+    if not products:
+        return
+    currency = db.query(Settings.currency_code).filter(Settings.id == 1).scalar() or "UZS"
+    names = {product.collection for product in products}
+    collection_ids = dict(db.query(Collection.name, Collection.id).filter(Collection.name.in_(names)))
+    for product in products:
+        product.structured_data = product_structured_data(product, currency, collection_ids.get(product.collection))
@@ -1,142 +1,387 @@
-import httpx
-import json
+"""
+Telegram notifications through a durable outbox.
+
+notify_* build the message text and add one notification_outbox row per chat to the caller's
+session. They are called before db.commit(), so a notification is stored together with the
+order / booking or not at all; an error while preparing it fails the request like any other write.
+Sent rows are deleted after TELEGRAM_SENT_RETENTION_DAYS (purge_sent, scheduler.py job
+"notification_outbox"); failed rows stay for inspection.
+
+TelegramDispatcher (one per process, started in main.py) delivers the outbox with a single
+long-lived pooled httpx client:
+    - rows are claimed with a conditional UPDATE, so several uvicorn workers never send the same row
+    - per-chat pacing (Telegram allows about 1 message/s per chat) plus a global rate cap
+    - 429 retry_after is honoured; network errors, 5xx and 401 retry with exponential backoff,
+      other 4xx (chat not found, bot blocked) fail at once
+    - a burst for one chat (flash sale) is coalesced into digest messages
+
+Settings (env):
+    TELEGRAM_API_URL          - Bot API base URL, default https://api.telegram.org (stub: benchmarks/telegram_stub.py)
+    TELEGRAM_POLL_INTERVAL    - seconds between outbox polls when idle, default 1
+    TELEGRAM_CHAT_INTERVAL    - min seconds between messages to one chat, default 1.1
+    TELEGRAM_GLOBAL_RATE      - max messages per second in total, default 25
+    TELEGRAM_MAX_ATTEMPTS     - attempts before a message is marked failed, default 8
+    TELEGRAM_DIGEST_THRESHOLD - pending messages for one chat that are sent as a digest, default 3
+    TELEGRAM_SENT_RETENTION_DAYS - days sent messages are kept in the outbox, default 7
+"""
 import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
 from sqlalchemy.orm import Session
-from database import Settings, Product  #
+from starlette.concurrency import run_in_threadpool
 
+from database import SessionLocal, Settings, NotificationOutbox
 
-async def send_message(token: str, chat_id: str, text: str):
-    if not token or not chat_id:
-        return
+logger = logging.getLogger("orient.telegram")
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(url, json={
-                "chat_id": chat_id.strip(),
-                "text": text,
-                "parse_mode": "HTML"
-            })
-        except Exception as e:
-            print(f"Error sending telegram message: {e}")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+POLL_INTERVAL = float(os.getenv("TELEGRAM_POLL_INTERVAL", "1"))
+CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1.1"))
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+MAX_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "8"))
+DIGEST_THRESHOLD = int(os.getenv("TELEGRAM_DIGEST_THRESHOLD", "3"))
+SENT_RETENTION_DAYS = float(os.getenv("TELEGRAM_SENT_RETENTION_DAYS", "7"))
 
+BATCH_SIZE = 200
+LEASE_SECONDS = 120  # через столько "sending" строки упавшего воркера снова доступны
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 900.0
+MAX_WAIT_IN_BATCH = 5.0  # дольше ждать чат внутри пачки не будем - отложим строки
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n〰〰〰〰〰\n\n"
 
-async def broadcast_message(db: Session, message: str):
-    settings = db.query(Settings).filter(Settings.id == 1).first()
+
+# --- Outbox ---
+
+def enqueue(db: Session, kind: str, text: str):
+    """Add one outbox row per configured chat to the session; the caller commits"""
+    settings = db.query(Settings.telegram_bot_token, Settings.telegram_chat_ids).filter(Settings.id == 1).first()
     if not settings or not settings.telegram_bot_token or not settings.telegram_chat_ids:
         return
+    for chat_id in settings.telegram_chat_ids.split(","):
+        if chat_id.strip():
+            db.add(NotificationOutbox(kind=kind, chat_id=chat_id.strip(), text=text))
+
 
-    token = settings.telegram_bot_token
-    chat_ids = settings.telegram_chat_ids.split(",")
+def purge_sent(db: Session, now=None):
+    """Delete sent messages older than SENT_RETENTION_DAYS; returns the number of rows removed"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=SENT_RETENTION_DAYS)
+    # next_attempt_at отправленной строки - конец ее последней аренды, он позже sent_at:
+    # условие по нему идет диапазоном по ix_notification_outbox_status_next, sent_at - перепроверка
+    return db.query(NotificationOutbox).filter(
+        NotificationOutbox.status == "sent",
+        NotificationOutbox.next_attempt_at < cutoff,
+        NotificationOutbox.sent_at < cutoff,
+    ).delete(synchronize_session=False)
 
-    tasks = [send_message(token, chat_id, message) for chat_id in chat_ids if chat_id.strip()]
-    if tasks:
-        await asyncio.gather(*tasks)
+
+async def wake_dispatcher():
+    """Background task after commit: deliver right away instead of at the next poll"""
+    DISPATCHER.wake()
 
 
 # --- Уведомления о ЗАКАЗАХ ---
-async def notify_new_order(db: Session, order):
-    try:
-        customer = json.loads(order.customer_data) if order.customer_data else {}
-        name = customer.get("fullName", "Не указано")
-        phone = customer.get("phone", "Не указано")
-
-        # --- ЛОГИКА ПОЛУЧЕНИЯ СПИСКА ТОВАРОВ ---
-        items_text = ""
-        try:
-            items_data = json.loads(order.items) if order.items else []
-            if items_data:
-                # 1. Собираем ID всех товаров
-                product_ids = [item.get("productId") for item in items_data]
-
-                # 2. Запрашиваем товары из БД (нам нужны Name и SKU)
-                products = db.query(Product).filter(Product.id.in_(product_ids)).all()
-                product_map = {str(p.id): p for p in products}
-
-                lines = []
-                for item in items_data:
-                    p_id = str(item.get("productId"))
-                    qty = item.get("quantity", 1)
-
-                    product = product_map.get(p_id)
-                    if product:
-                        p_name = product.name
-                        # Добавляем SKU, если есть
-                        p_sku = f" (SKU: {product.sku})" if product.sku else ""
-                        lines.append(f"⌚ <b>{p_name}</b>{p_sku} x{qty}")
-                    else:
-                        lines.append(f"⌚ <b>Товар #{p_id}</b> x{qty}")
-
-                items_text = "\n".join(lines)
-        except Exception as e:
-            print(f"Error parsing order items for telegram: {e}")
-            items_text = "⚠️ Ошибка загрузки списка товаров"
-
-        # Ссылка на админку (предполагаем, что домен orientwatch.uz)
-        admin_link = "https://orientwatch.uz/admin/orders"
-
-        msg = (
-            f"🔔 <b>Новый заказ!</b>\n\n"
-            f"🆔 <b>Номер:</b> {order.order_number}\n"
-            f"👤 <b>Клиент:</b> {name}\n"
-            f"📞 <b>Телефон:</b> {phone}\n"
-            f"💰 <b>Сумма:</b> {order.total:,.0f} UZS\n"
-            f"🚚 <b>Доставка:</b> {order.delivery_method}\n"
-            f"💳 <b>Оплата:</b> {order.payment_method}\n\n"
-            f"🛍 <b>Состав заказа:</b>\n"
-            f"{items_text}\n\n"
-            f"🔗 <a href='{admin_link}'>Открыть заказ в админке</a>"
-        )
+def order_message(order) -> str:
+    customer = json.loads(order.customer_data) if order.customer_data else {}
+    name = customer.get("fullName", "Не указано")
+    phone = customer.get("phone", "Не указано")
 
-        if order.notes:
-            msg += f"\n💬 <b>Комментарий:</b> {order.notes}"
+    # Строки заказа уже содержат снимок товара (order_items) - без разбора JSON и запросов
+    lines = []
+    for item in order.order_items:
+        p_name = item.name or f"Товар #{item.product_id}"
+        # Добавляем SKU, если есть
+        p_sku = f" (SKU: {item.sku})" if item.sku else ""
+        lines.append(f"⌚ <b>{p_name}</b>{p_sku} x{item.quantity}")
+    items_text = "\n".join(lines)
 
-        await broadcast_message(db, msg)
-    except Exception as e:
-        print(f"Failed to prepare order notification: {e}")
+    # Ссылка на админку (предполагаем, что домен orientwatch.uz)
+    admin_link = "https://orientwatch.uz/admin/orders"
 
+    msg = (
+        f"🔔 <b>Новый заказ!</b>\n\n"
+        f"🆔 <b>Номер:</b> {order.order_number}\n"
+        f"👤 <b>Клиент:</b> {name}\n"
+        f"📞 <b>Телефон:</b> {phone}\n"
+        f"💰 <b>Сумма:</b> {order.total:,.0f} UZS\n"
+        f"🚚 <b>Доставка:</b> {order.delivery_method}\n"
+        f"💳 <b>Оплата:</b> {order.payment_method}\n\n"
+        f"🛍 <b>Состав заказа:</b>\n"
+        f"{items_text}\n\n"
+        f"🔗 <a href='{admin_link}'>Открыть заказ в админке</a>"
+    )
+
+    if order.notes:
+        msg += f"\n💬 <b>Комментарий:</b> {order.notes}"
+    return msg
 
-async def notify_order_status(db: Session, order_number: str, old_status: str, new_status: str):
-    try:
-        msg = (
-            f"🔄 <b>Статус заказа изменен</b>\n\n"
-            f"🆔 <b>Номер:</b> {order_number}\n"
-            f"▫️ <b>Было:</b> {old_status}\n"
-            f"▪️ <b>Стало:</b> {new_status}"
-        )
-        await broadcast_message(db, msg)
-    except Exception as e:
-        print(f"Failed to prepare status notification: {e}")
+
+def notify_new_order(db: Session, order):
+    enqueue(db, "order_new", order_message(order))
+
+
+def notify_order_status(db: Session, order_number: str, old_status: str, new_status: str):
+    msg = (
+        f"🔄 <b>Статус заказа изменен</b>\n\n"
+        f"🆔 <b>Номер:</b> {order_number}\n"
+        f"▫️ <b>Было:</b> {old_status}\n"
+        f"▪️ <b>Стало:</b> {new_status}"
+    )
+    enqueue(db, "order_status", msg)
 
 
 # --- Уведомления о БРОНИРОВАНИЯХ ---
-async def notify_new_booking(db: Session, booking):
-    try:
-        msg = (
-            f"📅 <b>Новая запись в бутик!</b>\n\n"
-            f"🆔 <b>Номер:</b> {booking.booking_number}\n"
-            f"👤 <b>Имя:</b> {booking.name}\n"
-            f"📞 <b>Телефон:</b> {booking.phone}\n"
-            f"🗓 <b>Дата:</b> {booking.date}\n"
-            f"⏰ <b>Время:</b> {booking.time}\n"
-            f"📍 <b>Бутик:</b> {booking.boutique}\n"
-        )
-        if booking.message:
-            msg += f"💬 <b>Комментарий:</b> {booking.message}"
+def notify_new_booking(db: Session, booking):
+    msg = (
+        f"📅 <b>Новая запись в бутик!</b>\n\n"
+        f"🆔 <b>Номер:</b> {booking.booking_number}\n"
+        f"👤 <b>Имя:</b> {booking.name}\n"
+        f"📞 <b>Телефон:</b> {booking.phone}\n"
+        f"🗓 <b>Дата:</b> {booking.date}\n"
+        f"⏰ <b>Время:</b> {booking.time}\n"
+        f"📍 <b>Бутик:</b> {booking.boutique}\n"
+    )
+    if booking.message:
+        msg += f"💬 <b>Комментарий:</b> {booking.message}"
+    enqueue(db, "booking_new", msg)
+
+
+def notify_booking_status(db: Session, booking_number: str, old_status: str, new_status: str):
+    msg = (
+        f"🔄 <b>Статус записи изменен</b>\n\n"
+        f"🆔 <b>Номер:</b> {booking_number}\n"
+        f"▫️ <b>Было:</b> {old_status}\n"
+        f"▪️ <b>Стало:</b> {new_status}"
+    )
+    enqueue(db, "booking_status", msg)
 
-        await broadcast_message(db, msg)
-    except Exception as e:
-        print(f"Failed to prepare booking notification: {e}")
 
+# --- Доставка ---
 
-async def notify_booking_status(db: Session, booking_number: str, old_status: str, new_status: str):
-    try:
-        msg = (
-            f"🔄 <b>Статус записи изменен</b>\n\n"
-            f"🆔 <b>Номер:</b> {booking_number}\n"
-            f"▫️ <b>Было:</b> {old_status}\n"
-            f"▪️ <b>Стало:</b> {new_status}"
+def compose(texts):
+    """
+    Messages to send for one chat: [(text, indexes of the source texts)].
+    Fewer than DIGEST_THRESHOLD texts go one by one, a burst becomes digests of up to 4096 chars.
+    """
+    if len(texts) < DIGEST_THRESHOLD:
+        return [(text, [i]) for i, text in enumerate(texts)]
+
+    messages, current, length = [], [], 0
+    for i, text in enumerate(texts):
+        text = text[:MAX_MESSAGE_LENGTH - 100]
+        if current and length + len(DIGEST_SEPARATOR) + len(text) > MAX_MESSAGE_LENGTH - 100:
+            messages.append(current)
+            current, length = [], 0
+        current.append(i)
+        length += len(text) + (len(DIGEST_SEPARATOR) if length else 0)
+    messages.append(current)
+    return [
+        (f"📦 <b>Сводка: {len(indexes)} уведомл.</b>\n\n" + DIGEST_SEPARATOR.join(texts[i][:MAX_MESSAGE_LENGTH - 100] for i in indexes),
+         indexes)
+        for indexes in messages
+    ]
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class TelegramDispatcher:
+    """Delivers notification_outbox rows; one instance per process"""
+
+    def __init__(self, api_url=TELEGRAM_API_URL, session_factory=SessionLocal):
+        self.api_url = api_url
+        self.session_factory = session_factory
+        self.client = None
+        self.task = None
+        self.wakeup = None
+        self.chat_ready_at = {}  # chat_id -> time.monotonic(), когда можно следующее сообщение
+        self.global_ready_at = 0.0
+        self.stats = {"sent": 0, "digests": 0, "retried": 0, "failed": 0}
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10, keepalive_expiry=60),
         )
-        await broadcast_message(db, msg)
-    except Exception as e:
-        print(f"Failed to prepare booking status notification: {e}")
\ No newline at end of file
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def wake(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.dispatch_once()
+            except Exception:
+                logger.exception("Telegram dispatcher iteration failed")
+                delivered = 0
+            if delivered:
+                continue  # возможно, ждут еще
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def dispatch_once(self):
+        """Claim due rows, deliver them, record the outcome; returns the number of rows handled"""
+        token, claim, rows = await run_in_threadpool(self._claim)
+        if not rows:
+            return 0
+        by_chat = {}
+        for row in rows:
+            by_chat.setdefault(row.chat_id, []).append(row)
+        results = await asyncio.gather(*(self._deliver_chat(token, chat_id, chat_rows)
+                                         for chat_id, chat_rows in by_chat.items()))
+        await run_in_threadpool(self._record, claim, [outcome for chat in results for outcome in chat])
+        return len(rows)
+
+    def _claim(self):
+        db = self.session_factory()
+        try:
+            token = db.query(Settings.telegram_bot_token).filter(Settings.id == 1).scalar()
+            if not token:
+                return None, None, []  # бот не настроен - сообщения ждут
+            now = datetime.utcnow()
+            due = (
+                NotificationOutbox.status.in_(("pending", "sending")),
+                NotificationOutbox.next_attempt_at <= now,
+            )
+            ids = [row_id for (row_id,) in db.query(NotificationOutbox.id).filter(*due)
+                   .order_by(NotificationOutbox.status, NotificationOutbox.next_attempt_at).limit(BATCH_SIZE)]
+            if not ids:
+                return token, None, []
+            # Compare-and-set: строку, которую успел забрать другой воркер, условие уже не пропустит
+            claim = uuid.uuid4().hex
+            db.query(NotificationOutbox).filter(NotificationOutbox.id.in_(ids), *due).update({
+                NotificationOutbox.status: "sending",
+                NotificationOutbox.claim_token: claim,
+                NotificationOutbox.next_attempt_at: now + timedelta(seconds=LEASE_SECONDS),
+            }, synchronize_session=False)
+            db.commit()
+            rows = db.query(NotificationOutbox.id, NotificationOutbox.chat_id, NotificationOutbox.text,
+                            NotificationOutbox.attempts) \
+                .filter(NotificationOutbox.claim_token == claim).order_by(NotificationOutbox.id).all()
+            return token, claim, rows
+        finally:
+            db.close()
+
+    async def _deliver_chat(self, token, chat_id, rows):
+        """[(row, outcome)] where outcome is ("sent",), ("failed", error) or ("retry", error, delay, counted)"""
+        outcomes = []
+        messages = compose([row.text for row in rows])
+        for position, (text, indexes) in enumerate(messages):
+            batch = [rows[i] for i in indexes]
+            wait = self.chat_ready_at.get(chat_id, 0.0) - time.monotonic()
+            if wait > MAX_WAIT_IN_BATCH:
+                # Чат ограничен (429) - откладываем остаток без траты попыток
+                rest = [rows[i] for _, later in messages[position:] for i in later]
+                outcomes += [(row, ("retry", "chat rate limited", wait, False)) for row in rest]
+                break
+            await self._pace(chat_id)
+            outcome = await self._send(token, chat_id, text)
+            if outcome[0] == "sent" and len(batch) > 1:
+                self.stats["digests"] += 1
+            outcomes += [(row, outcome) for row in batch]
+        return outcomes
+
+    async def _pace(self, chat_id):
+        # Слот резервируется до await, поэтому параллельные чаты не пересекаются
+        now = time.monotonic()
+        slot = max(now, self.chat_ready_at.get(chat_id, 0.0), self.global_ready_at)
+        self.global_ready_at = slot + 1.0 / GLOBAL_RATE
+        self.chat_ready_at[chat_id] = slot + CHAT_INTERVAL
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _send(self, token, chat_id, text):
+        try:
+            response = await self.client.post(
+                f"{self.api_url}/bot{token}/sendMessage",
+                json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"},
+            )
+        except httpx.HTTPError as e:
+            return ("retry", f"{type(e).__name__}: {e}", None, True)
+
+        if response.status_code == 200:
+            return ("sent",)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        error = f"{response.status_code}: {body.get('description') or response.text[:200]}"
+        if response.status_code == 429:
+            retry_after = float((body.get("parameters") or {}).get("retry_after", 1))
+            self.chat_ready_at[chat_id] = time.monotonic() + retry_after
+            return ("retry", error, retry_after, False)
+        if response.status_code >= 500 or response.status_code == 401:
+            return ("retry", error, None, True)
+        return ("failed", error)
+
+    def _record(self, claim, outcomes):
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            owned = NotificationOutbox.claim_token == claim  # аренда могла истечь и строку забрали
+            sent_ids = [row.id for row, outcome in outcomes if outcome[0] == "sent"]
+            if sent_ids:
+                db.query(NotificationOutbox).filter(NotificationOutbox.id.in_(sent_ids), owned).update({
+                    NotificationOutbox.status: "sent",
+                    NotificationOutbox.sent_at: now,
+                    NotificationOutbox.claim_token: None,
+                    NotificationOutbox.last_error: None,
+                }, synchronize_session=False)
+                self.stats["sent"] += len(sent_ids)
+
+            for row, outcome in outcomes:
+                if outcome[0] == "sent":
+                    continue
+                values = {NotificationOutbox.claim_token: None, NotificationOutbox.last_error: outcome[1]}
+                if outcome[0] == "retry":
+                    _, error, delay, counted = outcome
+                    attempts = row.attempts + (1 if counted else 0)
+                    values[NotificationOutbox.attempts] = attempts
+                    if attempts >= MAX_ATTEMPTS:
+                        values[NotificationOutbox.status] = "failed"
+                    else:
+                        values[NotificationOutbox.status] = "pending"
+                        values[NotificationOutbox.next_attempt_at] = now + timedelta(
+                            seconds=max(delay or 0.0, backoff(attempts) if counted else 0.0))
+                        self.stats["retried"] += 1
+                else:
+                    values[NotificationOutbox.status] = "failed"
+                    values[NotificationOutbox.attempts] = row.attempts + 1
+                if values[NotificationOutbox.status] == "failed":
+                    self.stats["failed"] += 1
+                    logger.error("Telegram notification %s to %s failed: %s", row.id, row.chat_id, outcome[1])
+                db.query(NotificationOutbox).filter(NotificationOutbox.id == row.id, owned) \
+                    .update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+DISPATCHER = TelegramDispatcher()
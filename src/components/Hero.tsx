@@ -1,6 +1,7 @@
 import React, { useState } from 'react'; // Убрали useEffect
 import { Link } from 'react-router-dom';
 import { ArrowRightIcon } from 'lucide-react';
+import { ImageVariants, placeholderStyle } from './ProductCard';
 
 // Экспортируем интерфейс, чтобы использовать его в Home.tsx
 export interface HeroContent {
@@ -14,6 +15,7 @@ export interface HeroContent {
   buttonBgColor?: string;
   buttonHoverTextColor?: string;
   buttonHoverBgColor?: string;
+  imageVariants?: Record<string, ImageVariants>;
 }
 
 // Принимаем данные через props
@@ -49,6 +51,9 @@ export function Hero({ content }: HeroProps) {
           <img
             src={content.image}
             alt="Hero Background"
+            width={content.imageVariants?.[content.image]?.width}
+            height={content.imageVariants?.[content.image]?.height}
+            style={placeholderStyle(content.imageVariants?.[content.image])}
             className="w-full h-full object-cover opacity-70"
           />
         </picture>
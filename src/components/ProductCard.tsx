@@ -2,6 +2,24 @@ import React from 'react';
 import { Link } from 'react-router-dom';
 import { ShoppingBagIcon } from 'lucide-react';
 import { useSettings } from '../contexts/SettingsContext';
+export interface ImageVariants {
+  width: number;
+  height: number;
+  color?: string;        // доминирующий цвет, фон до загрузки
+  placeholder?: string;  // крошечное размытое превью (data URI)
+  srcset: Record<string, string>;
+}
+
+// Фон <img> до загрузки: превью растягивается на весь блок, поверх рисуется сама картинка
+export function placeholderStyle(variants?: ImageVariants): React.CSSProperties | undefined {
+  if (!variants?.placeholder && !variants?.color) return undefined;
+  return {
+    backgroundColor: variants.color,
+    backgroundImage: variants.placeholder ? `url("${variants.placeholder}")` : undefined,
+    backgroundSize: 'cover',
+    backgroundPosition: 'center'
+  };
+}
 interface ProductCardProps {
   id: string;
   name: string;
@@ -10,6 +28,7 @@ interface ProductCardProps {
   image: string;
   index?: number;
   seoTitle?: string;
+  imageVariants?: Record<string, ImageVariants>;
 }
 export function ProductCard({
   id,
@@ -18,18 +37,24 @@ export function ProductCard({
   price,
   image,
   index = 0,
-  seoTitle
+  seoTitle,
+  imageVariants
 }: ProductCardProps) {
   const {
     formatPrice
   } = useSettings();
   const staggerClass = `animate-stagger-${Math.min(index % 4 + 1, 4)}`;
   const altText = `${seoTitle || name} - 1`;
+  const variants = imageVariants?.[image];
   return <div className={`group ${staggerClass}`}>
       <Link to={`/product/${id}`} className="block">
         {/* Image Container - NO grayscale on mobile */}
         <div className="relative aspect-[4/5] bg-white mb-4 sm:mb-6 overflow-hidden">
-          <img src={image} alt={altText} className="w-full h-full object-cover transition-all duration-1000 group-hover:scale-105" />
+          <picture className="block w-full h-full">
+            {variants?.srcset.avif && <source type="image/avif" srcSet={variants.srcset.avif} sizes="(min-width: 1024px) 25vw, 50vw" />}
+            {variants?.srcset.webp && <source type="image/webp" srcSet={variants.srcset.webp} sizes="(min-width: 1024px) 25vw, 50vw" />}
+            <img src={image} alt={altText} width={variants?.width} height={variants?.height} loading={index < 4 ? 'eager' : 'lazy'} style={placeholderStyle(variants)} className="w-full h-full object-cover transition-all duration-1000 group-hover:scale-105" />
+          </picture>
 
           {/* Gradient Overlay on hover - desktop only */}
           <div className="hidden lg:block absolute inset-0 bg-gradient-to-t from-black/60 via-transparent to-transparent opacity-0 group-hover:opacity-100 transition-all duration-700"></div>
@@ -7,6 +7,8 @@ interface BulkImageUploadModalProps {
   onComplete: () => void;
 }
 
+const BATCH_SIZE = 50;
+
 interface LogItem {
   filename: string;
   status: 'pending' | 'success' | 'error';
@@ -28,25 +30,38 @@ export function BulkImageUploadModal({ onClose, onComplete }: BulkImageUploadMod
 
     let successCount = 0;
 
-    // Обрабатываем файлы по одному (последовательно, чтобы не положить сервер)
-    for (let i = 0; i < files.length; i++) {
-      const file = files[i];
+    // Отправляем пачками: одна пачка = один запрос и одна транзакция на сервере
+    for (let i = 0; i < files.length; i += BATCH_SIZE) {
+      const batch = files.slice(i, i + BATCH_SIZE);
 
       try {
-        await api.uploadBulkImage(file);
-
-        // Обновляем статус в логе
-        setLogs(prev => prev.map(log =>
-          log.filename === file.name ? { ...log, status: 'success' } : log
-        ));
-        successCount++;
+        const report = await api.uploadBulkImages(batch);
+        const byName = new Map(report.results.map(r => [r.file, r]));
+
+        setLogs(prev => {
+          // Файлы из ZIP архивов появляются в отчете под своими именами - добавляем их в лог
+          const known = new Set(prev.map(log => log.filename));
+          const extra: LogItem[] = report.results
+            .filter(r => !known.has(r.file))
+            .map(r => ({ filename: r.file, status: r.status, message: r.error }));
+          const updated = prev.map(log => {
+            const result = byName.get(log.filename);
+            if (result) return { ...log, status: result.status, message: result.error };
+            if (log.status === 'pending' && batch.some(f => f.name === log.filename)) {
+              return { ...log, status: 'success' as const, message: 'Архив распакован' };
+            }
+            return log;
+          });
+          return [...updated, ...extra];
+        });
+        successCount += report.succeeded;
       } catch (error: any) {
         setLogs(prev => prev.map(log =>
-          log.filename === file.name ? { ...log, status: 'error', message: error.message } : log
+          batch.some(f => f.name === log.filename) ? { ...log, status: 'error', message: error.message } : log
         ));
       }
 
-      setProgress(prev => ({ ...prev, current: i + 1 }));
+      setProgress(prev => ({ ...prev, current: Math.min(i + BATCH_SIZE, files.length) }));
     }
 
     setProcessing(false);
@@ -57,7 +72,7 @@ export function BulkImageUploadModal({ onClose, onComplete }: BulkImageUploadMod
 
   const handleFiles = (files: FileList | null) => {
     if (!files) return;
-    const fileArray = Array.from(files).filter(f => f.type.startsWith('image/'));
+    const fileArray = Array.from(files).filter(f => f.type.startsWith('image/') || f.name.toLowerCase().endsWith('.zip'));
     setQueue(prev => [...prev, ...fileArray]);
     processQueue(fileArray);
   };
@@ -116,12 +131,12 @@ export function BulkImageUploadModal({ onClose, onComplete }: BulkImageUploadMod
                 multiple
                 className="absolute inset-0 w-full h-full opacity-0 cursor-pointer"
                 onChange={(e) => handleFiles(e.target.files)}
-                accept="image/*"
+                accept="image/*,.zip"
               />
               <div className="flex flex-col items-center pointer-events-none">
                 <UploadCloudIcon className={`w-12 h-12 mb-4 ${dragActive ? 'text-blue-500' : 'text-gray-400'}`} />
                 <p className="text-lg font-medium text-gray-700">Перетащите файлы сюда</p>
-                <p className="text-sm text-gray-400 mt-2">или нажмите для выбора (до 1000 шт)</p>
+                <p className="text-sm text-gray-400 mt-2">или нажмите для выбора (фото или ZIP архив)</p>
               </div>
             </div>
           )}
@@ -1,20 +1,23 @@
 import React, { useState, useEffect } from 'react';
 import { CalendarIcon, ClockIcon, MapPinIcon, PhoneIcon, MailIcon, ArrowRightIcon } from 'lucide-react';
-import { publicApi } from '../services/publicApi';
+import { publicApi, newIdempotencyKey, isRetryableError, ApiError } from '../services/publicApi';
 import { useSettings } from '../contexts/SettingsContext';
 import { SEO } from '../components/SEO';
 
-// Вспомогательная функция для бесконечного повтора запроса
-async function fetchWithInfiniteRetry<T>(
+// Вспомогательная функция для повтора запроса, пока сервер недоступен (сеть, 5xx);
+// 503 с Retry-After - дубликат записи, первый запрос еще выполняется. Ответ 4xx пробрасывается
+async function fetchWithRetry<T>(
   fn: () => Promise<T>,
   delay = 2000
 ): Promise<T> {
   try {
     return await fn();
   } catch (error) {
-    console.warn(`Ошибка запроса (Boutique), повтор через ${delay}мс...`, error);
-    await new Promise(resolve => setTimeout(resolve, delay));
-    return fetchWithInfiniteRetry(fn, delay);
+    if (!isRetryableError(error)) throw error;
+    const wait = Math.max(delay, ((error as ApiError).retryAfter ?? 0) * 1000);
+    console.warn(`Ошибка запроса (Boutique), повтор через ${wait}мс...`, error);
+    await new Promise(resolve => setTimeout(resolve, wait));
+    return fetchWithRetry(fn, delay);
   }
 }
 
@@ -40,8 +43,8 @@ export function Boutique() {
     let isMounted = true;
 
     const loadContent = async () => {
-      // Бесконечный ретрай загрузки контента страницы
-      const data = await fetchWithInfiniteRetry(() => publicApi.getBoutiqueContent());
+      // Ретрай загрузки контента страницы, пока сервер недоступен
+      const data = await fetchWithRetry(() => publicApi.getBoutiqueContent());
 
       if (isMounted) {
         setContent(data);
@@ -50,7 +53,10 @@ export function Boutique() {
       }
     };
 
-    loadContent();
+    loadContent().catch(error => {
+      console.error('Error loading boutique content:', error);
+      if (isMounted) setLoading(false);
+    });
 
     return () => { isMounted = false; };
   }, []);
@@ -74,15 +80,24 @@ export function Boutique() {
     }
     setSubmitting(true);
 
-    // Бесконечный ретрай отправки формы.
-    // Если сервер лежит, пользователь будет видеть "Отправка..." до победного.
-    const response = await fetchWithInfiniteRetry(() => publicApi.createBooking({
-      ...formData,
-      boutique: site.name
-    }));
+    // Ретрай отправки формы, пока сервер лежит: пользователь видит "Отправка..." до победного.
+    // Отказ сервера (4xx) не повторяется - показываем его
+    const idempotencyKey = newIdempotencyKey();
+    let response;
+    try {
+      response = await fetchWithRetry(() => publicApi.createBooking({
+        ...formData,
+        boutique: site.name
+      }, idempotencyKey));
+    } catch (error) {
+      console.error('Error creating booking:', error);
+      alert(`❌ ${(error as Error).message}`);
+      setSubmitting(false);
+      return;
+    }
 
     // Код ниже выполнится только после успешной отправки
-    alert(`✅ Спасибо! Ваша запись #${response.booking_number} принята.\n\nМы свяжемся с вами для подтверждения.`);
+    alert(`✅ Спасибо! Ваша запись #${response.bookingNumber} принята.\n\nМы свяжемся с вами для подтверждения.`);
 
     setFormData({
       name: '',
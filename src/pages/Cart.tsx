@@ -1,7 +1,7 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { MinusIcon, PlusIcon, TrashIcon, ArrowRightIcon, CheckCircleIcon, TruckIcon, CreditCardIcon, MapPinIcon, UserIcon, PackageIcon, TagIcon, XIcon } from 'lucide-react';
 import { Link, useNavigate } from 'react-router-dom';
-import { publicApi } from '../services/publicApi';
+import { publicApi, newIdempotencyKey, isRetryableError, ApiError } from '../services/publicApi';
 import { useCart } from '../contexts/CartContext';
 import { useSettings } from '../contexts/SettingsContext';
 import { PaymeButton } from '../components/PaymeButton';
@@ -23,6 +23,17 @@ interface FormData {
   website_check?: string;
 }
 
+// Ответ /api/cart/price - серверный расчет корзины
+interface CartPricing {
+  itemsTotal: number;
+  discount: number;
+  subtotal: number;
+  shipping: number;
+  total: number;
+  shippingOptions: Record<'standard' | 'express' | 'pickup', number>;
+  freeShippingThreshold: number;
+}
+
 // Интерфейс для промокода
 interface AppliedPromo {
   code: string;
@@ -30,16 +41,19 @@ interface AppliedPromo {
   applicable_products: string[];
   applicable_collections: string[];
 }
-async function fetchWithInfiniteRetry<T>(
+// Повторяет запрос, пока сервер недоступен (сеть, 5xx); ответ 4xx пробрасывается сразу
+async function fetchWithRetry<T>(
   fn: () => Promise<T>,
   delay = 2000
 ): Promise<T> {
   try {
     return await fn();
   } catch (error) {
-    console.warn(`Сервер занят, повтор через ${delay}мс...`, error);
-    await new Promise(resolve => setTimeout(resolve, delay));
-    return fetchWithInfiniteRetry(fn, delay);
+    if (!isRetryableError(error)) throw error;
+    const wait = Math.max(delay, ((error as ApiError).retryAfter ?? 0) * 1000);
+    console.warn(`Сервер занят, повтор через ${wait}мс...`, error);
+    await new Promise(resolve => setTimeout(resolve, wait));
+    return fetchWithRetry(fn, delay);
   }
 }
 export function Cart() {
@@ -51,6 +65,8 @@ export function Cart() {
   const [submitting, setSubmitting] = useState(false);
   const [orderNumber, setOrderNumber] = useState<string>('');
   const [finalTotal, setFinalTotal] = useState<number>(0);
+  // Отказ сервера при оформлении (нет товара на складе и т.п.) - показывается в корзине
+  const [checkoutError, setCheckoutError] = useState('');
 
   // --- Promo Code States ---
   const [promoInput, setPromoInput] = useState('');
@@ -72,6 +88,59 @@ export function Cart() {
   });
 
   const [errors, setErrors] = useState<Partial<Record<keyof FormData, string>>>({});
+  const [pricing, setPricing] = useState<CartPricing | null>(null);
+  // Сервер не может посчитать корзину (товар удален, промокод истек) - оформление заблокировано
+  const [pricingError, setPricingError] = useState('');
+  // Увеличивается после отказа при оформлении - корзина пересчитывается заново
+  const [pricingRevision, setPricingRevision] = useState(0);
+
+  // Корзину поправили - прежний отказ больше не актуален
+  useEffect(() => {
+    setCheckoutError('');
+  }, [cartItems]);
+
+  // Итоги считает сервер (актуальные цены, промокод, доставка из настроек);
+  // локальный расчет ниже - только пока ответ не пришел
+  useEffect(() => {
+    if (cartItems.length === 0) {
+      setPricing(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      publicApi.priceCart({
+        items: cartItems.map(item => ({ productId: item.id, quantity: item.quantity })),
+        promoCode: appliedPromo?.code,
+        deliveryMethod: formData.deliveryMethod
+      })
+        .then(data => {
+          if (cancelled) return;
+          setPricing(data);
+          setPricingError('');
+        })
+        .catch(async error => {
+          if (cancelled) return;
+          setPricing(null);
+          if (isRetryableError(error)) return; // сервер недоступен - пока локальный расчет
+          if (appliedPromo) {
+            // Промокод мог истечь или быть выключен после применения - снимаем его
+            const promoProblem = await publicApi.validatePromoCode(appliedPromo.code)
+              .then(() => null, (promoError: unknown) => isRetryableError(promoError) ? null : promoError);
+            if (cancelled) return;
+            if (promoProblem) {
+              setAppliedPromo(null);
+              setPromoError(`${(promoProblem as Error).message}. Примените промокод заново`);
+              return;
+            }
+          }
+          setPricingError(error.message);
+        });
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [cartItems, appliedPromo?.code, formData.deliveryMethod, pricingRevision]);
 
   // --- Logic Calculation ---
 
@@ -96,19 +165,25 @@ export function Cart() {
   };
 
   // Подсчет итогов
-  const subtotal = totalPrice;
+  const subtotal = pricing?.itemsTotal ?? totalPrice;
 
   // Сумма скидки
-  const discountAmount = cartItems.reduce((acc, item) => {
+  const discountAmount = pricing?.discount ?? cartItems.reduce((acc, item) => {
     return acc + (getItemDiscount(item) * item.quantity);
   }, 0);
 
   const subtotalAfterDiscount = subtotal - discountAmount;
 
   // Стоимость доставки (расчет от суммы ПОСЛЕ скидки)
-  const deliveryCost = formData.deliveryMethod === 'express' ? 1500 : formData.deliveryMethod === 'pickup' ? 0 : subtotalAfterDiscount > 50000 ? 0 : 500;
+  const freeShippingThreshold = pricing?.freeShippingThreshold ?? 50000;
+  const shippingOptions = pricing?.shippingOptions ?? {
+    standard: subtotalAfterDiscount > freeShippingThreshold ? 0 : 500,
+    express: 1500,
+    pickup: 0
+  };
+  const deliveryCost = shippingOptions[formData.deliveryMethod];
 
-  const total = subtotalAfterDiscount + deliveryCost;
+  const total = pricing?.total ?? subtotalAfterDiscount + deliveryCost;
 
   // --- Handlers ---
 
@@ -118,9 +193,9 @@ export function Cart() {
     setPromoError(''); // Сбрасываем старые ошибки
 
     try {
-      // Используем бесконечный ретрай для проверки промокода
-      // Если сервер упал, пользователь будет видеть лоадер "..." пока сервер не ответит
-      const promoData = await fetchWithInfiniteRetry(() =>
+      // Если сервер упал, пользователь будет видеть лоадер "..." пока сервер не ответит;
+      // неизвестный или истекший промокод (4xx) сразу показывается как ошибка
+      const promoData = await fetchWithRetry(() =>
         publicApi.validatePromoCode(promoInput)
       );
 
@@ -177,7 +252,7 @@ export function Cart() {
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
-    if (!validateForm()) return;
+    if (pricingError || !validateForm()) return;
 
     setSubmitting(true);
     const currentOrderTotal = total;
@@ -186,8 +261,7 @@ export function Cart() {
       const orderData = {
         items: cartItems.map(item => ({
           productId: item.id,
-          quantity: item.quantity,
-          price: item.price - getItemDiscount(item)
+          quantity: item.quantity
         })),
         customer: {
           fullName: formData.fullName,
@@ -205,19 +279,22 @@ export function Cart() {
         subtotal: subtotalAfterDiscount,
         shipping: deliveryCost,
         total: currentOrderTotal,
+        promoCode: appliedPromo?.code,
         notes: appliedPromo ? `Промокод: ${appliedPromo.code} (-${appliedPromo.discount_percent}%)` : ''
       };
 
-      // === ЗДЕСЬ ГЛАВНОЕ ИЗМЕНЕНИЕ ===
-      // Оборачиваем создание заказа в бесконечный ретрай.
-      // Если сервер вернет 500 или упадет сеть, мы будем пробовать снова и снова.
+      // Если сервер вернет 5xx или упадет сеть, мы будем пробовать снова и снова.
       // Кнопка будет неактивна и писать "Оформление..."
-      const response = await fetchWithInfiniteRetry(() =>
-        publicApi.createOrder(orderData)
+      // Один ключ на все повторы: если ответ потерялся, сервер вернет уже созданный заказ.
+      // Отказ (4xx, например 409 - товар закончился) не повторяется
+      const idempotencyKey = newIdempotencyKey();
+      const response = await fetchWithRetry(() =>
+        publicApi.createOrder(orderData, idempotencyKey)
       );
 
       setOrderNumber(response.orderNumber);
-      setFinalTotal(currentOrderTotal);
+      // Сумма к оплате - та, что сохранил сервер
+      setFinalTotal(response.total ?? currentOrderTotal);
       clearCart();
 
       if (formData.paymentMethod === 'payme') {
@@ -227,9 +304,16 @@ export function Cart() {
         navigate('/');
       }
     } catch (error) {
-      // Сюда мы практически никогда не попадем, так как fetchWithInfiniteRetry крутится вечно
       console.error('Error creating order:', error);
-      alert('❌ Критическая ошибка. Попробуйте обновить страницу.');
+      if (error instanceof ApiError) {
+        // Сервер отказал (нехватка товара перечислена в сообщении) - назад в корзину
+        setCheckoutError(error.message);
+        setPricingRevision(revision => revision + 1);
+        setCurrentStep('cart');
+        window.scrollTo({ top: 0, behavior: 'smooth' });
+      } else {
+        alert('❌ Критическая ошибка. Попробуйте обновить страницу.');
+      }
     } finally {
       setSubmitting(false);
     }
@@ -453,7 +537,7 @@ export function Cart() {
                     <span className="text-black/60">Доставка</span>
                     <span className="font-semibold">{deliveryCost === 0 ? 'Бесплатно' : formatPrice(deliveryCost)}</span>
                   </div>
-                  {deliveryCost > 0 && subtotalAfterDiscount < 50000 && <p className="text-xs text-black/50">Бесплатная доставка при заказе от {formatPrice(50000)}</p>}
+                  {formData.deliveryMethod === 'standard' && deliveryCost > 0 && subtotalAfterDiscount < freeShippingThreshold && <p className="text-xs text-black/50">Бесплатная доставка при заказе от {formatPrice(freeShippingThreshold)}</p>}
                 </div>
 
                 <div className="flex justify-between items-baseline">
@@ -461,7 +545,11 @@ export function Cart() {
                   <span className="text-2xl sm:text-3xl font-bold text-[#C8102E]">{formatPrice(total)}</span>
                 </div>
 
-                <button onClick={() => setCurrentStep('checkout')} className="w-full bg-[#C8102E] hover:bg-[#A00D24] text-white py-4 sm:py-5 text-sm tracking-[0.2em] font-semibold transition-all duration-500 uppercase">Оформить заказ</button>
+                {(pricingError || checkoutError) && (
+                  <p className="text-sm text-red-600 font-medium bg-red-50 border border-red-200 p-3">{pricingError || checkoutError}</p>
+                )}
+
+                <button onClick={() => setCurrentStep('checkout')} disabled={!!pricingError} className="w-full bg-[#C8102E] hover:bg-[#A00D24] text-white py-4 sm:py-5 text-sm tracking-[0.2em] font-semibold transition-all duration-500 uppercase disabled:opacity-50 disabled:cursor-not-allowed">Оформить заказ</button>
                 <Link to="/catalog" className="block text-center text-sm text-black/60 hover:text-[#C8102E] transition-colors tracking-wider">Продолжить покупки</Link>
               </div>
             </div>
@@ -507,7 +595,7 @@ export function Cart() {
                     <h2 className="text-2xl font-bold tracking-tight uppercase">Способ доставки</h2>
                   </div>
                   <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
-                    {[{ value: 'standard', label: 'Стандартная', time: '5-7 дней', cost: subtotalAfterDiscount > 50000 ? 0 : 500 }, { value: 'express', label: 'Экспресс', time: '1-2 дня', cost: 1500 }, { value: 'pickup', label: 'Самовывоз', time: 'Сегодня', cost: 0 }].map(method => (
+                    {[{ value: 'standard', label: 'Стандартная', time: '5-7 дней', cost: shippingOptions.standard }, { value: 'express', label: 'Экспресс', time: '1-2 дня', cost: shippingOptions.express }, { value: 'pickup', label: 'Самовывоз', time: 'Сегодня', cost: shippingOptions.pickup }].map(method => (
                       <button key={method.value} type="button" onClick={() => handleInputChange('deliveryMethod', method.value as any)} className={`p-6 border-2 text-left transition-all ${formData.deliveryMethod === method.value ? 'border-[#C8102E] bg-red-50' : 'border-black/20 hover:border-black/40'}`}>
                         <p className="font-semibold text-sm uppercase tracking-wider mb-2">{method.label}</p>
                         <p className="text-xs text-black/60 mb-3">{method.time}</p>
@@ -660,7 +748,8 @@ export function Cart() {
                         onChange={e => handleInputChange('website_check', e.target.value)}
                       />
                     </div>
-                    <button type="submit" disabled={submitting} className="w-full bg-[#C8102E] hover:bg-[#A00D24] text-white py-5 text-sm tracking-[0.2em] font-semibold transition-all duration-500 uppercase mb-4 disabled:opacity-50 disabled:cursor-not-allowed">
+                    {pricingError && <p className="text-sm text-red-600 font-medium mb-4">{pricingError}</p>}
+                    <button type="submit" disabled={submitting || !!pricingError} className="w-full bg-[#C8102E] hover:bg-[#A00D24] text-white py-5 text-sm tracking-[0.2em] font-semibold transition-all duration-500 uppercase mb-4 disabled:opacity-50 disabled:cursor-not-allowed">
                       {submitting ? 'Оформление...' : 'Оформить заказ'}
                     </button>
                     <button type="button" onClick={() => setCurrentStep('cart')} disabled={submitting} className="w-full border-2 border-black hover:bg-black hover:text-white py-4 text-sm tracking-[0.2em] font-semibold transition-all duration-500 uppercase disabled:opacity-50">
@@ -388,6 +388,30 @@ class ApiService {
     }
     return response.json();
   }
+
+  // Пакетная загрузка: много фото и/или ZIP архивов за один запрос, отчет по каждому файлу
+  async uploadBulkImages(files: File[]): Promise<{
+    total: number;
+    succeeded: number;
+    failed: number;
+    results: { file: string; status: 'success' | 'error'; sku?: string; index?: number; url?: string; error?: string }[];
+  }> {
+    const token = localStorage.getItem('adminToken');
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+
+    const response = await fetch(`${API_BASE_URL}/api/admin/products/bulk-images`, {
+      method: 'POST',
+      headers: { Authorization: `Bearer ${token}` },
+      body: formData
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ detail: response.statusText }));
+      throw new Error(error.detail || 'Upload failed');
+    }
+    return response.json();
+  }
 }
 
 export const api = new ApiService();
\ No newline at end of file
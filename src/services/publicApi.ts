@@ -1,7 +1,52 @@
 const API_BASE_URL = import.meta.env?.VITE_API_URL || 'http://localhost:8000';
 
+// Ответы API, встроенные сервером в HTML (seo_renderer): endpoint -> данные.
+// Используются один раз при первом рендере, дальше - обычные запросы
+function readInitialData(): Record<string, any> {
+  try {
+    const element = typeof document !== 'undefined' ? document.getElementById('__INITIAL_DATA__') : null;
+    return element?.textContent ? JSON.parse(element.textContent) : {};
+  } catch {
+    return {};
+  }
+}
+const initialData = readInitialData();
+
+// Ключ для заголовка Idempotency-Key
+export function newIdempotencyKey(): string {
+  if (typeof crypto !== 'undefined' && 'randomUUID' in crypto) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+// Ошибка ответа API: status - HTTP код (undefined - сеть / сервер недоступен)
+export class ApiError extends Error {
+  status?: number;
+  retryAfter?: number;
+
+  constructor(message: string, status?: number, retryAfter?: number) {
+    super(message);
+    this.name = 'ApiError';
+    this.status = status;
+    this.retryAfter = retryAfter;
+  }
+}
+
+// Повторять имеет смысл только сбой сети и ошибки сервера (5xx);
+// 4xx (нет товара, неверный промокод) на повторе ответят так же
+export function isRetryableError(error: unknown): boolean {
+  const status = error instanceof ApiError ? error.status : undefined;
+  return status === undefined || status >= 500;
+}
+
 class PublicApiService {
   private async request(endpoint: string, options: RequestInit = {}) {
+    if (!options.method && endpoint in initialData) {
+      const data = initialData[endpoint];
+      delete initialData[endpoint];
+      return data;
+    }
     const headers: HeadersInit = {
       'Content-Type': 'application/json',
       ...options.headers
@@ -15,7 +60,8 @@ class PublicApiService {
         const error = await response.json().catch(() => ({
           message: response.statusText
         }));
-        throw new Error(error.detail || error.message || 'API Error');
+        const retryAfter = Number(response.headers.get('Retry-After')) || undefined;
+        throw new ApiError(error.detail || error.message || 'API Error', response.status, retryAfter);
       }
       return response.json();
     } catch (error) {
@@ -107,18 +153,29 @@ class PublicApiService {
   }
 
   // Orders
-  createOrder(data: any) {
+  // idempotencyKey - один на попытку оформления: повторы с ним не создадут второй заказ
+  createOrder(data: any, idempotencyKey?: string) {
     return this.request('/api/orders', {
+      method: 'POST',
+      body: JSON.stringify(data),
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined
+    });
+  }
+
+  // Серверный расчет корзины: актуальные цены, скидка по промокоду, доставка
+  priceCart(data: { items: { productId: string; quantity: number }[]; promoCode?: string; deliveryMethod: string }) {
+    return this.request('/api/cart/price', {
       method: 'POST',
       body: JSON.stringify(data)
     });
   }
 
   // Bookings
-  createBooking(data: any) {
+  createBooking(data: any, idempotencyKey?: string) {
     return this.request('/api/bookings', {
       method: 'POST',
-      body: JSON.stringify(data)
+      body: JSON.stringify(data),
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined
     });
   }
 